@@ -9,6 +9,11 @@ from langchain_core.tools import tool
 from ..services.memory_service import MemoryService
 from ..services.gmail_service import GmailService
 from ..services.calendar_service import CalendarService
+from ..services.email_index import EmailIndexService
+from ..services.mail_queue import mail_queue
+from ..services.thread_summary import ThreadSummaryService
+from ..services.contact_service import contact_directory
+from ..services.scheduling import SchedulingService
 
 class AgentState(TypedDict):
     """State for the agent"""
@@ -34,8 +39,8 @@ Current Context:
 {memory_context}
 
 Guidelines:
-1. Always check the calendar for schedule-related questions.
-2. Search through emails for information about projects, people, or events.
+1. Always check the calendar for schedule-related questions. To find a time for a meeting, use 'find_free_slots' rather than working it out from the event list.
+2. Search through emails for information about projects, people, or events. When you don't know exact senders or subjects, use 'semantic_email_search' once instead of guessing several keyword queries.
 3. Use your memory to provide personalized responses based on user preferences. Pay special attention to 'AI personalization preference' in the memory context if provided (e.g., tone, length).
 4. If the user tells you something important (preferences, facts), use the 'save_memory' tool.
 5. MANDATORY EMAIL DRAFTING RULE:
@@ -44,6 +49,7 @@ Guidelines:
    - Then, provide a draft in your message text formatted clearly with 'To:', 'Subject:', and 'Body:'.
    - Only after the user says "Yes", "Send it", or "Go ahead", you can call 'draft_and_send_email'.
    - FAILURE TO SHOW A DRAFT FIRST IS A CRITICAL VIOLATION.
+   - When the user names a recipient without an email address, resolve it with 'lookup_contact' instead of searching emails.
 6. For Replies:
    - When the user asks to "Reply", use 'search_emails' to find the 'thread_id' of the original email.
    - Pass that 'thread_id' to 'draft_and_send_email' to ensure it's a proper reply and not a new email.
@@ -84,11 +90,43 @@ def search_emails(query: str = "in:inbox"):
     Default is 'in:inbox'. To see sent mail, use 'in:sent' or 'is:sent'."""
     pass
 
+@tool
+def read_email(message_id: str):
+    """Read the full body of one email. Search results only include a short snippet;
+    use this with a MessageID from search_emails when you need the complete text."""
+    pass
+
+@tool
+def summarize_thread(thread_id: str):
+    """Get a summary of a whole email thread (status, decisions, open items) by its ThreadID.
+    Prefer this over reading messages one by one when the user asks where things stand on a conversation.
+    Summaries are cached, so this is cheap to call again."""
+    pass
+
+@tool
+def semantic_email_search(query: str):
+    """Find emails by meaning rather than keywords, e.g. 'the thread where the vendor pushed back on pricing'.
+    Prefer this over guessing several search_emails queries when you don't know the exact sender or subject."""
+    pass
+
+@tool
+def lookup_contact(name: str):
+    """Find the email address of a person the user has corresponded with, by name, partial name or nickname.
+    Use this whenever the user refers to a recipient without giving an address. Results are ranked by how often they appear in the user's mail."""
+    pass
+
 @tool
 def get_calendar_events(days: int = 7):
     """Get the user's upcoming calendar events. Specify number of days ahead (default 7)."""
     pass
 
+@tool
+def find_free_slots(duration_minutes: int = 30, start_date: str = "", end_date: str = "", attendees: str = ""):
+    """Find free time slots for a meeting within the user's work hours, ranked best first.
+    start_date/end_date are YYYY-MM-DD (default: the next 7 days). attendees is an optional comma-separated
+    list of email addresses whose calendars should also be free."""
+    pass
+
 @tool
 def search_memory(query: str):
     """Search through long-term memory for relevant facts, preferences, and personal knowledge about the user."""
@@ -109,12 +147,12 @@ def draft_and_send_email(recipient: str, subject: str, body: str, thread_id: str
 def create_calendar_event(title: str, start_time: str, end_time: str, description: str = "", location: str = ""):
     """Create a new calendar event. 
     Times must be in ISO format (YYYY-MM-DDTHH:MM:SSZ). 
-    IMPORTANT: Always confirm free time first using get_calendar_events.
+    IMPORTANT: Always pick a time returned by find_free_slots first.
     """
     pass
 
 # Define the tools list for the LLM
-tools = [search_emails, get_calendar_events, search_memory, save_memory, draft_and_send_email, create_calendar_event]
+tools = [search_emails, read_email, summarize_thread, semantic_email_search, lookup_contact, get_calendar_events, find_free_slots, search_memory, save_memory, draft_and_send_email, create_calendar_event]
 llm_with_tools = get_llm().bind_tools(tools)
 
 # --- Nodes ---
@@ -151,10 +189,45 @@ async def execute_tools(state: AgentState):
                     result = f"No emails found matching query: {search_query}"
                 else:
                     result = f"EMAILS MATCHING '{search_query}':\n" + "\n".join([
-                        f"- From: {e['from']}\n  To: {e['to']}\n  Subject: {e['subject']}\n  Snippet: {e['preview']}\n  ThreadID: {e['thread_id']}" 
+                        f"- From: {e['from']}\n  To: {e['to']}\n  Subject: {e['subject']}\n  Snippet: {e['preview']}\n  MessageID: {e['id']}\n  ThreadID: {e['thread_id']}" 
                         for e in emails
                     ])
             
+            elif tool_name == "read_email":
+                email = await GmailService.get_message(state["user_id"], args.get("message_id", ""), state["db"])
+                result = (
+                    f"From: {email['from']}\nTo: {email['to']}\nDate: {email['date']}\nSubject: {email['subject']}\n"
+                    f"ThreadID: {email['thread_id']}\n\n{email['body'] or email['preview']}"
+                )
+            
+            elif tool_name == "summarize_thread":
+                summary = await ThreadSummaryService.get_summary(state["user_id"], args.get("thread_id", ""), state["db"])
+                result = (
+                    f"THREAD SUMMARY: {summary['subject']} ({summary['message_count']} messages, latest {summary['last_date']})\n"
+                    f"{summary['summary']}"
+                )
+            
+            elif tool_name == "semantic_email_search":
+                search_query = args.get("query", "")
+                emails = await EmailIndexService.semantic_search(state["user_id"], search_query, state["db"], limit=5)
+                if not emails:
+                    result = "No indexed emails found. Fall back to search_emails with Gmail operators."
+                else:
+                    result = f"EMAILS RELATED TO '{search_query}':\n" + "\n".join([
+                        f"- From: {e['from']}\n  To: {e['to']}\n  Subject: {e['subject']}\n  Snippet: {e['preview']}\n  MessageID: {e['id']}\n  ThreadID: {e['thread_id']}"
+                        for e in emails
+                    ])
+            
+            elif tool_name == "lookup_contact":
+                name = args.get("name", "")
+                contacts = await contact_directory.lookup(state["user_id"], name, state["db"])
+                if not contacts:
+                    result = f"No known contacts match '{name}'. Try search_emails with from:/to: operators."
+                else:
+                    result = f"CONTACTS MATCHING '{name}'" + (" (approximate matches)" if contacts[0]["fuzzy"] else "") + ":\n" + "\n".join([
+                        f"- {c['name'] or c['email']} <{c['email']}> (seen in {c['frequency']} emails)" for c in contacts
+                    ])
+            
             elif tool_name == "get_calendar_events":
                 days = args.get("days", 7)
                 events = await CalendarService.get_events(state["user_id"], state["db"], days_ahead=days)
@@ -165,18 +238,36 @@ async def execute_tools(state: AgentState):
                         f"- {e.get('summary', 'Event')} at {e.get('start', 'TBD')}" for e in events
                     ])
             
+            elif tool_name == "find_free_slots":
+                duration = int(args.get("duration_minutes", 30))
+                attendees = [a for a in args.get("attendees", "").split(",") if a.strip()]
+                found = await SchedulingService.find_slots(
+                    state["user_id"], state["db"], duration, args.get("start_date"), args.get("end_date"), attendees
+                )
+                if not found["slots"]:
+                    result = f"No free {duration}-minute slots within work hours ({found['work_hours']}) in that window."
+                else:
+                    result = f"FREE {duration}-MINUTE SLOTS (best first, work hours {found['work_hours']}):\n" + "\n".join([
+                        f"- {slot['start']} to {slot['end']}" for slot in found["slots"]
+                    ])
+                if found["unavailable"]:
+                    result += f"\nCould not check availability for: {', '.join(found['unavailable'])}"
+            
             elif tool_name == "search_memory":
                 query = args.get("query", "")
                 facts = await MemoryService.retrieve_relevant_facts(state["user_id"], query, state["db"])
-                if not facts:
+                related = await MemoryService.get_related_facts(state["user_id"], query, state["db"], exclude=facts)
+                if not facts and not related:
                     result = "No relevant memories found."
                 else:
                     result = "RELEVANT MEMORIES:\n" + "\n".join([f"• {f}" for f in facts])
+                    if related:
+                        result += "\n\nCONNECTED MEMORIES (linked through people/projects mentioned):\n" + "\n".join([f"• {f}" for f in related])
             
             elif tool_name == "save_memory":
                 fact = args.get("fact", "")
                 # Real storage
-                await MemoryService.store_fact(state["user_id"], fact, "personal", 0.5, {}, state["db"])
+                await MemoryService.store_facts(state["user_id"], [{"fact": fact, "category": "personal", "importance": 0.5}], state["db"])
                 result = f"Successfully saved to memory: {fact}"
             
             elif tool_name == "draft_and_send_email":
@@ -184,8 +275,8 @@ async def execute_tools(state: AgentState):
                 sub = args.get("subject", "No Subject")
                 content = args.get("body", "")
                 tid = args.get("thread_id")
-                msg_id = await GmailService.send_email(state["user_id"], target, sub, content, state["db"], thread_id=tid)
-                result = f"Email sent successfully to {target}! Message ID: {msg_id}"
+                outbound = await mail_queue.enqueue(state["user_id"], target, sub, content, state["db"], thread_id=tid)
+                result = f"Email to {target} queued for delivery (Outbound ID: {outbound.id}). It will be sent within a few seconds."
             
             elif tool_name == "create_calendar_event":
                 title = args.get("title")
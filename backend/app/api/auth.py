@@ -52,6 +52,20 @@ class ProfileUpdate(BaseModel):
     main_goal: str
     work_hours: str
 
+def profile_facts(req) -> list:
+    """Profile details as individual memory facts (keyed by field in their metadata)"""
+    fields = [
+        ("name", "personal", f"User Profile: My name is {req.name}.", req.name),
+        ("job_title", "personal", f"User Profile: I am a {req.job_title}.", req.job_title),
+        ("main_goal", "personal", f"User Profile: My main goal is {req.main_goal}.", req.main_goal),
+        ("work_hours", "habit", f"User Profile: I typically work {req.work_hours}.", req.work_hours),
+        ("personalization", "preference", f"User Profile: My AI personalization preference: {req.personalization}", req.personalization),
+    ]
+    return [
+        {"fact": fact, "category": category, "importance": 1.0, "metadata": {"profile_field": field}}
+        for field, category, fact, value in fields if value
+    ]
+
 def create_access_token(user_id: str, email: str, expires_delta: timedelta = None):
     """Create JWT access token"""
     if expires_delta is None:
@@ -261,13 +275,7 @@ async def setup_user(req: SetupRequest, db: AsyncSession = Depends(get_db)):
         
         # Also save this to memory for the AI
         from ..services.memory_service import MemoryService
-        await MemoryService.store_fact(
-            str(user.id), 
-            f"User Profile: My name is {req.name}. I am a {req.job_title}. My main goal is {req.main_goal}. I typically work {req.work_hours}. My AI personalization preference: {req.personalization}", 
-            category="personal",
-            importance=1.0,
-            db=db
-        )
+        await MemoryService.store_facts(str(user.id), profile_facts(req), db)
         
         await db.commit()
         return {"status": "success"}
@@ -291,15 +299,9 @@ async def update_profile(user_id: str, req: ProfileUpdate, db: AsyncSession = De
         user.main_goal = req.main_goal
         user.work_hours = req.work_hours
         
-        # Update memory fact about profile
+        # Update memory facts about profile
         from ..services.memory_service import MemoryService
-        await MemoryService.store_fact(
-            str(user.id), 
-            f"Updated User Profile: My name is {req.name}. I am a {req.job_title}. My main AI personalization: {req.personalization}", 
-            category="preference",
-            importance=1.0,
-            db=db
-        )
+        await MemoryService.store_facts(str(user.id), profile_facts(req), db)
         
         await db.commit()
         return {"status": "success", "user": {
@@ -7,7 +7,7 @@ from slowapi import Limiter
 from slowapi.util import get_remote_address
 from ..db.database import get_db
 from ..db.models import User, ChatMessage
-from ..services.memory_service import MemoryService
+from ..services.memory_service import MemoryService, invalidate_graph
 import uuid
 from collections import deque
 import os
@@ -240,7 +240,7 @@ async def clear_chat_history(user_id: str, db: AsyncSession = Depends(get_db)):
 async def delete_all_user_data(user_id: str, db: AsyncSession = Depends(get_db)):
     """Delete all data for user (Chat + Memory + Conversations)"""
     from sqlalchemy import delete
-    from ..db.models import MemoryFact, MemoryEmbedding, Conversation, ChatMessage
+    from ..db.models import MemoryFact, MemoryEmbedding, MemoryEdge, Conversation, ChatMessage
     
     try:
         user_uuid = uuid.UUID(user_id)
@@ -270,6 +270,7 @@ async def delete_all_user_data(user_id: str, db: AsyncSession = Depends(get_db))
     if fact_ids:
         stmt2 = delete(MemoryEmbedding).where(MemoryEmbedding.memory_fact_id.in_(fact_ids))
         await db.execute(stmt2)
+        await db.execute(delete(MemoryEdge).where(MemoryEdge.memory_fact_id.in_(fact_ids)))
 
     # 4. Delete Memory Facts (excluding profile facts)
     stmt3 = delete(MemoryFact).where(
@@ -281,5 +282,6 @@ async def delete_all_user_data(user_id: str, db: AsyncSession = Depends(get_db))
     await db.execute(stmt3)
 
     await db.commit()
+    invalidate_graph(str(user_uuid))
 
     return {"status": "success", "message": "All user data deleted"}
@@ -1,12 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
+from typing import Optional
 from ..db.database import get_db
 from ..services.gmail_service import GmailService
+from ..services.gmail_mirror import GmailMirrorService
 from ..services.calendar_service import CalendarService
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage
+from ..services.calendar_sync import CalendarSyncService
+from ..services.scheduling import SchedulingService
+from ..services.analysis_service import AnalysisService
+from ..services.mail_queue import mail_queue
+from ..services.thread_summary import ThreadSummaryService
 import os
+import json
+import hashlib
+from datetime import datetime, timedelta, timezone
 
 router = APIRouter()
 
@@ -15,6 +24,7 @@ class EmailSendRequest(BaseModel):
     to: str
     subject: str
     body: str
+    thread_id: Optional[str] = None
 
 class EventCreateRequest(BaseModel):
     user_id: str
@@ -26,34 +36,100 @@ class EventCreateRequest(BaseModel):
 
 class AnalyzeEmailRequest(BaseModel):
     user_id: str
-    message_id: str
+    message_id: Optional[str] = None
+    thread_id: Optional[str] = None  # Without message_id: answer from the cached thread summary
     question: str = "Summarize this email and attachments"
 
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """Exact (weak) comparison of an ETag against an If-None-Match list"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
 # Gmail Endpoints
 @router.get("/gmail/inbox/{user_id}")
-async def get_inbox(user_id: str, db: AsyncSession = Depends(get_db)):
-    """Get inbox emails"""
+async def get_inbox(
+    user_id: str,
+    request: Request,
+    page_token: Optional[str] = None,
+    page_size: Optional[int] = None,  # Defaults to GMAIL_INBOX_PAGE_SIZE
+    db: AsyncSession = Depends(get_db)
+):
+    """Get a page of inbox emails. Supports If-None-Match so polling clients get 304s."""
+    try:
+        page = await GmailService.get_inbox(user_id, db, page_token=page_token, page_size=page_size)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    etag = '"' + hashlib.sha1(json.dumps(page, sort_keys=True).encode()).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(etag, request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=page, headers=headers)
+
+@router.get("/gmail/message/{user_id}/{message_id}")
+async def get_message(user_id: str, message_id: str, db: AsyncSession = Depends(get_db)):
+    """Get a single email with its full body"""
+    try:
+        email = await GmailService.get_message(user_id, message_id, db)
+        return {"email": email}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/gmail/thread/{user_id}/{thread_id}/summary")
+async def get_thread_summary(user_id: str, thread_id: str, db: AsyncSession = Depends(get_db)):
+    """Summary of a thread, recomputed only when the thread has changed"""
     try:
-        emails = await GmailService.get_inbox(user_id, db)
-        return {"emails": emails}
+        return await ThreadSummaryService.get_summary(user_id, thread_id, db)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.post("/gmail/send")
+@router.post("/gmail/mirror/{user_id}")
+async def enable_mirror(user_id: str, db: AsyncSession = Depends(get_db)):
+    """Opt in to the local Gmail mirror; the initial sync runs in the background"""
+    try:
+        await GmailMirrorService.enable(user_id, db)
+        return {"status": "enabled", "syncing": True}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.delete("/gmail/mirror/{user_id}")
+async def disable_mirror(user_id: str, db: AsyncSession = Depends(get_db)):
+    """Opt out of the local Gmail mirror and delete mirrored mail"""
+    try:
+        await GmailMirrorService.disable(user_id, db)
+        return {"status": "disabled"}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/gmail/send", status_code=202)
 async def send_email(request: EmailSendRequest, db: AsyncSession = Depends(get_db)):
-    """Send an email"""
+    """Queue an email for delivery; poll /gmail/outbox/{outbound_id} for its status"""
     try:
-        message_id = await GmailService.send_email(
+        outbound = await mail_queue.enqueue(
             request.user_id,
             request.to,
             request.subject,
             request.body,
-            db
+            db,
+            thread_id=request.thread_id
         )
-        return {"message_id": message_id, "status": "sent"}
+        return {"outbound_id": str(outbound.id), "status": outbound.status}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/gmail/outbox/{outbound_id}")
+async def get_outbound_status(outbound_id: str, db: AsyncSession = Depends(get_db)):
+    """Delivery status of a queued email"""
+    try:
+        status = await mail_queue.get_status(outbound_id, db)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid outbound_id format")
+    if not status:
+        raise HTTPException(status_code=404, detail="Outbound email not found")
+    return status
+
 # Calendar Endpoints
 @router.get("/calendar/events/{user_id}")
 async def get_events(user_id: str, days_ahead: int = 7, db: AsyncSession = Depends(get_db)):
@@ -64,6 +140,43 @@ async def get_events(user_id: str, days_ahead: int = 7, db: AsyncSession = Depen
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/calendar/events/{user_id}/stream")
+async def stream_events(user_id: str, start: Optional[str] = None, days: int = 30, db: AsyncSession = Depends(get_db)):
+    """Live events across all selected calendars as NDJSON, in start order, streamed as pages arrive"""
+    try:
+        service = await CalendarService.get_service(user_id, db)
+        time_min = datetime.fromisoformat(start.replace("Z", "+00:00")) if start else datetime.utcnow()
+        if time_min.tzinfo:
+            time_min = time_min.astimezone(timezone.utc).replace(tzinfo=None)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def lines():
+        try:
+            async for event in CalendarSyncService.stream_events(user_id, service, time_min, time_min + timedelta(days=days)):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@router.get("/calendar/free-slots/{user_id}")
+async def get_free_slots(
+    user_id: str,
+    duration_minutes: int = 30,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    attendees: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Ranked free slots for the user (and optional comma-separated attendees)"""
+    try:
+        return await SchedulingService.find_slots(
+            user_id, db, duration_minutes, start, end, attendees.split(",") if attendees else None
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/calendar/create")
 async def create_event(request: EventCreateRequest, db: AsyncSession = Depends(get_db)):
     """Create a calendar event"""
@@ -84,7 +197,23 @@ async def create_event(request: EventCreateRequest, db: AsyncSession = Depends(g
 @router.post("/gmail/analyze")
 async def analyze_email(request: AnalyzeEmailRequest, db: AsyncSession = Depends(get_db)):
     """Analyze email and attachments with Gemini"""
+    if not request.message_id and not request.thread_id:
+        raise HTTPException(status_code=400, detail="message_id or thread_id is required")
+
     try:
+        if not request.message_id:
+            summary = await ThreadSummaryService.get_summary(request.user_id, request.thread_id, db)
+            analysis = await ThreadSummaryService.answer(summary, request.question)
+            return {
+                "thread": {
+                    "subject": summary["subject"],
+                    "message_count": summary["message_count"],
+                    "last_date": summary["last_date"],
+                    "summary_cached": summary["cached"]
+                },
+                "analysis": analysis
+            }
+
         # Get message with attachments
         message = await GmailService.get_message_with_attachments(
             request.user_id,
@@ -92,22 +221,8 @@ async def analyze_email(request: AnalyzeEmailRequest, db: AsyncSession = Depends
             db
         )
 
-        # Build content for analysis
-        content = f"Subject: {message['subject']}\n"
-        content += f"From: {message['from']}\n"
-        content += f"Date: {message['date']}\n\n"
-        content += f"Body:\n{message['body']}\n\n"
-
-        if message['attachments']:
-            for att in message['attachments']:
-                content += f"\n--- Attachment: {att['filename']} ---\n"
-                content += f"{att['text']}\n"
-
-        content += f"\n\nQuestion: {request.question}"
-
-        # Analyze with Gemini
-        llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key=os.getenv("GOOGLE_API_KEY"))
-        response = await llm.ainvoke([HumanMessage(content=content)])
+        # Long content is summarized chunk by chunk (cached), then answered from the summaries
+        analysis = await AnalysisService.analyze_message(request.user_id, message, request.question, db)
 
         return {
             "message": {
@@ -115,7 +230,7 @@ async def analyze_email(request: AnalyzeEmailRequest, db: AsyncSession = Depends
                 "from": message["from"],
                 "date": message["date"]
             },
-            "analysis": response.content
+            "analysis": analysis
         }
 
     except Exception as e:
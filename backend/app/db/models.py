@@ -1,5 +1,5 @@
-from sqlalchemy import Column, String, Text, DateTime, Integer, Float, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, Text, DateTime, Integer, Float, ForeignKey, BigInteger, Computed, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID, ARRAY, TSVECTOR
 from pgvector.sqlalchemy import Vector
 from datetime import datetime
 import uuid
@@ -57,6 +57,282 @@ class MemoryEmbedding(Base):
     __tablename__ = "memory_embeddings"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    memory_fact_id = Column(UUID(as_uuid=True), ForeignKey("memory_facts.id"), nullable=False)
+    memory_fact_id = Column(UUID(as_uuid=True), ForeignKey("memory_facts.id"), nullable=False, index=True)
+    user_id = Column(UUID(as_uuid=True), nullable=True, index=True)  # Copied from the fact so searches filter without a join
     embedding = Column(Vector(768), nullable=False)  # Google embedding-001 uses 768 dims
+    embedding_model = Column(String(128), nullable=True)  # Provider model that produced the vector
+    embedding_dim = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index(
+            "ix_memory_embeddings_hnsw", "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"}
+        ),
+    )
+
+class GmailMessage(Base):
+    """Local mirror of a user's Gmail message metadata and plain-text body"""
+    __tablename__ = "gmail_messages"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    message_id = Column(String(64), nullable=False)  # Gmail message id
+    thread_id = Column(String(64), nullable=False, index=True)
+    history_id = Column(BigInteger, nullable=True)
+    subject = Column(Text, nullable=True)
+    sender = Column(Text, nullable=True)
+    recipients = Column(Text, nullable=True)
+    date = Column(String(255), nullable=True)  # Raw Date header
+    rfc_message_id = Column(Text, nullable=True)  # Message-ID header, used for reply threading
+    internal_date = Column(DateTime, nullable=True)
+    label_ids = Column(ARRAY(String(64)), nullable=False, default=list)
+    snippet = Column(Text, nullable=True)
+    body_text = Column(Text, nullable=True)
+    indexed_at = Column(DateTime, nullable=True)  # When the body was embedded into email_embeddings
+    search_vector = Column(TSVECTOR, Computed(
+        "to_tsvector('simple', coalesce(subject, '') || ' ' || coalesce(sender, '') || ' ' || "
+        "coalesce(recipients, '') || ' ' || coalesce(body_text, ''))",
+        persisted=True
+    ))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "message_id", name="uq_gmail_messages_user_message"),
+        Index("ix_gmail_messages_user_date", "user_id", "internal_date"),
+        Index("ix_gmail_messages_search", "search_vector", postgresql_using="gin"),
+        Index("ix_gmail_messages_labels", "label_ids", postgresql_using="gin"),
+    )
+
+class GmailSyncState(Base):
+    """Per-user opt-in and history cursor for the Gmail mirror"""
+    __tablename__ = "gmail_sync_state"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    enabled = Column(Integer, default=1)  # 0 for false, 1 for true
+    history_id = Column(BigInteger, nullable=True)  # Last Gmail historyId applied to the mirror
+    mirrored_since = Column(DateTime, nullable=True)  # Oldest message the initial sync mirrored
+    mirror_complete = Column(Integer, default=0)  # 1 when the initial sync reached the end of the mailbox
+    last_synced_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class EmailEmbedding(Base):
+    """Embedded chunks of mirrored email bodies for semantic search"""
+    __tablename__ = "email_embeddings"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    message_id = Column(String(64), nullable=False)
+    thread_id = Column(String(64), nullable=False)
+    chunk_index = Column(Integer, nullable=False, default=0)
+    content = Column(Text, nullable=False)
+    embedding = Column(Vector(768), nullable=False)
+    embedding_model = Column(String(128), nullable=True)
+    embedding_dim = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_email_embeddings_user_message", "user_id", "message_id"),
+        Index(
+            "ix_email_embeddings_hnsw", "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"}
+        ),
+    )
+
+class AttachmentText(Base):
+    """Extracted text of a message attachment, addressable by message part and by content hash"""
+    __tablename__ = "attachment_texts"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    message_id = Column(String(64), nullable=False)
+    part_id = Column(String(64), nullable=False)  # Gmail payload partId (attachment ids are not stable)
+    filename = Column(String(255), nullable=True)
+    content_hash = Column(String(64), nullable=False, index=True)  # sha256 of the raw attachment bytes
+    text = Column(Text, nullable=False)
+    page_count = Column(Integer, nullable=True)
+    pages_extracted = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "message_id", "part_id", name="uq_attachment_texts_part"),
+    )
+
+class EmailChunkSummary(Base):
+    """Cached map-step summary of one chunk of an email or attachment"""
+    __tablename__ = "email_chunk_summaries"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    message_id = Column(String(64), nullable=False)
+    content_hash = Column(String(64), nullable=False)  # sha256 of the chunk text
+    summary = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "message_id", "content_hash", name="uq_email_chunk_summaries_chunk"),
+    )
+
+class OutboundEmail(Base):
+    """Durable queue of emails waiting to be delivered through Gmail"""
+    __tablename__ = "outbound_emails"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
+    recipient = Column(Text, nullable=False)
+    subject = Column(Text, nullable=False)
+    body = Column(Text, nullable=False)
+    thread_id = Column(String(64), nullable=True)
+    status = Column(String(20), nullable=False, default="queued")  # queued, sending, sent, failed, unknown
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    last_error = Column(Text, nullable=True)
+    gmail_message_id = Column(String(64), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_outbound_emails_status_next", "status", "next_attempt_at"),
+    )
+
+class ThreadSummary(Base):
+    """LLM summary of a Gmail thread, valid while the thread's historyId is unchanged"""
+    __tablename__ = "thread_summaries"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    thread_id = Column(String(64), nullable=False)
+    history_id = Column(BigInteger, nullable=False)
+    subject = Column(Text, nullable=True)
+    message_count = Column(Integer, default=0)
+    last_date = Column(String(255), nullable=True)
+    summary = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "thread_id", name="uq_thread_summaries_thread"),
+    )
+
+class AttachmentChunkEmbedding(Base):
+    """Embedded chunks of extracted attachment text for top-k retrieval"""
+    __tablename__ = "attachment_chunk_embeddings"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    message_id = Column(String(64), nullable=False)
+    part_id = Column(String(64), nullable=False)
+    filename = Column(String(255), nullable=True)
+    chunk_index = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+    embedding = Column(Vector(768), nullable=False)
+    embedding_model = Column(String(128), nullable=True)
+    embedding_dim = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_attachment_chunks_user_message", "user_id", "message_id", "part_id"),
+    )
+
+class Contact(Base):
+    """Address seen in a user's mail headers, ranked by how often it appears"""
+    __tablename__ = "contacts"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    email = Column(String(320), nullable=False)
+    name = Column(String(255), nullable=True)
+    frequency = Column(Integer, default=0)
+    last_seen = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "email", name="uq_contacts_user_email"),
+        Index("ix_contacts_user_frequency", "user_id", "frequency"),
+    )
+
+class CalendarEvent(Base):
+    """Local copy of a user's calendar events, kept current with Calendar sync tokens"""
+    __tablename__ = "calendar_events"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    calendar_id = Column(String(255), nullable=False, default="primary")
+    event_id = Column(String(1024), nullable=False)
+    title = Column(Text, nullable=True)
+    description = Column(Text, nullable=True)
+    location = Column(Text, nullable=True)
+    start = Column(String(64), nullable=True)  # As returned by Google: dateTime or all-day date
+    end = Column(String(64), nullable=True)
+    start_at = Column(DateTime, nullable=True)  # UTC, for range queries
+    end_at = Column(DateTime, nullable=True)
+    all_day = Column(Integer, default=0)  # 0 for false, 1 for true
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "calendar_id", "event_id", name="uq_calendar_events_event"),
+        Index("ix_calendar_events_user_start", "user_id", "start_at"),
+    )
+
+class CalendarSyncState(Base):
+    """Per-user, per-calendar sync token for incremental event sync"""
+    __tablename__ = "calendar_sync_state"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    calendar_id = Column(String(255), primary_key=True, default="primary")
+    sync_token = Column(Text, nullable=True)
+    last_synced_at = Column(DateTime, nullable=True)
+    synced_until = Column(DateTime, nullable=True)  # End of the window the last full sync listed
+
+class EmbeddingCacheEntry(Base):
+    """Shared embedding cache keyed by embedding model and normalized-text hash"""
+    __tablename__ = "embedding_cache"
+
+    model = Column(String(128), primary_key=True)  # Model name plus query/document task
+    text_hash = Column(String(64), primary_key=True)
+    embedding = Column(Vector(768), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class MemoryEdge(Base):
+    """Link from a named entity (person, project, ...) to a memory fact that mentions it"""
+    __tablename__ = "memory_edges"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    entity = Column(String(255), nullable=False)  # Normalized (lower-case) entity name
+    memory_fact_id = Column(UUID(as_uuid=True), ForeignKey("memory_facts.id", ondelete="CASCADE"), nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "entity", "memory_fact_id", name="uq_memory_edges_edge"),
+        Index("ix_memory_edges_user_entity", "user_id", "entity"),
+    )
+
+class ArchivedMemoryFact(Base):
+    """Cold storage for facts that decayed out of, or were consolidated out of, the working set (no embeddings)"""
+    __tablename__ = "memory_facts_archive"
+
+    id = Column(UUID(as_uuid=True), primary_key=True)  # Id the fact had in memory_facts
+    user_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    fact = Column(Text, nullable=False)
+    category = Column(String(50), nullable=False)
+    importance = Column(Float, default=0.0)
+    metadata_json = Column(Text, nullable=True)
+    reason = Column(String(20), nullable=False)  # decayed, overflow, consolidated
+    created_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+class MemoryMaintenanceState(Base):
+    """Per-user progress of the memory consolidation/decay job"""
+    __tablename__ = "memory_maintenance_state"
+
+    user_id = Column(UUID(as_uuid=True), primary_key=True)
+    last_run_at = Column(DateTime, nullable=True)  # When the user was last claimed by a run
+    consolidated_until = Column(DateTime, nullable=True)  # Facts updated before this have been clustered
+    facts_consolidated = Column(Integer, default=0)
+    facts_archived = Column(Integer, default=0)
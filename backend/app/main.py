@@ -1,15 +1,25 @@
 from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import os
 import logging
 import traceback
 from dotenv import load_dotenv
 from sqlalchemy import text
-from .db.database import engine, Base
+from .db.database import engine, Base, AsyncSessionLocal
 from .api.chat import router as chat_router
 from .api.auth import router as auth_router
 from .api.integrations import router as integrations_router
+from .services.google_api import google_api
+from .services.gmail_mirror import run_mirror_sync_loop
+from .services.pdf_extractor import pdf_extractor
+from .services.mail_queue import mail_queue
+from .services.contact_service import contact_directory
+from .services.memory_service import embedding_cache
+from .services.embeddings import embedding_provider
+from .services.email_index import EmailIndexService
+from .services.memory_maintenance import run_memory_maintenance_loop
 
 load_dotenv()
 
@@ -61,11 +71,129 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.error(f"Migration error (user columns): {e}")
 
+        # 7. Email index tracking on the Gmail mirror
+        try:
+            await conn.execute(text("ALTER TABLE IF EXISTS gmail_messages ADD COLUMN IF NOT EXISTS indexed_at TIMESTAMP"))
+            logger.info("Checked gmail_messages.indexed_at")
+        except Exception as e:
+            logger.error(f"Migration error (indexed_at): {e}")
+
+        # 8. Reply threading header on the Gmail mirror
+        try:
+            await conn.execute(text("ALTER TABLE IF EXISTS gmail_messages ADD COLUMN IF NOT EXISTS rfc_message_id TEXT"))
+            logger.info("Checked gmail_messages.rfc_message_id")
+        except Exception as e:
+            logger.error(f"Migration error (rfc_message_id): {e}")
+
+        # 9. Per-user filtering column on memory_embeddings (backfilled from the owning fact)
+        try:
+            await conn.execute(text("ALTER TABLE IF EXISTS memory_embeddings ADD COLUMN IF NOT EXISTS user_id UUID"))
+            await conn.execute(text(
+                "UPDATE memory_embeddings e SET user_id = f.user_id FROM memory_facts f "
+                "WHERE e.memory_fact_id = f.id AND e.user_id IS NULL"
+            ))
+            logger.info("Checked memory_embeddings.user_id")
+        except Exception as e:
+            logger.error(f"Migration error (memory_embeddings.user_id): {e}")
+
+        # 11. Embedding model/dimension per vector (existing vectors all came from Google embedding-001)
+        for table in ("memory_embeddings", "email_embeddings", "attachment_chunk_embeddings"):
+            try:
+                await conn.execute(text(f"ALTER TABLE IF EXISTS {table} ADD COLUMN IF NOT EXISTS embedding_model VARCHAR(128)"))
+                await conn.execute(text(f"ALTER TABLE IF EXISTS {table} ADD COLUMN IF NOT EXISTS embedding_dim INTEGER"))
+                await conn.execute(text(f"""
+                    DO $$ BEGIN
+                        IF to_regclass('{table}') IS NOT NULL THEN
+                            UPDATE {table} SET embedding_model = 'models/embedding-001', embedding_dim = 768
+                            WHERE embedding_model IS NULL;
+                        END IF;
+                    END $$;
+                """))
+                logger.info(f"Checked {table}.embedding_model")
+            except Exception as e:
+                logger.error(f"Migration error ({table}.embedding_model): {e}")
+
+        # 12. Range of mail the Gmail mirror holds (backfilled from what is already mirrored)
+        try:
+            await conn.execute(text("ALTER TABLE IF EXISTS gmail_sync_state ADD COLUMN IF NOT EXISTS mirrored_since TIMESTAMP"))
+            await conn.execute(text("ALTER TABLE IF EXISTS gmail_sync_state ADD COLUMN IF NOT EXISTS mirror_complete INTEGER DEFAULT 0"))
+            await conn.execute(text("""
+                DO $$ BEGIN
+                    IF to_regclass('gmail_sync_state') IS NOT NULL THEN
+                        UPDATE gmail_sync_state s SET mirrored_since = m.oldest
+                        FROM (SELECT user_id, MIN(internal_date) AS oldest FROM gmail_messages GROUP BY user_id) m
+                        WHERE s.user_id = m.user_id AND s.mirrored_since IS NULL;
+                    END IF;
+                END $$;
+            """))
+            logger.info("Checked gmail_sync_state.mirrored_since")
+        except Exception as e:
+            logger.error(f"Migration error (gmail_sync_state.mirrored_since): {e}")
+
+        # 13. End of the window each calendar's last full sync covered (NULL forces one bounded resync)
+        try:
+            await conn.execute(text("ALTER TABLE IF EXISTS calendar_sync_state ADD COLUMN IF NOT EXISTS synced_until TIMESTAMP"))
+            logger.info("Checked calendar_sync_state.synced_until")
+        except Exception as e:
+            logger.error(f"Migration error (calendar_sync_state.synced_until): {e}")
+
         # Sync all models
         await conn.run_sync(Base.metadata.create_all)
+
+        # 10. Indexes on tables that predate them (create_all only indexes new tables)
+        try:
+            await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_memory_embeddings_memory_fact_id ON memory_embeddings (memory_fact_id)"))
+            await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_memory_embeddings_user_id ON memory_embeddings (user_id)"))
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_memory_embeddings_hnsw ON memory_embeddings "
+                "USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+            ))
+            logger.info("Checked memory_embeddings indexes")
+        except Exception as e:
+            logger.error(f"Migration error (memory_embeddings indexes): {e}")
+        try:
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_email_embeddings_hnsw ON email_embeddings "
+                "USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+            ))
+            logger.info("Checked email_embeddings indexes")
+        except Exception as e:
+            logger.error(f"Migration error (email_embeddings indexes): {e}")
+    # Pooled connections were opened before the vector extension existed and so missed its
+    # session settings (hnsw.iterative_scan); reconnect so every connection gets them
+    await engine.dispose()
     logger.info("Database initialized.")
+    try:
+        purged = await embedding_cache.purge_stale()
+        if purged:
+            logger.info(f"Dropped {purged} cached embeddings from a previous embedding model")
+    except Exception as e:
+        logger.error(f"Embedding cache purge error: {e}")
+    try:
+        async with AsyncSessionLocal() as db:
+            requeued = await EmailIndexService.requeue_other_models(db)
+        if requeued:
+            logger.info(f"Re-indexing {requeued} emails embedded by a previous embedding model")
+    except Exception as e:
+        logger.error(f"Email re-index check error: {e}")
+    background_tasks = [
+        asyncio.create_task(run_mirror_sync_loop()),
+        asyncio.create_task(mail_queue.run()),
+        asyncio.create_task(contact_directory.run_flush_loop()),
+        asyncio.create_task(run_memory_maintenance_loop()),
+    ]
     yield
     # Shutdown
+    for task in background_tasks:
+        task.cancel()
+    try:
+        async with AsyncSessionLocal() as db:
+            await contact_directory.flush(db)
+    except Exception as e:
+        logger.error(f"Contact flush error: {e}")
+    google_api.shutdown()
+    pdf_extractor.shutdown()
+    embedding_provider.shutdown()
     await engine.dispose()
 
 app = FastAPI(title="Cortex Agent API", lifespan=lifespan)
@@ -123,6 +251,18 @@ app.include_router(integrations_router, prefix="/api", tags=["integrations"])
 async def health():
     return {"status": "healthy", "service": "cortex-agent-api"}
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "google_api": google_api.metrics(),
+        "pdf_extractor": pdf_extractor.metrics(),
+        "mail_queue": mail_queue.metrics(),
+        "contacts": contact_directory.metrics(),
+        "quota_governor": google_api.governor.metrics(),
+        "embedding_cache": embedding_cache.metrics(),
+        "embeddings": embedding_provider.metrics(),
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, proxy_headers=True, forwarded_allow_ips="*")
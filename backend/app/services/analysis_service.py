@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import os
+from typing import List, Tuple
+
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.messages import HumanMessage
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.models import EmailChunkSummary
+from .chunking import chunk_text
+from .attachment_index import AttachmentIndexService
+from .ids import to_uuid
+
+llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key=os.getenv("GOOGLE_API_KEY"))
+
+ANALYSIS_DIRECT_LIMIT = int(os.getenv("ANALYSIS_DIRECT_LIMIT", "12000"))  # chars answered in a single prompt
+ANALYSIS_CHUNK_CHARS = int(os.getenv("ANALYSIS_CHUNK_CHARS", "8000"))
+ANALYSIS_CHUNK_OVERLAP = 400
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "4"))
+
+MAP_PROMPT = """Summarize the following part of an email ({label}).
+Keep every concrete fact: names, dates, amounts, figures, deadlines, obligations and requests.
+Be concise and do not add anything that is not in the text.
+
+{content}"""
+
+
+def message_header(message: dict) -> str:
+    return f"Subject: {message['subject']}\nFrom: {message['from']}\nDate: {message['date']}\n"
+
+
+def message_sections(message: dict) -> List[Tuple[str, str]]:
+    """The (label, text) sections of a message: body first, then each attachment"""
+    sections = [("Body", message.get("body", ""))]
+    for att in message.get("attachments", []):
+        sections.append((f"Attachment: {att['filename']}", att.get("text", "")))
+    return [(label, text) for label, text in sections if text and text.strip()]
+
+
+class AnalysisService:
+    """Question answering over emails, map-reducing content that is too long for one prompt"""
+
+    @staticmethod
+    async def summarize_chunks(
+        user_id: str, message_id: str, chunks: List[Tuple[str, str]], db: AsyncSession
+    ) -> List[str]:
+        """Summarize (label, text) chunks concurrently, reusing cached summaries"""
+        user_uuid = to_uuid(user_id)
+        hashes = [hashlib.sha256(text.encode()).hexdigest() for _, text in chunks]
+
+        stmt = select(EmailChunkSummary.content_hash, EmailChunkSummary.summary).where(
+            EmailChunkSummary.user_id == user_uuid,
+            EmailChunkSummary.message_id == message_id,
+            EmailChunkSummary.content_hash.in_(set(hashes))
+        )
+        cached = {row.content_hash: row.summary for row in (await db.execute(stmt)).all()}
+
+        semaphore = asyncio.Semaphore(ANALYSIS_CONCURRENCY)
+
+        async def summarize(label: str, text: str) -> str:
+            async with semaphore:
+                response = await llm.ainvoke([HumanMessage(content=MAP_PROMPT.format(label=label, content=text))])
+                return response.content
+
+        pending = {}
+        for (label, text), content_hash in zip(chunks, hashes):
+            if content_hash not in cached and content_hash not in pending:
+                pending[content_hash] = (label, text)
+
+        if pending:
+            summaries = await asyncio.gather(*(summarize(label, text) for label, text in pending.values()))
+            rows = []
+            for content_hash, summary in zip(pending, summaries):
+                cached[content_hash] = summary
+                rows.append({"user_id": user_uuid, "message_id": message_id, "content_hash": content_hash, "summary": summary})
+            await db.execute(
+                insert(EmailChunkSummary).values(rows).on_conflict_do_nothing(constraint="uq_email_chunk_summaries_chunk")
+            )
+            await db.commit()
+
+        return [cached[h] for h in hashes]
+
+    @staticmethod
+    async def analyze_message(user_id: str, message: dict, question: str, db: AsyncSession) -> str:
+        """Answer a question about a message (as returned by get_message_with_attachments).
+
+        Short messages go to the model whole. Otherwise indexed attachments contribute only their
+        top-k chunks for the question, and everything else is map-reduced.
+        """
+        sections = message_sections(message)
+        header = message_header(message)
+
+        if sum(len(text) for _, text in sections) <= ANALYSIS_DIRECT_LIMIT:
+            content = header + "\n"
+            for label, text in sections:
+                content += f"\n--- {label} ---\n{text}\n"
+            content += f"\n\nQuestion: {question}"
+            response = await llm.ainvoke([HumanMessage(content=content)])
+            return response.content
+
+        # Attachments already in the vector index are answered from their most relevant chunks
+        indexed = await AttachmentIndexService.indexed_parts(user_id, message["id"], db)
+        excerpts = await AttachmentIndexService.retrieve(user_id, message["id"], question, db) if indexed else {}
+
+        remaining = [("Body", message.get("body", ""))]
+        for att in message.get("attachments", []):
+            if att.get("part_id") in indexed:
+                continue
+            remaining.append((f"Attachment: {att['filename']}", att.get("text", "")))
+            if att.get("part_id") and len(att.get("text", "")) > ANALYSIS_CHUNK_CHARS:
+                AttachmentIndexService.schedule(user_id, message["id"], att)
+        remaining = [(label, text) for label, text in remaining if text and text.strip()]
+
+        content = header + "\n"
+        if sum(len(text) for _, text in remaining) <= ANALYSIS_DIRECT_LIMIT:
+            for label, text in remaining:
+                content += f"\n--- {label} ---\n{text}\n"
+        else:
+            # Map: question-independent summaries so follow-up questions only pay for the reduce
+            chunks = []
+            for label, text in remaining:
+                parts = chunk_text(text, ANALYSIS_CHUNK_CHARS, ANALYSIS_CHUNK_OVERLAP)
+                for index, part in enumerate(parts):
+                    chunks.append((f"{label}, part {index + 1}/{len(parts)}" if len(parts) > 1 else label, part))
+            summaries = await AnalysisService.summarize_chunks(user_id, message["id"], chunks, db)
+
+            content += "\nThe email is too long to include in full. Summaries of its parts, in order:\n"
+            for (label, _), summary in zip(chunks, summaries):
+                content += f"\n--- {label} ---\n{summary}\n"
+
+        filenames = {att.get("part_id"): att["filename"] for att in message.get("attachments", [])}
+        for part_id, part_excerpts in excerpts.items():
+            content += f"\n--- Attachment: {filenames.get(part_id, part_id)} (most relevant excerpts) ---\n"
+            content += "\n[...]\n".join(part_excerpts) + "\n"
+
+        # Reduce
+        content += f"\n\nQuestion: {question}"
+        response = await llm.ainvoke([HumanMessage(content=content)])
+        return response.content
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Set
+
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.database import AsyncSessionLocal
+from ..db.models import AttachmentChunkEmbedding
+from .chunking import chunk_text
+from .memory_service import embedding_cache
+from .embeddings import embedding_provider
+from .ids import to_uuid
+
+logger = logging.getLogger("cortex-api")
+
+ATTACHMENT_CHUNK_CHARS = int(os.getenv("ATTACHMENT_CHUNK_CHARS", "1200"))
+ATTACHMENT_CHUNK_OVERLAP = 150
+ATTACHMENT_EMBED_BATCH = int(os.getenv("ATTACHMENT_EMBED_BATCH", "64"))
+ATTACHMENT_TOP_K = int(os.getenv("ATTACHMENT_TOP_K", "6"))
+
+# (user, message, part) keys with an ingestion task in flight in this process
+_in_flight: Set[tuple] = set()
+_tasks: Set[asyncio.Task] = set()
+
+
+class AttachmentIndexService:
+    """Chunked vector index of attachment text, ingested once per attachment in the background"""
+
+    @staticmethod
+    async def indexed_parts(user_id: str, message_id: str, db: AsyncSession) -> Set[str]:
+        """Part ids of this message's attachments that are already indexed with the current embedding model"""
+        stmt = select(AttachmentChunkEmbedding.part_id).where(
+            AttachmentChunkEmbedding.user_id == to_uuid(user_id),
+            AttachmentChunkEmbedding.message_id == message_id,
+            AttachmentChunkEmbedding.embedding_model == embedding_provider.model
+        ).distinct()
+        return set((await db.execute(stmt)).scalars().all())
+
+    @staticmethod
+    async def index_attachment(user_id: str, message_id: str, attachment: dict, db: AsyncSession) -> int:
+        """Chunk and embed one attachment (no-op if it is already indexed)"""
+        part_id = attachment["part_id"]
+        if part_id in await AttachmentIndexService.indexed_parts(user_id, message_id, db):
+            return 0
+
+        chunks = chunk_text(attachment.get("text", ""), ATTACHMENT_CHUNK_CHARS, ATTACHMENT_CHUNK_OVERLAP)
+        if not chunks:
+            return 0
+
+        user_uuid = to_uuid(user_id)
+        # Chunks embedded by a previous embedding model are replaced
+        await db.execute(delete(AttachmentChunkEmbedding).where(
+            AttachmentChunkEmbedding.user_id == user_uuid,
+            AttachmentChunkEmbedding.message_id == message_id,
+            AttachmentChunkEmbedding.part_id == part_id
+        ))
+        for start in range(0, len(chunks), ATTACHMENT_EMBED_BATCH):
+            batch = chunks[start:start + ATTACHMENT_EMBED_BATCH]
+            embeddings = await embedding_provider.aembed_documents(batch)
+            db.add_all(
+                AttachmentChunkEmbedding(
+                    user_id=user_uuid,
+                    message_id=message_id,
+                    part_id=part_id,
+                    filename=attachment.get("filename"),
+                    chunk_index=start + offset,
+                    content=chunk,
+                    embedding=embedding,
+                    embedding_model=embedding_provider.model,
+                    embedding_dim=embedding_provider.dimensions
+                )
+                for offset, (chunk, embedding) in enumerate(zip(batch, embeddings))
+            )
+        await db.commit()
+        return len(chunks)
+
+    @staticmethod
+    def schedule(user_id: str, message_id: str, attachment: dict):
+        """Index an attachment in the background, at most once at a time per attachment"""
+        key = (user_id, message_id, attachment["part_id"])
+        if key in _in_flight:
+            return
+        _in_flight.add(key)
+
+        async def run():
+            try:
+                async with AsyncSessionLocal() as db:
+                    await AttachmentIndexService.index_attachment(user_id, message_id, attachment, db)
+            except Exception as e:
+                logger.error(f"Attachment index error for {message_id}/{attachment['part_id']}: {e}")
+            finally:
+                _in_flight.discard(key)
+
+        task = asyncio.create_task(run())
+        # Keep a reference so the task isn't garbage collected mid-flight
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+
+    @staticmethod
+    async def retrieve(
+        user_id: str, message_id: str, question: str, db: AsyncSession, k: int = ATTACHMENT_TOP_K
+    ) -> Dict[str, List[str]]:
+        """Top-k chunks across the message's indexed attachments, grouped by part id in document order"""
+        query_embedding = await embedding_cache.aembed_query(question)
+        stmt = select(
+            AttachmentChunkEmbedding.part_id,
+            AttachmentChunkEmbedding.chunk_index,
+            AttachmentChunkEmbedding.content
+        ).where(
+            AttachmentChunkEmbedding.user_id == to_uuid(user_id),
+            AttachmentChunkEmbedding.message_id == message_id,
+            AttachmentChunkEmbedding.embedding_model == embedding_provider.model
+        ).order_by(AttachmentChunkEmbedding.embedding.cosine_distance(query_embedding)).limit(k)
+
+        rows = sorted((await db.execute(stmt)).all(), key=lambda r: (r.part_id, r.chunk_index))
+        grouped: Dict[str, List[str]] = {}
+        for row in rows:
+            grouped.setdefault(row.part_id, []).append(row.content)
+        return grouped
@@ -1,11 +1,10 @@
 import os
 from typing import List
 from datetime import datetime, timedelta
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..db.models import User
+from .google_api import google_api, build_service
+from .calendar_sync import CalendarSyncService
 from sqlalchemy import select
 
 class CalendarService:
@@ -22,57 +21,23 @@ class CalendarService:
         if not user or not user.refresh_token:
             raise ValueError("User not authenticated with Google")
 
-        # Create credentials from refresh token
-        credentials = Credentials(
-            token=None,
-            refresh_token=user.refresh_token,
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=os.getenv("GOOGLE_CLIENT_ID"),
-            client_secret=os.getenv("GOOGLE_CLIENT_SECRET")
-        )
-
-        # Refresh token if needed
-        request = Request()
-        credentials.refresh(request)
-
-        return build("calendar", "v3", credentials=credentials)
+        return await build_service("calendar", "v3", user.refresh_token)
 
     @staticmethod
     async def get_events(user_id: str, db: AsyncSession, days_ahead: int = 7) -> List[dict]:
-        """Get upcoming events"""
-        try:
-            service = await CalendarService.get_service(user_id, db)
-
-            now = datetime.utcnow().isoformat() + "Z"
-            end = (datetime.utcnow() + timedelta(days=days_ahead)).isoformat() + "Z"
+        """Get upcoming events from the local store, synced incrementally first if it is stale.
 
-            # Get events
-            events_result = service.events().list(
-                calendarId="primary",
-                timeMin=now,
-                timeMax=end,
-                maxResults=10,
-                singleEvents=True,
-                orderBy="startTime"
-            ).execute()
-
-            events = events_result.get("items", [])
-            event_list = []
-
-            for event in events:
-                start = event["start"].get("dateTime", event["start"].get("date"))
-                end = event["end"].get("dateTime", event["end"].get("date"))
-
-                event_list.append({
-                    "id": event["id"],
-                    "title": event.get("summary", "No Title"),
-                    "start": start,
-                    "end": end,
-                    "description": event.get("description", ""),
-                    "location": event.get("location", "")
-                })
+        Ranges reaching past what the store covers are listed live from Google instead.
+        """
+        try:
+            now = datetime.utcnow()
+            end = now + timedelta(days=days_ahead)
+            if days_ahead > CalendarSyncService.covered_days():
+                service = await CalendarService.get_service(user_id, db)
+                return [event async for event in CalendarSyncService.stream_events(user_id, service, now, end)]
 
-            return event_list
+            await CalendarSyncService.sync(user_id, db)
+            return await CalendarSyncService.get_range(user_id, now, end, db)
 
         except Exception as e:
             raise ValueError(f"Error fetching events: {str(e)}")
@@ -99,10 +64,14 @@ class CalendarService:
                 "end": {"dateTime": end_time}
             }
 
-            created_event = service.events().insert(
+            created_event = await google_api.execute(service.events().insert(
                 calendarId="primary",
                 body=event
-            ).execute()
+            ))
+
+            # Write through so the event is visible before the next incremental sync
+            await CalendarSyncService.upsert_events(user_id, "primary", [created_event], db)
+            await db.commit()
 
             return created_event["id"]
 
@@ -0,0 +1,357 @@
+import asyncio
+import heapq
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.models import CalendarEvent, CalendarSyncState
+from .google_api import google_api
+from .ids import to_uuid
+
+logger = logging.getLogger("cortex-api")
+
+CALENDAR_SYNC_TTL = int(os.getenv("CALENDAR_SYNC_TTL", "60"))  # seconds a synced store is served without checking Google
+CALENDAR_SYNC_PAST_DAYS = int(os.getenv("CALENDAR_SYNC_PAST_DAYS", "30"))  # history kept by a full sync
+CALENDAR_SYNC_FUTURE_DAYS = int(os.getenv("CALENDAR_SYNC_FUTURE_DAYS", "180"))  # future covered by a full sync
+CALENDAR_FETCH_CONCURRENCY = int(os.getenv("CALENDAR_FETCH_CONCURRENCY", "4"))  # calendars fetched at once per user
+CALENDAR_LIST_TTL = 600  # seconds the selected-calendar list is reused
+CALENDAR_PAGE_SIZE = 250
+CALENDAR_UPSERT_CHUNK = 1000  # rows per INSERT, well under asyncpg's 32767 bind parameters
+EVENT_FIELDS = "items(id,status,summary,description,location,start,end),nextPageToken,nextSyncToken"
+STREAM_FIELDS = "items(id,status,summary,description,location,start,end),nextPageToken"
+
+# One sync at a time per user
+_sync_locks: Dict[str, asyncio.Lock] = {}
+# Selected calendar ids per user: (expires_at, ids)
+_calendar_lists: Dict[str, Tuple[float, List[str]]] = {}
+
+
+def parse_event_time(value: dict) -> Tuple[Optional[str], Optional[datetime], bool]:
+    """Raw value, naive UTC datetime and all-day flag for an event start/end"""
+    if not value:
+        return None, None, False
+    if "dateTime" in value:
+        raw = value["dateTime"]
+        parsed = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+        if parsed.tzinfo:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return raw, parsed, False
+    raw = value.get("date")
+    return raw, datetime.fromisoformat(raw) if raw else None, True
+
+
+def event_row(user_uuid: uuid.UUID, calendar_id: str, event: dict) -> dict:
+    start, start_at, all_day = parse_event_time(event.get("start"))
+    end, end_at, _ = parse_event_time(event.get("end"))
+    return {
+        "user_id": user_uuid,
+        "calendar_id": calendar_id,
+        "event_id": event["id"],
+        "title": event.get("summary", "No Title"),
+        "description": event.get("description", ""),
+        "location": event.get("location", ""),
+        "start": start,
+        "end": end,
+        "start_at": start_at,
+        "end_at": end_at,
+        "all_day": 1 if all_day else 0,
+        "updated_at": datetime.utcnow(),
+    }
+
+
+def to_event(row: CalendarEvent) -> dict:
+    return {
+        "id": row.event_id,
+        "title": row.title or "No Title",
+        "start": row.start,
+        "end": row.end,
+        "description": row.description or "",
+        "location": row.location or "",
+    }
+
+
+def to_live_event(event: dict) -> dict:
+    start = event.get("start", {})
+    end = event.get("end", {})
+    return {
+        "id": event["id"],
+        "title": event.get("summary", "No Title"),
+        "start": start.get("dateTime", start.get("date")),
+        "end": end.get("dateTime", end.get("date")),
+        "description": event.get("description", ""),
+        "location": event.get("location", ""),
+    }
+
+
+class CalendarSyncService:
+    """Per-user event store kept current with Calendar's incremental sync tokens"""
+
+    @staticmethod
+    async def upsert_events(user_id: str, calendar_id: str, events: List[dict], db: AsyncSession):
+        """Write events into the store; cancelled events are removed"""
+        user_uuid = to_uuid(user_id)
+        cancelled = [e["id"] for e in events if e.get("status") == "cancelled"]
+        rows = [event_row(user_uuid, calendar_id, e) for e in events if e.get("status") != "cancelled"]
+
+        for i in range(0, len(cancelled), CALENDAR_UPSERT_CHUNK):
+            await db.execute(delete(CalendarEvent).where(
+                CalendarEvent.user_id == user_uuid,
+                CalendarEvent.calendar_id == calendar_id,
+                CalendarEvent.event_id.in_(cancelled[i:i + CALENDAR_UPSERT_CHUNK])
+            ))
+        for i in range(0, len(rows), CALENDAR_UPSERT_CHUNK):
+            chunk = rows[i:i + CALENDAR_UPSERT_CHUNK]
+            stmt = insert(CalendarEvent).values(chunk)
+            stmt = stmt.on_conflict_do_update(
+                constraint="uq_calendar_events_event",
+                set_={col: stmt.excluded[col] for col in chunk[0] if col not in ("user_id", "calendar_id", "event_id")}
+            )
+            await db.execute(stmt)
+
+    @staticmethod
+    async def iter_pages(service, params: dict) -> AsyncIterator[dict]:
+        """Yield each events.list page as it arrives, following page tokens"""
+        page_token = None
+        while True:
+            result = await google_api.execute(service.events().list(**params, pageToken=page_token))
+            yield result
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                return
+
+    @staticmethod
+    async def _list_changes(service, calendar_id: str, sync_token: Optional[str]) -> Tuple[List[dict], Optional[str]]:
+        """Every page of a full listing (no token) or of the changes since ``sync_token``"""
+        params = {
+            "calendarId": calendar_id,
+            "singleEvents": True,
+            "maxResults": CALENDAR_PAGE_SIZE,
+            "fields": EVENT_FIELDS,
+        }
+        if sync_token:
+            params["syncToken"] = sync_token
+        else:
+            now = datetime.utcnow()
+            params["timeMin"] = (now - timedelta(days=CALENDAR_SYNC_PAST_DAYS)).isoformat() + "Z"
+            params["timeMax"] = (now + timedelta(days=CALENDAR_SYNC_FUTURE_DAYS)).isoformat() + "Z"
+
+        events, next_token = [], None
+        async for page in CalendarSyncService.iter_pages(service, params):
+            events.extend(page.get("items", []))
+            next_token = page.get("nextSyncToken", next_token)
+        return events, next_token
+
+    @staticmethod
+    async def _fetch_calendar(service, user_id: str, calendar_id: str, sync_token: Optional[str]) -> Tuple[List[dict], Optional[str], bool]:
+        """(events, next sync token, whether this was a full listing) for one calendar"""
+        try:
+            events, next_token = await CalendarSyncService._list_changes(service, calendar_id, sync_token)
+            return events, next_token, not sync_token
+        except HttpError as e:
+            # Sync token invalidated by Google: resync this calendar from scratch
+            if e.resp.status != 410 or not sync_token:
+                raise
+            logger.info(f"Calendar sync token expired for {user_id}/{calendar_id}, running full sync")
+            events, next_token = await CalendarSyncService._list_changes(service, calendar_id, None)
+            return events, next_token, True
+
+    @staticmethod
+    async def list_calendars(user_id: str, service) -> List[str]:
+        """Ids of the calendars the user has selected in Google Calendar; the primary one is always 'primary'"""
+        cached = _calendar_lists.get(str(user_id))
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        calendar_ids, page_token = [], None
+        while True:
+            result = await google_api.execute(service.calendarList().list(
+                pageToken=page_token,
+                fields="items(id,primary,selected),nextPageToken"
+            ))
+            for item in result.get("items", []):
+                if item.get("primary"):
+                    calendar_ids.insert(0, "primary")
+                elif item.get("selected"):
+                    calendar_ids.append(item["id"])
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                break
+        if "primary" not in calendar_ids:
+            calendar_ids.insert(0, "primary")
+
+        _calendar_lists[str(user_id)] = (time.monotonic() + CALENDAR_LIST_TTL, calendar_ids)
+        return calendar_ids
+
+    @staticmethod
+    def covered_days() -> int:
+        """Days ahead the store is guaranteed to hold after a sync; longer ranges need a live listing"""
+        return CALENDAR_SYNC_FUTURE_DAYS // 2
+
+    @staticmethod
+    async def sync(user_id: str, db: AsyncSession, service=None, force: bool = False) -> int:
+        """Bring the store up to date for every selected calendar.
+
+        Calendars are fetched concurrently (incremental when we hold a sync token, full otherwise)
+        and written in one transaction. Calendars synced within ``CALENDAR_SYNC_TTL`` seconds are
+        skipped unless ``force``. A full sync covers ``CALENDAR_SYNC_FUTURE_DAYS`` ahead and is
+        repeated once less than half of that window remains, so the store always holds at least
+        ``covered_days()`` of upcoming events.
+        """
+        lock = _sync_locks.setdefault(str(user_id), asyncio.Lock())
+        async with lock:
+            user_uuid = to_uuid(user_id)
+            stmt = select(CalendarSyncState).where(CalendarSyncState.user_id == user_uuid)
+            states = {state.calendar_id: state for state in (await db.execute(stmt)).scalars().all()}
+            now = datetime.utcnow()
+
+            def in_window(state: Optional[CalendarSyncState]) -> bool:
+                return bool(state and state.synced_until
+                            and state.synced_until - now >= timedelta(days=CalendarSyncService.covered_days()))
+
+            def is_fresh(state: Optional[CalendarSyncState]) -> bool:
+                return bool(state and state.sync_token and state.last_synced_at and in_window(state)
+                            and now - state.last_synced_at < timedelta(seconds=CALENDAR_SYNC_TTL))
+
+            if not force and states and all(is_fresh(state) for state in states.values()):
+                return 0
+
+            if service is None:
+                from .calendar_service import CalendarService
+                service = await CalendarService.get_service(user_id, db)
+
+            calendar_ids = await CalendarSyncService.list_calendars(user_id, service)
+            stale = [cid for cid in calendar_ids if force or not is_fresh(states.get(cid))]
+
+            semaphore = asyncio.Semaphore(CALENDAR_FETCH_CONCURRENCY)
+
+            async def fetch(calendar_id: str):
+                async with semaphore:
+                    state = states.get(calendar_id)
+                    # Past the window's midpoint the token only tracks an ageing range: list it afresh
+                    sync_token = state.sync_token if state and in_window(state) else None
+                    return await CalendarSyncService._fetch_calendar(service, user_id, calendar_id, sync_token)
+
+            fetched = await asyncio.gather(*(fetch(cid) for cid in stale))
+
+            # Calendars the user deselected no longer contribute events
+            removed = [cid for cid in states if cid not in calendar_ids]
+            if removed:
+                await db.execute(delete(CalendarEvent).where(
+                    CalendarEvent.user_id == user_uuid, CalendarEvent.calendar_id.in_(removed)
+                ))
+                await db.execute(delete(CalendarSyncState).where(
+                    CalendarSyncState.user_id == user_uuid, CalendarSyncState.calendar_id.in_(removed)
+                ))
+
+            changed = 0
+            for calendar_id, (events, next_token, full) in zip(stale, fetched):
+                if full:
+                    await db.execute(delete(CalendarEvent).where(
+                        CalendarEvent.user_id == user_uuid,
+                        CalendarEvent.calendar_id == calendar_id
+                    ))
+                await CalendarSyncService.upsert_events(user_id, calendar_id, events, db)
+
+                state = states.get(calendar_id)
+                if state is None:
+                    state = CalendarSyncState(user_id=user_uuid, calendar_id=calendar_id)
+                    db.add(state)
+                state.sync_token = next_token
+                state.last_synced_at = now
+                if full:
+                    state.synced_until = now + timedelta(days=CALENDAR_SYNC_FUTURE_DAYS)
+                changed += len(events)
+
+            await db.commit()
+            return changed
+
+    @staticmethod
+    async def stream_events(user_id: str, service, start: datetime, end: datetime) -> AsyncIterator[dict]:
+        """Live events overlapping [start, end) (naive UTC) across all selected calendars, in start order.
+
+        Each calendar is paged concurrently (bounded by ``CALENDAR_FETCH_CONCURRENCY``) and the
+        per-calendar streams are merged with a heap, so events are yielded as soon as every
+        calendar has delivered a page that covers them.
+        """
+        calendar_ids = await CalendarSyncService.list_calendars(user_id, service)
+        semaphore = asyncio.Semaphore(CALENDAR_FETCH_CONCURRENCY)
+
+        def start_key(event: dict) -> str:
+            _, parsed, _ = parse_event_time(event.get("start"))
+            return parsed.isoformat() if parsed else ""
+
+        queues = [asyncio.Queue() for _ in calendar_ids]
+
+        async def produce(calendar_id: str, queue: asyncio.Queue):
+            try:
+                params = {
+                    "calendarId": calendar_id,
+                    "timeMin": start.isoformat() + "Z",
+                    "timeMax": end.isoformat() + "Z",
+                    "singleEvents": True,
+                    "orderBy": "startTime",
+                    "maxResults": CALENDAR_PAGE_SIZE,
+                    "fields": STREAM_FIELDS,
+                }
+                async with semaphore:
+                    async for page in CalendarSyncService.iter_pages(service, params):
+                        queue.put_nowait(page.get("items", []))
+            except Exception as e:
+                queue.put_nowait(e)
+            finally:
+                queue.put_nowait(None)
+
+        producers = [asyncio.create_task(produce(cid, q)) for cid, q in zip(calendar_ids, queues)]
+        try:
+            buffers: List[List[dict]] = [[] for _ in calendar_ids]
+            heap: List[tuple] = []
+            seen = set()
+
+            async def refill(index: int) -> bool:
+                """Load the next non-empty page for one calendar; False when it is exhausted"""
+                while not buffers[index]:
+                    page = await queues[index].get()
+                    if page is None:
+                        return False
+                    if isinstance(page, Exception):
+                        raise page
+                    buffers[index] = list(reversed(page))
+                return True
+
+            for index in range(len(calendar_ids)):
+                if await refill(index):
+                    event = buffers[index].pop()
+                    heapq.heappush(heap, (start_key(event), index, event))
+
+            while heap:
+                _, index, event = heapq.heappop(heap)
+                # The same event can appear on several of the user's calendars
+                if event["id"] not in seen:
+                    seen.add(event["id"])
+                    if event.get("status") != "cancelled":
+                        yield to_live_event(event)
+                if await refill(index):
+                    nxt = buffers[index].pop()
+                    heapq.heappush(heap, (start_key(nxt), index, nxt))
+        finally:
+            for task in producers:
+                task.cancel()
+
+    @staticmethod
+    async def get_range(user_id: str, start: datetime, end: datetime, db: AsyncSession) -> List[dict]:
+        """Stored events overlapping [start, end) across the user's calendars, ordered by start time"""
+        stmt = select(CalendarEvent).where(
+            CalendarEvent.user_id == to_uuid(user_id),
+            CalendarEvent.start_at < end,
+            CalendarEvent.end_at > start
+        ).order_by(CalendarEvent.start_at, CalendarEvent.event_id)
+        result = await db.execute(stmt)
+        return [to_event(row) for row in result.scalars().all()]
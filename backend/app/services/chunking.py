@@ -0,0 +1,30 @@
+from typing import List
+
+
+def chunk_text(text: str, chunk_size: int = 1500, overlap: int = 200) -> List[str]:
+    """Split text into overlapping chunks, preferring paragraph and sentence boundaries"""
+    text = (text or "").strip()
+    if not text:
+        return []
+    if len(text) <= chunk_size:
+        return [text]
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # Back off to the nearest natural break in the second half of the window
+            window = text[start:end]
+            for sep in ("\n\n", "\n", ". ", " "):
+                cut = window.rfind(sep)
+                if cut > chunk_size // 2:
+                    end = start + cut + len(sep)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
@@ -0,0 +1,275 @@
+import asyncio
+import difflib
+import logging
+import os
+import re
+from collections import OrderedDict
+from datetime import datetime
+from email.utils import getaddresses
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.database import AsyncSessionLocal
+from ..db.models import Contact, User
+from .ids import to_uuid
+
+logger = logging.getLogger("cortex-api")
+
+CONTACT_TRIE_CACHE_USERS = int(os.getenv("CONTACT_TRIE_CACHE_USERS", "256"))
+CONTACT_LOAD_LIMIT = 5000  # Most frequent contacts loaded into a user's trie
+CONTACT_FLUSH_INTERVAL = int(os.getenv("CONTACT_FLUSH_INTERVAL", "30"))  # seconds
+CONTACT_SEEN_MESSAGES = 50_000  # Message ids remembered so polling doesn't inflate frequencies
+CONTACT_HEADERS = ("from", "to", "cc")  # Compared lower-case: header names are case-insensitive
+CONTACT_TRIE_DEPTH = int(os.getenv("CONTACT_TRIE_DEPTH", "6"))  # Prefix chars indexed; longer ones are filtered
+
+TOKEN_SPLIT = re.compile(r"[^a-z0-9]+")
+
+
+def _tokens(text: str) -> List[str]:
+    return [t for t in TOKEN_SPLIT.split((text or "").lower()) if t]
+
+
+class _TrieNode:
+    __slots__ = ("children", "ids")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.ids: Set[int] = set()
+
+
+class ContactTrie:
+    """Prefix index over contact name tokens, email local-part tokens and full addresses.
+
+    Nodes hold small integer contact ids and only the first ``depth`` characters of each token
+    are indexed, so memory grows with contacts x tokens rather than with total token length;
+    longer prefixes are checked against the candidates' own tokens.
+    """
+
+    def __init__(self, depth: int = CONTACT_TRIE_DEPTH):
+        self.depth = depth
+        self.root = _TrieNode()
+        self.contacts: Dict[str, dict] = {}  # email -> {"email", "name", "frequency"}
+        self.emails: List[str] = []  # contact id -> email
+        self.contact_tokens: List[Set[str]] = []  # contact id -> indexed tokens
+        self.tokens: Set[str] = set()
+        self.owner: Optional[str] = None  # The user's own address, never indexed
+
+    def _index(self, email: str, text: str):
+        contact_id = self.contacts[email]["id"]
+        for token in _tokens(text) + ([email] if text == email else []):
+            self.tokens.add(token)
+            self.contact_tokens[contact_id].add(token)
+            node = self.root
+            for char in token[:self.depth]:
+                node = node.children.setdefault(char, _TrieNode())
+                node.ids.add(contact_id)
+
+    def add(self, email: str, name: Optional[str], count: int = 1):
+        contact = self.contacts.get(email)
+        if contact is None:
+            self.contacts[email] = {"id": len(self.emails), "email": email, "name": name, "frequency": count}
+            self.emails.append(email)
+            self.contact_tokens.append(set())
+            self._index(email, email)
+            self._index(email, email.split("@")[0])
+            if name:
+                self._index(email, name)
+            return
+        contact["frequency"] += count
+        if name and not contact["name"]:
+            contact["name"] = name
+            self._index(email, name)
+
+    def prefix(self, prefix: str) -> Set[str]:
+        """Emails with a token starting with ``prefix``"""
+        node = self.root
+        for char in prefix[:self.depth]:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        ids = node.ids
+        if len(prefix) > self.depth:
+            ids = [i for i in ids if any(t.startswith(prefix) for t in self.contact_tokens[i])]
+        return {self.emails[i] for i in ids}
+
+    def search(self, query: str, limit: int = 5) -> List[dict]:
+        """Prefix match on every query token; falls back to fuzzy token matching for typos"""
+        query_tokens = _tokens(query) if "@" not in query else [query.lower()]
+        if not query_tokens:
+            return []
+
+        matches: Optional[Set[str]] = None
+        for token in query_tokens:
+            found = self.prefix(token)
+            matches = set(found) if matches is None else matches & found
+        fuzzy = False
+
+        if not matches:
+            fuzzy = True
+            matches = set()
+            for token in query_tokens:
+                for close in difflib.get_close_matches(token, self.tokens, n=5, cutoff=0.75):
+                    matches |= self.prefix(close)
+
+        ranked = sorted((self.contacts[e] for e in matches), key=lambda c: (-c["frequency"], c["email"]))
+        return [{"email": c["email"], "name": c["name"], "frequency": c["frequency"], "fuzzy": fuzzy}
+                for c in ranked[:limit]]
+
+
+class ContactDirectory:
+    """Per-user contact index built from mail headers.
+
+    Observations are buffered in memory and flushed to Postgres in the background; hot users get
+    an in-memory trie (LRU-bounded) for prefix and fuzzy lookups.
+    """
+
+    def __init__(self, max_users: int = CONTACT_TRIE_CACHE_USERS):
+        self.max_users = max_users
+        self._tries: "OrderedDict[str, ContactTrie]" = OrderedDict()
+        self._pending: Dict[tuple, list] = {}  # (user_id, email) -> [name, count, last_seen]
+        self._flushing: Dict[tuple, list] = {}  # The batch a flush is writing right now
+        self._seen: "OrderedDict[tuple, None]" = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    def record(self, user_id: str, message_id: str, headers: List[dict]):
+        """Count the addresses in a message's From/To/Cc headers (once per message)"""
+        user_id = str(user_id)
+        seen_key = (user_id, message_id)
+        if seen_key in self._seen:
+            return
+        self._seen[seen_key] = None
+        if len(self._seen) > CONTACT_SEEN_MESSAGES:
+            self._seen.popitem(last=False)
+
+        values = [h["value"] for h in headers if h.get("name", "").lower() in CONTACT_HEADERS]
+        self.record_addresses(user_id, values)
+
+    def record_addresses(self, user_id: str, header_values: Iterable[str]):
+        user_id = str(user_id)
+        trie = self._tries.get(user_id)
+        now = datetime.utcnow()
+        for name, address in getaddresses(list(header_values)):
+            email = address.strip().lower()
+            if "@" not in email:
+                continue
+            if trie is not None and email == trie.owner:
+                continue
+            name = name.strip().strip('"') or None
+            pending = self._pending.setdefault((user_id, email), [None, 0, now])
+            pending[0] = name or pending[0]
+            pending[1] += 1
+            pending[2] = now
+            if trie is not None:
+                trie.add(email, name)
+
+    def _merge_pending(self, pending: Dict[tuple, list]):
+        for key, (name, count, last_seen) in pending.items():
+            current = self._pending.get(key)
+            if current is None:
+                self._pending[key] = [name, count, last_seen]
+            else:
+                current[0] = current[0] or name
+                current[1] += count
+                current[2] = max(current[2], last_seen)
+
+    async def flush(self, db: AsyncSession):
+        """Write buffered observations to Postgres as frequency increments.
+
+        Observations for unknown users and for the user's own address are dropped; if the write
+        fails, the batch is put back to be retried on the next flush.
+        """
+        async with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            self._flushing = pending
+
+            # Different string forms of one user id must collapse into one row per contact,
+            # or ON CONFLICT would hit the same row twice
+            aggregated: Dict[tuple, list] = {}
+            for (user_id, email), (name, count, last_seen) in pending.items():
+                key = (to_uuid(user_id), email[:320])
+                current = aggregated.setdefault(key, [None, 0, last_seen])
+                current[0] = name or current[0]
+                current[1] += count
+                current[2] = max(current[2], last_seen)
+
+            try:
+                owners = dict((await db.execute(select(User.id, User.email).where(
+                    User.id.in_({user_uuid for user_uuid, _ in aggregated})
+                ))).all())
+                rows = [
+                    {"user_id": user_uuid, "email": email, "name": name[:255] if name else None,
+                     "frequency": count, "last_seen": last_seen}
+                    for (user_uuid, email), (name, count, last_seen) in aggregated.items()
+                    if user_uuid in owners and email != (owners[user_uuid] or "").lower()
+                ]
+                if rows:
+                    stmt = insert(Contact).values(rows)
+                    stmt = stmt.on_conflict_do_update(
+                        constraint="uq_contacts_user_email",
+                        set_={
+                            "frequency": Contact.frequency + stmt.excluded.frequency,
+                            "name": func.coalesce(stmt.excluded.name, Contact.name),
+                            "last_seen": stmt.excluded.last_seen,
+                        }
+                    )
+                    await db.execute(stmt)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                self._merge_pending(pending)
+                raise
+            finally:
+                self._flushing = {}
+
+    async def _get_trie(self, user_id: str, db: AsyncSession) -> ContactTrie:
+        trie = self._tries.get(user_id)
+        if trie is not None:
+            self._tries.move_to_end(user_id)
+            return trie
+
+        # Read-only on the caller's session: observations not yet flushed are added from memory
+        user_uuid = to_uuid(user_id)
+        stmt = select(Contact.email, Contact.name, Contact.frequency).where(
+            Contact.user_id == user_uuid
+        ).order_by(Contact.frequency.desc()).limit(CONTACT_LOAD_LIMIT)
+        trie = ContactTrie()
+        owner = (await db.execute(select(User.email).where(User.id == user_uuid))).scalar_one_or_none()
+        trie.owner = owner.lower() if owner else None
+        for row in (await db.execute(stmt)).all():
+            if row.email != trie.owner:
+                trie.add(row.email, row.name, row.frequency or 0)
+        for buffer in (self._flushing, self._pending):
+            for (pending_user, email), (name, count, _) in list(buffer.items()):
+                if email != trie.owner and to_uuid(pending_user) == user_uuid:
+                    trie.add(email, name, count)
+
+        self._tries[user_id] = trie
+        if len(self._tries) > self.max_users:
+            self._tries.popitem(last=False)
+        return trie
+
+    async def lookup(self, user_id: str, query: str, db: AsyncSession, limit: int = 5) -> List[dict]:
+        """Resolve a name, partial name or address to known contacts, most frequent first"""
+        trie = await self._get_trie(str(user_id), db)
+        return trie.search(query, limit)
+
+    async def run_flush_loop(self):
+        """Periodically persist buffered observations"""
+        while True:
+            await asyncio.sleep(CONTACT_FLUSH_INTERVAL)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self.flush(db)
+            except Exception as e:
+                logger.error(f"Contact flush error: {e}")
+
+    def metrics(self) -> dict:
+        return {"cached_users": len(self._tries), "pending": len(self._pending)}
+
+
+contact_directory = ContactDirectory()
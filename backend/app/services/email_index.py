@@ -0,0 +1,138 @@
+import os
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import select, delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.models import GmailMessage, EmailEmbedding
+from .chunking import chunk_text
+from .memory_service import embedding_cache, nearest_rows
+from .embeddings import embedding_provider
+from .ids import to_uuid
+
+EMAIL_INDEX_BATCH_SIZE = int(os.getenv("EMAIL_INDEX_BATCH_SIZE", "25"))  # messages per embedding call
+EMAIL_INDEX_MAX_PER_RUN = int(os.getenv("EMAIL_INDEX_MAX_PER_RUN", "200"))
+EMAIL_CHUNK_CHARS = 1500
+EMAIL_CHUNK_OVERLAP = 200
+EMAIL_MAX_CHUNKS = 8  # Long newsletters don't need to be embedded end to end
+
+
+class EmailIndexService:
+    """Incremental semantic index over mirrored email bodies"""
+
+    @staticmethod
+    async def index_batch(user_id: str, db: AsyncSession, batch_size: int = EMAIL_INDEX_BATCH_SIZE) -> int:
+        """Embed the next batch of mirrored messages that haven't been indexed yet"""
+        user_uuid = to_uuid(user_id)
+        stmt = select(GmailMessage).where(
+            GmailMessage.user_id == user_uuid,
+            GmailMessage.indexed_at.is_(None)
+        ).order_by(GmailMessage.internal_date.desc().nulls_last()).limit(batch_size)
+        result = await db.execute(stmt)
+        messages = result.scalars().all()
+        if not messages:
+            return 0
+
+        rows = []
+        texts = []
+        for msg in messages:
+            header = f"Subject: {msg.subject}\nFrom: {msg.sender}\nTo: {msg.recipients}\n\n"
+            chunks = chunk_text(msg.body_text or msg.snippet or "", EMAIL_CHUNK_CHARS, EMAIL_CHUNK_OVERLAP)
+            for index, chunk in enumerate((chunks or [""])[:EMAIL_MAX_CHUNKS]):
+                content = header + chunk
+                texts.append(content)
+                rows.append({
+                    "user_id": user_uuid,
+                    "message_id": msg.message_id,
+                    "thread_id": msg.thread_id,
+                    "chunk_index": index,
+                    "content": content,
+                })
+
+        # One embedding round trip for the whole batch
+        embeddings = await embedding_provider.aembed_documents(texts)
+
+        message_ids = [m.message_id for m in messages]
+        await db.execute(delete(EmailEmbedding).where(
+            EmailEmbedding.user_id == user_uuid,
+            EmailEmbedding.message_id.in_(message_ids)
+        ))
+        db.add_all(
+            EmailEmbedding(
+                embedding=embedding,
+                embedding_model=embedding_provider.model,
+                embedding_dim=embedding_provider.dimensions,
+                **row
+            )
+            for row, embedding in zip(rows, embeddings)
+        )
+        await db.execute(update(GmailMessage).where(
+            GmailMessage.user_id == user_uuid,
+            GmailMessage.message_id.in_(message_ids)
+        ).values(indexed_at=datetime.utcnow()))
+        await db.commit()
+        return len(messages)
+
+    @staticmethod
+    async def requeue_other_models(db: AsyncSession) -> int:
+        """Mark messages embedded by a different embedding model for re-indexing; returns how many"""
+        stale = select(EmailEmbedding.message_id).where(
+            EmailEmbedding.user_id == GmailMessage.user_id,
+            EmailEmbedding.message_id == GmailMessage.message_id,
+            EmailEmbedding.embedding_model.is_distinct_from(embedding_provider.model)
+        ).exists()
+        result = await db.execute(update(GmailMessage).where(
+            GmailMessage.indexed_at.isnot(None), stale
+        ).values(indexed_at=None))
+        await db.commit()
+        return result.rowcount
+
+    @staticmethod
+    async def index_pending(user_id: str, db: AsyncSession, max_messages: int = EMAIL_INDEX_MAX_PER_RUN) -> int:
+        """Index new mirrored messages in batches, up to a per-run cap"""
+        indexed = 0
+        while indexed < max_messages:
+            count = await EmailIndexService.index_batch(
+                user_id, db, batch_size=min(EMAIL_INDEX_BATCH_SIZE, max_messages - indexed)
+            )
+            if not count:
+                break
+            indexed += count
+        return indexed
+
+    @staticmethod
+    async def semantic_search(user_id: str, query: str, db: AsyncSession, limit: int = 5) -> List[dict]:
+        """Find emails by meaning with a single nearest-neighbour lookup"""
+        query_embedding = await embedding_cache.aembed_query(query)
+        distance = EmailEmbedding.embedding.cosine_distance(query_embedding)
+
+        # Over-fetch chunks so several hits on one message still leave `limit` distinct emails
+        stmt = select(EmailEmbedding, GmailMessage, distance.label("distance")).join(
+            GmailMessage,
+            (GmailMessage.user_id == EmailEmbedding.user_id) & (GmailMessage.message_id == EmailEmbedding.message_id)
+        ).where(
+            EmailEmbedding.user_id == to_uuid(user_id),
+            EmailEmbedding.embedding_model == embedding_provider.model
+        ).order_by(distance).limit(limit * 4)
+
+        emails = []
+        seen = set()
+        for chunk, msg, dist in await nearest_rows(db, stmt, limit * 4):
+            if msg.message_id in seen:
+                continue
+            seen.add(msg.message_id)
+            body = chunk.content.split("\n\n", 1)[-1]
+            emails.append({
+                "id": msg.message_id,
+                "thread_id": msg.thread_id,
+                "subject": msg.subject,
+                "from": msg.sender,
+                "to": msg.recipients,
+                "date": msg.date,
+                "preview": body[:300] + "..." if len(body) > 300 else body,
+                "score": round(1 - float(dist), 4)
+            })
+            if len(emails) >= limit:
+                break
+        return emails
@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.postgresql import insert
+
+from ..db.database import AsyncSessionLocal
+from ..db.models import EmbeddingCacheEntry
+
+logger = logging.getLogger("cortex-api")
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))  # in-process entries
+EMBEDDING_CACHE_PERSIST = os.getenv("EMBEDDING_CACHE_PERSIST", "1") == "1"
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return WHITESPACE.sub(" ", unicodedata.normalize("NFC", text or "")).strip()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier cache in front of an embeddings model: in-process LRU, then Postgres.
+
+    Entries are keyed by model name (and query vs document task, which embed differently) plus
+    the hash of the normalized text, so switching models simply misses; ``purge_stale`` drops
+    rows written by other models. Local models only use the in-process tier.
+    """
+
+    def __init__(self, model, max_entries: int = EMBEDDING_CACHE_SIZE, persist: bool = EMBEDDING_CACHE_PERSIST):
+        self.model = model
+        self.model_name = getattr(model, "model", None) or type(model).__name__
+        self.max_entries = max_entries
+        self.persist = persist
+        self.local = getattr(model, "local", False)  # Recomputing beats a Postgres round trip
+        self._lru: "OrderedDict[tuple, List[float]]" = OrderedDict()
+        self._stats = {"lru_hits": 0, "db_hits": 0, "misses": 0, "db_errors": 0}
+
+    def _key(self, task: str) -> str:
+        return f"{self.model_name}:{task}"[:128]
+
+    def _remember(self, key: tuple, embedding: List[float]):
+        self._lru[key] = embedding
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    async def _load(self, model_key: str, hashes: List[str]) -> Dict[str, List[float]]:
+        if not self.persist or self.local or not hashes:
+            return {}
+        try:
+            async with AsyncSessionLocal() as db:
+                stmt = select(EmbeddingCacheEntry.text_hash, EmbeddingCacheEntry.embedding).where(
+                    EmbeddingCacheEntry.model == model_key,
+                    EmbeddingCacheEntry.text_hash.in_(hashes)
+                )
+                rows = (await db.execute(stmt)).all()
+            return {row.text_hash: [float(x) for x in row.embedding] for row in rows}
+        except Exception as e:
+            self._stats["db_errors"] += 1
+            logger.warning(f"Embedding cache read failed: {e}")
+            return {}
+
+    async def _save(self, model_key: str, entries: Dict[str, List[float]]):
+        if not self.persist or self.local or not entries:
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(EmbeddingCacheEntry).values([
+                    {"model": model_key, "text_hash": h, "embedding": e} for h, e in entries.items()
+                ]).on_conflict_do_nothing())
+                await db.commit()
+        except Exception as e:
+            self._stats["db_errors"] += 1
+            logger.warning(f"Embedding cache write failed: {e}")
+
+    async def _embed(self, texts: List[str], task: str) -> List[List[float]]:
+        model_key = self._key(task)
+        hashes = [text_hash(t) for t in texts]
+        found: Dict[str, List[float]] = {}
+
+        for h in hashes:
+            cached = self._lru.get((model_key, h))
+            if cached is not None:
+                self._lru.move_to_end((model_key, h))
+                found[h] = cached
+                self._stats["lru_hits"] += 1
+
+        missing = [h for h in dict.fromkeys(hashes) if h not in found]
+        loaded = await self._load(model_key, missing)
+        self._stats["db_hits"] += len(loaded)
+        for h, embedding in loaded.items():
+            found[h] = embedding
+            self._remember((model_key, h), embedding)
+
+        pending = {}
+        for t, h in zip(texts, hashes):
+            if h not in found and h not in pending:
+                pending[h] = normalize_text(t)
+        if pending:
+            self._stats["misses"] += len(pending)
+            if task == "query":
+                computed = [await self.model.aembed_query(t) for t in pending.values()]
+            else:
+                computed = await self.model.aembed_documents(list(pending.values()))
+            new_entries = dict(zip(pending, computed))
+            for h, embedding in new_entries.items():
+                found[h] = embedding
+                self._remember((model_key, h), embedding)
+            await self._save(model_key, new_entries)
+
+        return [found[h] for h in hashes]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self._embed([text], "query"))[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._embed(texts, "document") if texts else []
+
+    async def purge_stale(self) -> Optional[int]:
+        """Delete persisted entries written by any other embedding model"""
+        if not self.persist:
+            return None
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(delete(EmbeddingCacheEntry).where(
+                EmbeddingCacheEntry.model.notin_([self._key("query"), self._key("document")])
+            ))
+            await db.commit()
+        return result.rowcount
+
+    def metrics(self) -> dict:
+        lookups = self._stats["lru_hits"] + self._stats["db_hits"] + self._stats["misses"]
+        hits = self._stats["lru_hits"] + self._stats["db_hits"]
+        return {
+            **self._stats,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "lru_entries": len(self._lru),
+            "model": self.model_name,
+        }
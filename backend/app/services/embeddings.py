@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import os
+import re
+import zlib
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("cortex-api")
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "google")  # google | hashing
+EMBEDDING_DIMENSIONS = 768  # Width of the Vector columns every provider must fill
+GOOGLE_EMBEDDING_MODEL = os.getenv("GOOGLE_EMBEDDING_MODEL", "models/embedding-001")
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "2"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_BATCH_WINDOW = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "2")) / 1000  # seconds
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def hash_features(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> np.ndarray:
+    """Signed feature hashing of word unigrams, bigrams and character trigrams, L2-normalized.
+
+    Deterministic across processes (crc32, not ``hash``), so vectors stored by one worker are
+    comparable with queries embedded by another.
+    """
+    words = TOKEN.findall((text or "").lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"<{word}>"
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+
+    vector = np.zeros(dimensions, dtype=np.float32)
+    if not features:
+        return vector
+    hashes = np.array([zlib.crc32(f.encode()) for f in features], dtype=np.uint32)
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+    np.add.at(vector, (hashes % dimensions).astype(np.int64), signs)
+
+    # Sublinear term frequency so repeated words don't dominate
+    vector = np.sign(vector) * np.log1p(np.abs(vector))
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+def hash_embed_batch(texts: List[str], dimensions: int = EMBEDDING_DIMENSIONS) -> List[List[float]]:
+    return [hash_features(t, dimensions).tolist() for t in texts]
+
+
+class MicroBatcher:
+    """Coalesces concurrent embedding calls into one batch.
+
+    Callers arriving within ``window`` seconds of each other (or until ``max_batch`` texts are
+    queued) share a single call of ``run``, which amortizes pool hand-offs across requests.
+    """
+
+    def __init__(self, run: Callable[[List[str]], Awaitable[List[List[float]]]],
+                 max_batch: int = EMBEDDING_BATCH_SIZE, window: float = EMBEDDING_BATCH_WINDOW):
+        self.run = run
+        self.max_batch = max_batch
+        self.window = window
+        self._pending: List[Tuple[List[str], asyncio.Future]] = []
+        self._queued = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._stats = {"batches": 0, "texts": 0}
+
+    async def submit(self, texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((texts, future))
+        self._queued += len(texts)
+        if self._queued >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._queued = self._pending, [], 0
+        if batch:
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[List[str], asyncio.Future]]):
+        texts = [t for item, _ in batch for t in item]
+        self._stats["batches"] += 1
+        self._stats["texts"] += len(texts)
+        try:
+            vectors = await self.run(texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for item, future in batch:
+            if not future.done():
+                future.set_result(vectors[offset:offset + len(item)])
+            offset += len(item)
+
+    def metrics(self) -> dict:
+        return {
+            **self._stats,
+            "avg_batch": round(self._stats["texts"] / self._stats["batches"], 2) if self._stats["batches"] else 0.0,
+        }
+
+
+class EmbeddingProvider(ABC):
+    """Turns text into vectors. ``model`` is recorded next to every stored vector so that
+    vectors from different models (or dimensions) are never compared. ``local`` providers are
+    cheaper to recompute than to look up, so caches skip their Postgres tier."""
+
+    model: str = ""
+    dimensions: int = EMBEDDING_DIMENSIONS
+    local: bool = False
+
+    @abstractmethod
+    async def aembed_query(self, text: str) -> List[float]:
+        ...
+
+    @abstractmethod
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        ...
+
+    def metrics(self) -> dict:
+        return {"model": self.model, "dimensions": self.dimensions}
+
+    def shutdown(self):
+        pass
+
+
+class GoogleEmbeddingProvider(EmbeddingProvider):
+    """Gemini embeddings over the network (the default)"""
+
+    def __init__(self, model: str = GOOGLE_EMBEDDING_MODEL):
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        self.model = model
+        self._client = GoogleGenerativeAIEmbeddings(model=model)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self._client.aembed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._client.aembed_documents(texts) if texts else []
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """Local CPU embeddings via feature hashing: no network, no model files.
+
+    Lexical rather than semantic, so it suits offline development, tests and benchmarks more
+    than production recall. Work runs on a small thread pool, micro-batched across callers.
+    """
+
+    local = True
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS, workers: int = EMBEDDING_WORKERS):
+        self.model = f"hashing-v1-{dimensions}"
+        self.dimensions = dimensions
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.workers = workers
+        self._batcher = MicroBatcher(self._embed)
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embedding")
+        return self._pool
+
+    async def _embed(self, texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_pool(), hash_embed_batch, texts, self.dimensions)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self._batcher.submit([text]))[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        chunks = [texts[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+        results = await asyncio.gather(*(self._batcher.submit(chunk) for chunk in chunks))
+        return [vector for chunk in results for vector in chunk]
+
+    def metrics(self) -> dict:
+        return {**super().metrics(), **self._batcher.metrics()}
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+PROVIDERS: Dict[str, Callable[[], EmbeddingProvider]] = {
+    "google": GoogleEmbeddingProvider,
+    "hashing": HashingEmbeddingProvider,
+}
+
+
+def create_embedding_provider(name: str = EMBEDDING_PROVIDER) -> EmbeddingProvider:
+    factory = PROVIDERS.get(name)
+    if factory is None:
+        raise ValueError(f"Unknown embedding provider '{name}' (expected one of: {', '.join(PROVIDERS)})")
+    provider = factory()
+    if provider.dimensions != EMBEDDING_DIMENSIONS:
+        raise ValueError(
+            f"Embedding provider '{name}' produces {provider.dimensions}-d vectors; "
+            f"the vector columns hold {EMBEDDING_DIMENSIONS}"
+        )
+    logger.info(f"Embedding provider: {provider.model} ({provider.dimensions} dims)")
+    return provider
+
+
+embedding_provider = create_embedding_provider()
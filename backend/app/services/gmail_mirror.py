@@ -0,0 +1,439 @@
+import asyncio
+import html
+import logging
+import os
+import re
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+
+from googleapiclient.errors import HttpError
+from sqlalchemy import select, delete, func, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.database import AsyncSessionLocal
+from ..db.models import GmailMessage, GmailSyncState, EmailEmbedding
+from .gmail_service import GmailService, get_header, extract_body
+from .google_api import google_api
+from .quota_governor import background_priority
+from .email_index import EmailIndexService
+from .contact_service import contact_directory
+from .ids import to_uuid
+
+logger = logging.getLogger("cortex-api")
+
+MIRROR_INITIAL_SYNC_LIMIT = int(os.getenv("GMAIL_MIRROR_INITIAL_SYNC_LIMIT", "500"))
+MIRROR_SYNC_INTERVAL = int(os.getenv("GMAIL_MIRROR_SYNC_INTERVAL", "120"))  # seconds
+MIRROR_FETCH_CONCURRENCY = int(os.getenv("GMAIL_MIRROR_FETCH_CONCURRENCY", "8"))
+MIRROR_MAX_BODY_CHARS = 100_000
+
+# Gmail `in:` / `is:` operators the mirror can answer, mapped to label ids
+IN_LABELS = {
+    "inbox": "INBOX",
+    "sent": "SENT",
+    "drafts": "DRAFT",
+    "trash": "TRASH",
+    "spam": "SPAM",
+    "starred": "STARRED",
+    "important": "IMPORTANT",
+}
+IS_LABELS = {
+    "unread": "UNREAD",
+    "starred": "STARRED",
+    "important": "IMPORTANT",
+    "sent": "SENT",
+}
+
+QUERY_TOKEN = re.compile(r'(?:(\w+):)?("[^"]*"|\S+)')
+RELATIVE_AGE = re.compile(r"^(\d+)([dmy])$")
+AGE_DAYS = {"d": 1, "m": 30, "y": 365}
+
+# Users with a background full sync in flight in this process
+_full_syncs: Set[str] = set()
+_tasks: Set[asyncio.Task] = set()
+
+
+def _parse_after(operator: str, value: str) -> Optional[datetime]:
+    """Lower date bound from ``after:``/``newer_than:`` values (2024/01/31, 2024-01-31, epoch seconds, 7d)"""
+    if operator == "newer_than":
+        match = RELATIVE_AGE.match(value.lower())
+        if not match:
+            return None
+        return datetime.utcnow() - timedelta(days=int(match.group(1)) * AGE_DAYS[match.group(2)])
+    if value.isdigit():
+        return datetime.utcfromtimestamp(int(value))
+    try:
+        return datetime.strptime(value.replace("-", "/"), "%Y/%m/%d")
+    except ValueError:
+        return None
+
+
+def parse_query(query: str) -> Optional[dict]:
+    """Parse a Gmail query into mirror filters, or None if it uses unsupported operators"""
+    parsed = {"from": [], "to": [], "subject": [], "labels": [], "exclude_labels": [], "text": [], "after": None}
+    for match in QUERY_TOKEN.finditer(query or ""):
+        operator, value = match.group(1), match.group(2).strip('"')
+        if not value:
+            continue
+        if operator is None:
+            # Boolean syntax, negation and grouping need Gmail's own evaluator
+            if value.upper() in ("OR", "AND") or value[0] in "-({}" or value.endswith(")"):
+                return None
+            parsed["text"].append(value)
+            continue
+
+        operator = operator.lower()
+        value_lower = value.lower()
+        if operator in ("from", "to", "subject"):
+            parsed[operator].append(value)
+        elif operator == "in" and value_lower in IN_LABELS:
+            parsed["labels"].append(IN_LABELS[value_lower])
+        elif operator == "is" and value_lower in IS_LABELS:
+            parsed["labels"].append(IS_LABELS[value_lower])
+        elif operator == "is" and value_lower == "read":
+            parsed["exclude_labels"].append("UNREAD")
+        elif operator in ("after", "newer_than"):
+            after = _parse_after(operator, value)
+            if after is None:
+                return None
+            parsed["after"] = max(parsed["after"] or after, after)
+        else:
+            return None
+
+    # Gmail leaves spam and trash out of results unless asked for explicitly
+    for label in ("SPAM", "TRASH"):
+        if label not in parsed["labels"]:
+            parsed["exclude_labels"].append(label)
+    return parsed
+
+
+def _message_row(user_uuid: uuid.UUID, msg_data: dict) -> dict:
+    payload = msg_data.get("payload", {})
+    headers = payload.get("headers", [])
+    internal_date = None
+    if msg_data.get("internalDate"):
+        internal_date = datetime.utcfromtimestamp(int(msg_data["internalDate"]) / 1000)
+
+    return {
+        "user_id": user_uuid,
+        "message_id": msg_data["id"],
+        "thread_id": msg_data["threadId"],
+        "history_id": int(msg_data["historyId"]) if msg_data.get("historyId") else None,
+        "subject": get_header(headers, "Subject", "No Subject"),
+        "sender": get_header(headers, "From", "Unknown"),
+        "recipients": get_header(headers, "To", "Unknown"),
+        "date": get_header(headers, "Date"),
+        "rfc_message_id": get_header(headers, "Message-ID") or None,
+        "internal_date": internal_date,
+        "label_ids": msg_data.get("labelIds", []),
+        "snippet": msg_data.get("snippet", ""),
+        "body_text": extract_body(payload)[:MIRROR_MAX_BODY_CHARS],
+        "updated_at": datetime.utcnow(),
+    }
+
+
+def _to_email(row: GmailMessage) -> dict:
+    """Same shape as the live listing (``gmail_service.to_listing``), previewing Gmail's snippet"""
+    return {
+        "id": row.message_id,
+        "thread_id": row.thread_id,
+        "subject": row.subject,
+        "from": row.sender,
+        "to": row.recipients,
+        "date": row.date,
+        "preview": html.unescape(row.snippet or ""),
+        "labels": row.label_ids or []
+    }
+
+
+class GmailMirrorService:
+    """Opt-in local mirror of Gmail kept current from the history API"""
+
+    @staticmethod
+    async def get_state(user_id: str, db: AsyncSession) -> Optional[GmailSyncState]:
+        stmt = select(GmailSyncState).where(GmailSyncState.user_id == to_uuid(user_id))
+        result = await db.execute(stmt)
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def enable(user_id: str, db: AsyncSession):
+        """Opt a user into the mirror and start the initial sync in the background.
+
+        Searches keep using the live API until the initial sync has stored a history cursor.
+        """
+        # Fail fast for users without Gmail access rather than in the background task
+        await GmailService.get_service(user_id, db)
+        state = await GmailMirrorService.get_state(user_id, db)
+        if not state:
+            state = GmailSyncState(user_id=to_uuid(user_id), enabled=1)
+            db.add(state)
+        else:
+            state.enabled = 1
+        await db.commit()
+        GmailMirrorService.schedule_full_sync(user_id)
+
+    @staticmethod
+    def schedule_full_sync(user_id: str):
+        """Run a full sync in the background, at most one at a time per user"""
+        key = str(to_uuid(user_id))
+        if key in _full_syncs:
+            return
+        _full_syncs.add(key)
+
+        async def run():
+            try:
+                with background_priority():
+                    async with AsyncSessionLocal() as db:
+                        await GmailMirrorService.full_sync(user_id, db)
+                    async with AsyncSessionLocal() as db:
+                        await EmailIndexService.index_pending(user_id, db)
+            except Exception as e:
+                logger.error(f"Initial mirror sync error for {user_id}: {e}")
+            finally:
+                _full_syncs.discard(key)
+
+        task = asyncio.create_task(run())
+        # Keep a reference so the task isn't garbage collected mid-flight
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+
+    @staticmethod
+    async def disable(user_id: str, db: AsyncSession):
+        """Opt a user out and drop their mirrored messages and the embeddings of their bodies"""
+        user_uuid = to_uuid(user_id)
+        await db.execute(delete(EmailEmbedding).where(EmailEmbedding.user_id == user_uuid))
+        await db.execute(delete(GmailMessage).where(GmailMessage.user_id == user_uuid))
+        await db.execute(delete(GmailSyncState).where(GmailSyncState.user_id == user_uuid))
+        await db.commit()
+
+    @staticmethod
+    async def _fetch_and_store(user_id: str, service, message_ids: List[str], db: AsyncSession) -> int:
+        """Fetch full messages concurrently and upsert them into the mirror"""
+        if not message_ids:
+            return 0
+
+        semaphore = asyncio.Semaphore(MIRROR_FETCH_CONCURRENCY)
+
+        async def fetch(message_id: str):
+            async with semaphore:
+                try:
+                    return await google_api.execute(service.users().messages().get(
+                        userId="me",
+                        id=message_id,
+                        format="full"
+                    ))
+                except HttpError as e:
+                    # Message deleted between listing and fetching
+                    if e.resp.status == 404:
+                        return None
+                    raise
+
+        fetched = await asyncio.gather(*(fetch(mid) for mid in message_ids))
+        user_uuid = to_uuid(user_id)
+        rows = [_message_row(user_uuid, m) for m in fetched if m]
+        for m in fetched:
+            if m:
+                contact_directory.record(user_id, m["id"], m.get("payload", {}).get("headers", []))
+        if not rows:
+            return 0
+
+        stmt = insert(GmailMessage).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_gmail_messages_user_message",
+            set_={col: stmt.excluded[col] for col in rows[0] if col not in ("user_id", "message_id")}
+        )
+        await db.execute(stmt)
+        return len(rows)
+
+    @staticmethod
+    async def full_sync(user_id: str, db: AsyncSession) -> int:
+        """Mirror the most recent messages and reset the history cursor"""
+        service = await GmailService.get_service(user_id, db)
+
+        # Take the cursor first so nothing that arrives during the scan is missed
+        profile = await google_api.execute(service.users().getProfile(userId="me"))
+
+        message_ids = []
+        page_token = None
+        while len(message_ids) < MIRROR_INITIAL_SYNC_LIMIT:
+            results = await google_api.execute(service.users().messages().list(
+                userId="me",
+                maxResults=min(500, MIRROR_INITIAL_SYNC_LIMIT - len(message_ids)),
+                pageToken=page_token,
+                fields="messages(id),nextPageToken"
+            ))
+            message_ids.extend(m["id"] for m in results.get("messages", []))
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                break
+
+        stored = await GmailMirrorService._fetch_and_store(user_id, service, message_ids, db)
+
+        # Searches can only trust the mirror for mail newer than what the initial sync reached
+        user_uuid = to_uuid(user_id)
+        oldest = (await db.execute(select(func.min(GmailMessage.internal_date)).where(
+            GmailMessage.user_id == user_uuid
+        ))).scalar()
+        await db.execute(update(GmailSyncState).where(GmailSyncState.user_id == user_uuid).values(
+            history_id=int(profile["historyId"]),
+            mirrored_since=oldest,
+            mirror_complete=0 if page_token else 1,
+            last_synced_at=datetime.utcnow()
+        ))
+        await db.commit()
+        return stored
+
+    @staticmethod
+    async def sync(user_id: str, db: AsyncSession) -> int:
+        """Apply Gmail history since the stored cursor; falls back to a full sync if it expired"""
+        state = await GmailMirrorService.get_state(user_id, db)
+        if not state or not state.enabled:
+            return 0
+        if not state.history_id:
+            return await GmailMirrorService.full_sync(user_id, db)
+
+        service = await GmailService.get_service(user_id, db)
+        user_uuid = to_uuid(user_id)
+
+        added, deleted, relabeled = set(), set(), {}
+        latest_history_id = state.history_id
+        page_token = None
+        try:
+            while True:
+                results = await google_api.execute(service.users().history().list(
+                    userId="me",
+                    startHistoryId=state.history_id,
+                    historyTypes=["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"],
+                    pageToken=page_token
+                ))
+                for record in results.get("history", []):
+                    for item in record.get("messagesAdded", []):
+                        added.add(item["message"]["id"])
+                        deleted.discard(item["message"]["id"])
+                    for item in record.get("messagesDeleted", []):
+                        deleted.add(item["message"]["id"])
+                        added.discard(item["message"]["id"])
+                    for key in ("labelsAdded", "labelsRemoved"):
+                        for item in record.get(key, []):
+                            relabeled[item["message"]["id"]] = item["message"].get("labelIds", [])
+                latest_history_id = int(results.get("historyId", latest_history_id))
+                page_token = results.get("nextPageToken")
+                if not page_token:
+                    break
+        except HttpError as e:
+            # The history cursor is too old (or invalid); rebuild from scratch
+            if e.resp.status == 404:
+                logger.info(f"Gmail history expired for {user_id}, running full mirror sync")
+                return await GmailMirrorService.full_sync(user_id, db)
+            raise
+
+        changed = await GmailMirrorService._fetch_and_store(user_id, service, list(added), db)
+
+        if deleted:
+            await db.execute(delete(EmailEmbedding).where(
+                EmailEmbedding.user_id == user_uuid,
+                EmailEmbedding.message_id.in_(deleted)
+            ))
+            await db.execute(delete(GmailMessage).where(
+                GmailMessage.user_id == user_uuid,
+                GmailMessage.message_id.in_(deleted)
+            ))
+
+        for message_id, label_ids in relabeled.items():
+            if message_id in added or message_id in deleted:
+                continue
+            await db.execute(update(GmailMessage).where(
+                GmailMessage.user_id == user_uuid,
+                GmailMessage.message_id == message_id
+            ).values(label_ids=label_ids, updated_at=datetime.utcnow()))
+
+        state.history_id = latest_history_id
+        state.last_synced_at = datetime.utcnow()
+        await db.commit()
+        return changed + len(deleted) + len(relabeled)
+
+    @staticmethod
+    async def get_thread_message_id(user_id: str, thread_id: str, db: AsyncSession) -> Optional[str]:
+        """Newest mirrored Message-ID header in a thread, if the thread is mirrored"""
+        stmt = select(GmailMessage.rfc_message_id).where(
+            GmailMessage.user_id == to_uuid(user_id),
+            GmailMessage.thread_id == thread_id,
+            GmailMessage.rfc_message_id.isnot(None)
+        ).order_by(GmailMessage.internal_date.desc().nulls_last()).limit(1)
+        return (await db.execute(stmt)).scalar_one_or_none()
+
+    @staticmethod
+    async def search(user_id: str, query: str, db: AsyncSession, max_results: int = 10) -> Optional[List[dict]]:
+        """Answer a Gmail query from the mirror; returns None when the live API must be used.
+
+        The mirror only holds mail since ``mirrored_since`` unless the initial sync reached the end
+        of the mailbox. Results are newest first, so a full page of matches is still exact; a short
+        page is only trusted when the query is bounded (``after:``/``newer_than:``) to that range.
+        """
+        parsed = parse_query(query)
+        if parsed is None:
+            return None
+
+        state = await GmailMirrorService.get_state(user_id, db)
+        if not state or not state.enabled or not state.history_id:
+            return None
+
+        stmt = select(GmailMessage).where(GmailMessage.user_id == to_uuid(user_id))
+        for value in parsed["from"]:
+            stmt = stmt.where(GmailMessage.sender.ilike(f"%{value}%"))
+        for value in parsed["to"]:
+            stmt = stmt.where(GmailMessage.recipients.ilike(f"%{value}%"))
+        for value in parsed["subject"]:
+            stmt = stmt.where(GmailMessage.subject.ilike(f"%{value}%"))
+        if parsed["labels"]:
+            stmt = stmt.where(GmailMessage.label_ids.contains(parsed["labels"]))
+        if parsed["exclude_labels"]:
+            stmt = stmt.where(~GmailMessage.label_ids.overlap(parsed["exclude_labels"]))
+        if parsed["text"]:
+            stmt = stmt.where(GmailMessage.search_vector.op("@@")(
+                func.plainto_tsquery("simple", " ".join(parsed["text"]))
+            ))
+        if parsed["after"]:
+            stmt = stmt.where(GmailMessage.internal_date >= parsed["after"])
+
+        stmt = stmt.order_by(GmailMessage.internal_date.desc().nulls_last()).limit(max_results)
+        result = await db.execute(stmt)
+        rows = result.scalars().all()
+
+        bounded = parsed["after"] is not None and state.mirrored_since is not None and parsed["after"] >= state.mirrored_since
+        if len(rows) < max_results and not state.mirror_complete and not bounded:
+            # Older, unmirrored mail could match too
+            return None
+        return [_to_email(row) for row in rows]
+
+
+async def run_mirror_sync_loop():
+    """Periodically apply Gmail history deltas for every opted-in user and embed new mail"""
+    with background_priority():
+        while True:
+            await asyncio.sleep(MIRROR_SYNC_INTERVAL)
+            try:
+                async with AsyncSessionLocal() as db:
+                    result = await db.execute(select(GmailSyncState.user_id).where(GmailSyncState.enabled == 1))
+                    user_ids = [str(uid) for uid in result.scalars().all()]
+            except Exception as e:
+                logger.error(f"Mirror sync error (listing users): {e}")
+                continue
+
+            for user_id in user_ids:
+                if user_id in _full_syncs:
+                    # Its initial sync is still running in the background
+                    continue
+                try:
+                    async with AsyncSessionLocal() as db:
+                        await GmailMirrorService.sync(user_id, db)
+                except Exception as e:
+                    logger.error(f"Mirror sync error for {user_id}: {e}")
+                    continue
+
+                try:
+                    async with AsyncSessionLocal() as db:
+                        await EmailIndexService.index_pending(user_id, db)
+                except Exception as e:
+                    logger.error(f"Email index error for {user_id}: {e}")
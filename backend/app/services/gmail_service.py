@@ -1,14 +1,106 @@
 import base64
 import os
-from typing import List, Optional
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
+import asyncio
+import hashlib
+import html
+import logging
+import re
+from email.mime.text import MIMEText
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..db.models import User
+from .google_api import google_api, build_service
+from .pdf_extractor import pdf_extractor
+from .contact_service import contact_directory
 from sqlalchemy import select
-import io
-from pypdf import PdfReader
+
+logger = logging.getLogger("cortex-api")
+
+GMAIL_ATTACHMENT_CONCURRENCY = int(os.getenv("GMAIL_ATTACHMENT_CONCURRENCY", "4"))
+# Listing views only need these headers and Gmail's snippet, never the body
+LISTING_HEADERS = ["Subject", "From", "To", "Cc", "Date", "Message-ID"]
+LIST_FIELDS = "messages(id,threadId),nextPageToken,resultSizeEstimate"
+METADATA_FIELDS = "id,threadId,labelIds,snippet,historyId,internalDate,payload/headers"
+
+INBOX_PAGE_SIZE = int(os.getenv("GMAIL_INBOX_PAGE_SIZE", "20"))
+INBOX_MAX_PAGE_SIZE = 100
+INBOX_CACHE_TTL = float(os.getenv("GMAIL_INBOX_CACHE_TTL", "30"))  # seconds
+
+# First inbox page per (user, page size): (expires_at, page)
+_inbox_cache: Dict[tuple, Tuple[float, dict]] = {}
+
+# Newest known RFC Message-ID per (user, thread) so replies don't need a lookup: (internal_date, message_id)
+THREAD_HEADER_CACHE_SIZE = 10_000
+_thread_message_ids: "OrderedDict[tuple, Tuple[int, str]]" = OrderedDict()
+
+def remember_thread_message_id(user_id: str, thread_id: str, message_id_header: str, internal_date: int = 0):
+    """Record a thread's Message-ID header for reply threading, keeping the newest one seen"""
+    if not message_id_header:
+        return
+    key = (str(user_id), thread_id)
+    current = _thread_message_ids.get(key)
+    if current is None or internal_date >= current[0]:
+        _thread_message_ids[key] = (internal_date, message_id_header)
+    _thread_message_ids.move_to_end(key)
+    if len(_thread_message_ids) > THREAD_HEADER_CACHE_SIZE:
+        _thread_message_ids.popitem(last=False)
+
+GMAIL_ATTACHMENT_BYTE_BUDGET = int(os.getenv("GMAIL_ATTACHMENT_BYTE_BUDGET", str(25 * 1024 * 1024)))
+
+def get_header(headers: List[dict], name: str, default: str = "") -> str:
+    """Get a header value by (case-insensitive) name"""
+    name = name.lower()
+    return next((h["value"] for h in headers if h["name"].lower() == name), default)
+
+def walk_parts(payload: dict) -> Tuple[List[dict], List[dict]]:
+    """Single pass over a (possibly nested) MIME tree.
+
+    Returns the inline text/plain parts and the attachment parts, in document order.
+    """
+    text_parts, attachment_parts = [], []
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        if part.get("parts"):
+            stack.extend(reversed(part["parts"]))
+            continue
+        body = part.get("body", {})
+        if part.get("filename") and (body.get("attachmentId") or body.get("data")):
+            attachment_parts.append(part)
+        elif part.get("mimeType") == "text/plain" and body.get("data"):
+            text_parts.append(part)
+    return text_parts, attachment_parts
+
+def decode_part(part: dict) -> str:
+    return base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8", errors="replace")
+
+def extract_body(payload: dict) -> str:
+    """Decode the text/plain body of a message payload"""
+    text_parts, _ = walk_parts(payload)
+    return "\n".join(decode_part(part) for part in text_parts)
+
+def is_pdf(part: dict) -> bool:
+    return part.get("mimeType") == "application/pdf" or part.get("filename", "").lower().endswith(".pdf")
+
+def to_listing(msg_data: dict) -> dict:
+    """Shape a metadata-format message for listing views"""
+    headers = msg_data.get("payload", {}).get("headers", [])
+    return {
+        "id": msg_data["id"],
+        "thread_id": msg_data["threadId"],
+        "subject": get_header(headers, "Subject", "No Subject"),
+        "from": get_header(headers, "From", "Unknown"),
+        "to": get_header(headers, "To", "Unknown"),
+        "date": get_header(headers, "Date"),
+        "preview": html.unescape(msg_data.get("snippet", "")),
+        "labels": msg_data.get("labelIds", [])
+    }
+
+class DeliveryUnknownError(Exception):
+    """``messages.send`` timed out or lost its connection: the email may or may not have been sent"""
+
 
 class GmailService:
     """Service for Gmail API interactions"""
@@ -24,199 +116,350 @@ class GmailService:
         if not user or not user.refresh_token:
             raise ValueError("User not authenticated with Google")
 
-        # Create credentials from refresh token
-        credentials = Credentials(
-            token=None,
-            refresh_token=user.refresh_token,
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=os.getenv("GOOGLE_CLIENT_ID"),
-            client_secret=os.getenv("GOOGLE_CLIENT_SECRET")
-        )
-
-        # Refresh token if needed
-        request = Request()
-        credentials.refresh(request)
-
-        return build("gmail", "v1", credentials=credentials)
+        return await build_service("gmail", "v1", user.refresh_token)
 
     @staticmethod
     async def search_messages(user_id: str, db: AsyncSession, query: str = "in:inbox", max_results: int = 10) -> List[dict]:
         """Search for messages using Gmail query syntax (e.g., 'in:inbox', 'from:someone', 'subject:something')"""
         try:
+            # Serve from the local mirror when the user opted in and the query is supported
+            from .gmail_mirror import GmailMirrorService
+            try:
+                mirrored = await GmailMirrorService.search(user_id, query, db, max_results)
+                if mirrored is not None:
+                    return mirrored
+            except Exception as e:
+                logger.warning(f"Mirror search error (falling back to Gmail): {e}")
+
             service = await GmailService.get_service(user_id, db)
 
             # Get message list
-            results = service.users().messages().list(
+            results = await google_api.execute(service.users().messages().list(
                 userId="me",
                 maxResults=max_results,
-                q=query
-            ).execute()
-
-            messages = results.get("messages", [])
-            email_list = []
-
-            for msg in messages:
-                msg_data = service.users().messages().get(
-                    userId="me",
-                    id=msg["id"],
-                    format="full"
-                ).execute()
-
-                headers = msg_data["payload"]["headers"]
-                subject = next((h["value"] for h in headers if h["name"] == "Subject"), "No Subject")
-                sender = next((h["value"] for h in headers if h["name"] == "From"), "Unknown")
-                receiver = next((h["value"] for h in headers if h["name"] == "To"), "Unknown")
-                date = next((h["value"] for h in headers if h["name"] == "Date"), "")
-
-                # Get email body
-                body = ""
-                if "parts" in msg_data["payload"]:
-                    for part in msg_data["payload"]["parts"]:
-                        if part["mimeType"] == "text/plain":
-                            if "data" in part["body"]:
-                                body = base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8")
-                            break
-                else:
-                    if "body" in msg_data["payload"]:
-                        body = base64.urlsafe_b64decode(msg_data["payload"]["body"]["data"]).decode("utf-8")
-
-                email_list.append({
-                    "id": msg["id"],
-                    "thread_id": msg["threadId"],
-                    "subject": subject,
-                    "from": sender,
-                    "to": receiver,
-                    "date": date,
-                    "preview": body[:300] + "..." if len(body) > 300 else body
-                })
+                q=query,
+                fields=LIST_FIELDS
+            ))
 
-            return email_list
+            return await GmailService.fetch_metadata(service, [m["id"] for m in results.get("messages", [])], user_id)
 
         except Exception as e:
             raise ValueError(f"Error searching messages: {str(e)}")
 
-    async def send_email(user_id: str, to: str, subject: str, body: str, db: AsyncSession, thread_id: str = None) -> str:
-        """Send an email, supporting threading"""
+    @staticmethod
+    async def get_inbox(
+        user_id: str,
+        db: AsyncSession,
+        page_token: Optional[str] = None,
+        page_size: Optional[int] = None
+    ) -> dict:
+        """Get one page of the inbox (metadata only). The first page is cached briefly per user."""
+        page_size = max(1, min(page_size or INBOX_PAGE_SIZE, INBOX_MAX_PAGE_SIZE))
+        cache_key = (user_id, page_size)
+        if not page_token:
+            cached = _inbox_cache.get(cache_key)
+            if cached and cached[0] > time.monotonic():
+                return cached[1]
+
         try:
-            import re
-            from email.mime.text import MIMEText
             service = await GmailService.get_service(user_id, db)
 
-            # Robust email extraction: extract subash@example.com from "Subash <subash@example.com>"
-            email_match = re.search(r'[\w\.-]+@[\w\.-]+\.\w+', to)
-            clean_to = email_match.group(0) if email_match else to.strip()
-
-            message = MIMEText(body)
-            message["to"] = clean_to
-            message["subject"] = subject
-
-            # If replying, set proper headers
-            if thread_id:
-                try:
-                    orig_msg = service.users().messages().get(userId="me", id=thread_id).execute()
-                    orig_headers = orig_msg["payload"]["headers"]
-                    msg_id_val = next((h["value"] for h in orig_headers if h["name"].lower() == "message-id"), None)
-                    
-                    if msg_id_val:
-                        message["In-Reply-To"] = msg_id_val
-                        message["References"] = msg_id_val
-                    
-                    if not subject.lower().startswith("re:"):
-                        message["subject"] = "Re: " + subject
-                except Exception as e:
-                    print(f"Threading error (proceeding as new mail): {e}")
-
-            raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
-            send_message = {"raw": raw}
-            if thread_id:
-                send_message["threadId"] = thread_id
-
-            result = service.users().messages().send(
+            results = await google_api.execute(service.users().messages().list(
+                userId="me",
+                labelIds=["INBOX"],
+                maxResults=page_size,
+                pageToken=page_token,
+                fields=LIST_FIELDS
+            ))
+
+            page = {
+                "emails": await GmailService.fetch_metadata(service, [m["id"] for m in results.get("messages", [])], user_id),
+                "next_page_token": results.get("nextPageToken"),
+                "result_size_estimate": results.get("resultSizeEstimate", 0)
+            }
+        except Exception as e:
+            raise ValueError(f"Error fetching inbox: {str(e)}")
+
+        if not page_token:
+            now = time.monotonic()
+            if len(_inbox_cache) > 1024:
+                for key in [k for k, (expires, _) in _inbox_cache.items() if expires <= now]:
+                    del _inbox_cache[key]
+            _inbox_cache[cache_key] = (now + INBOX_CACHE_TTL, page)
+        return page
+
+    @staticmethod
+    async def fetch_metadata(service, message_ids: List[str], user_id: str = None) -> List[dict]:
+        """Fetch listing data for several messages concurrently (headers + snippet only)"""
+        async def fetch(message_id: str) -> dict:
+            return await google_api.execute(service.users().messages().get(
+                userId="me",
+                id=message_id,
+                format="metadata",
+                metadataHeaders=LISTING_HEADERS,
+                fields=METADATA_FIELDS
+            ))
+
+        # A message deleted between listing and fetching (404) must not fail the whole page
+        results = await asyncio.gather(*(fetch(mid) for mid in message_ids), return_exceptions=True)
+        messages = [m for m in results if not isinstance(m, BaseException)]
+        errors = [e for e in results if isinstance(e, BaseException)]
+        if errors:
+            if not messages:
+                raise errors[0]
+            logger.warning(f"Skipped {len(errors)} of {len(results)} messages while listing: {errors[0]}")
+        if user_id:
+            for m in messages:
+                headers = m.get("payload", {}).get("headers", [])
+                remember_thread_message_id(
+                    user_id, m["threadId"], get_header(headers, "Message-ID"), int(m.get("internalDate", 0))
+                )
+                contact_directory.record(user_id, m["id"], headers)
+        return [to_listing(m) for m in messages]
+
+    @staticmethod
+    async def get_message(user_id: str, message_id: str, db: AsyncSession) -> dict:
+        """Get a single message with its decoded body (listing views only carry the snippet)"""
+        try:
+            service = await GmailService.get_service(user_id, db)
+            msg_data = await google_api.execute(service.users().messages().get(
+                userId="me",
+                id=message_id,
+                format="full"
+            ))
+            contact_directory.record(user_id, message_id, msg_data["payload"].get("headers", []))
+            email = to_listing(msg_data)
+            email["body"] = extract_body(msg_data["payload"])
+            return email
+        except Exception as e:
+            raise ValueError(f"Error getting message: {str(e)}")
+
+    @staticmethod
+    async def get_thread_message_id(user_id: str, thread_id: str, db: AsyncSession, service=None) -> Optional[str]:
+        """Message-ID header to reply to: in-memory cache, then the local mirror, then one metadata fetch"""
+        cached = _thread_message_ids.get((str(user_id), thread_id))
+        if cached:
+            return cached[1]
+
+        from .gmail_mirror import GmailMirrorService
+        mirrored = await GmailMirrorService.get_thread_message_id(user_id, thread_id, db)
+        if mirrored:
+            remember_thread_message_id(user_id, thread_id, mirrored)
+            return mirrored
+
+        service = service or await GmailService.get_service(user_id, db)
+        thread = await google_api.execute(service.users().threads().get(
+            userId="me",
+            id=thread_id,
+            format="metadata",
+            metadataHeaders=["Message-ID"],
+            fields="messages(internalDate,payload/headers)"
+        ))
+        for msg in thread.get("messages", []):
+            remember_thread_message_id(
+                user_id, thread_id, get_header(msg.get("payload", {}).get("headers", []), "Message-ID"),
+                int(msg.get("internalDate", 0))
+            )
+        cached = _thread_message_ids.get((str(user_id), thread_id))
+        return cached[1] if cached else None
+
+    @staticmethod
+    async def deliver_email(user_id: str, to: str, subject: str, body: str, db: AsyncSession, thread_id: str = None) -> str:
+        """Send an email right away, supporting threading.
+
+        Raises the raw API error so callers can retry, or ``DeliveryUnknownError`` when the send
+        itself timed out or lost its connection and must not be retried.
+        """
+        service = await GmailService.get_service(user_id, db)
+
+        # Robust email extraction: extract subash@example.com from "Subash <subash@example.com>"
+        email_match = re.search(r'[\w\.-]+@[\w\.-]+\.\w+', to)
+        clean_to = email_match.group(0) if email_match else to.strip()
+
+        message = MIMEText(body)
+        message["to"] = clean_to
+        message["subject"] = subject
+
+        # If replying, set proper headers
+        if thread_id:
+            try:
+                msg_id_val = await GmailService.get_thread_message_id(user_id, thread_id, db, service)
+
+                if msg_id_val:
+                    message["In-Reply-To"] = msg_id_val
+                    message["References"] = msg_id_val
+
+                if not subject.lower().startswith("re:"):
+                    message.replace_header("subject", "Re: " + subject)
+            except Exception as e:
+                logger.warning(f"Threading error (proceeding as new mail): {e}")
+
+        raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
+        send_message = {"raw": raw}
+        if thread_id:
+            send_message["threadId"] = thread_id
+
+        try:
+            result = await google_api.execute(service.users().messages().send(
                 userId="me",
                 body=send_message
-            ).execute()
+            ))
+        except (TimeoutError, ConnectionError, OSError) as e:
+            # The worker thread may still complete the send, so retrying could deliver it twice
+            raise DeliveryUnknownError(f"Send outcome unknown: {e}") from e
 
-            return result["id"]
+        contact_directory.record_addresses(user_id, [to])
+        return result["id"]
 
+    @staticmethod
+    async def send_email(user_id: str, to: str, subject: str, body: str, db: AsyncSession, thread_id: str = None) -> str:
+        """Send an email, supporting threading"""
+        try:
+            return await GmailService.deliver_email(user_id, to, subject, body, db, thread_id=thread_id)
         except Exception as e:
             raise ValueError(f"Error sending email: {str(e)}")
 
     @staticmethod
-    async def get_attachment(user_id: str, message_id: str, attachment_id: str, db: AsyncSession) -> str:
-        """Get PDF attachment and extract text"""
+    async def get_attachment(
+        user_id: str,
+        message_id: str,
+        attachment_id: str,
+        db: AsyncSession,
+        part_id: str = None,
+        filename: str = None
+    ) -> str:
+        """Get PDF attachment and extract text (cached by message part and content hash)"""
         try:
+            # Gmail attachment ids change between fetches, so the stable cache key is the part id
+            part_key = part_id or attachment_id
+            cached = await pdf_extractor.get_cached(user_id, message_id, part_key, db)
+            if cached is not None:
+                return cached
+
             service = await GmailService.get_service(user_id, db)
 
             # Download attachment
-            attachment = service.users().messages().attachments().get(
+            attachment = await google_api.execute(service.users().messages().attachments().get(
                 userId="me",
                 messageId=message_id,
                 id=attachment_id
-            ).execute()
+            ))
 
             # Decode base64
             data = base64.urlsafe_b64decode(attachment["data"])
 
-            # Extract text from PDF
-            pdf_file = io.BytesIO(data)
-            reader = PdfReader(pdf_file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-
-            return text
+            # Extract text from PDF off the event loop
+            return await pdf_extractor.extract(data, db, user_id, message_id, part_key, filename)
 
         except Exception as e:
             raise ValueError(f"Error extracting PDF: {str(e)}")
 
     @staticmethod
     async def get_message_with_attachments(user_id: str, message_id: str, db: AsyncSession) -> dict:
-        """Get full message with attachment text extracted"""
+        """Get full message with attachment text extracted.
+
+        PDFs anywhere in the MIME tree are downloaded and parsed concurrently, capped by
+        GMAIL_ATTACHMENT_CONCURRENCY and a total GMAIL_ATTACHMENT_BYTE_BUDGET.
+        """
         try:
             service = await GmailService.get_service(user_id, db)
 
-            msg_data = service.users().messages().get(
+            msg_data = await google_api.execute(service.users().messages().get(
                 userId="me",
                 id=message_id,
                 format="full"
-            ).execute()
-
-            headers = msg_data["payload"]["headers"]
-            subject = next((h["value"] for h in headers if h["name"] == "Subject"), "No Subject")
-            sender = next((h["value"] for h in headers if h["name"] == "From"), "Unknown")
-            date = next((h["value"] for h in headers if h["name"] == "Date"), "")
+            ))
+
+            payload = msg_data["payload"]
+            headers = payload["headers"]
+            subject = get_header(headers, "Subject", "No Subject")
+            sender = get_header(headers, "From", "Unknown")
+            date = get_header(headers, "Date")
+
+            text_parts, attachment_parts = walk_parts(payload)
+            body = "\n".join(decode_part(part) for part in text_parts)
+
+            # Spend the byte budget on attachments in document order
+            selected, skipped = [], []
+            budget = GMAIL_ATTACHMENT_BYTE_BUDGET
+            for part in filter(is_pdf, attachment_parts):
+                size = part["body"].get("size", 0)
+                if size > budget:
+                    skipped.append({"filename": part.get("filename"), "size": size, "reason": "byte budget exceeded"})
+                    continue
+                budget -= size
+                selected.append(part)
+
+            def part_key(part: dict) -> str:
+                return part.get("partId") or part["body"].get("attachmentId")
+
+            texts = await pdf_extractor.get_cached_parts(user_id, message_id, [part_key(p) for p in selected], db)
+            pending = [p for p in selected if part_key(p) not in texts]
+
+            semaphore = asyncio.Semaphore(GMAIL_ATTACHMENT_CONCURRENCY)
+
+            async def download(part: dict) -> bytes:
+                async with semaphore:
+                    if part["body"].get("data"):
+                        return base64.urlsafe_b64decode(part["body"]["data"])
+                    attachment = await google_api.execute(service.users().messages().attachments().get(
+                        userId="me",
+                        messageId=message_id,
+                        id=part["body"]["attachmentId"]
+                    ))
+                    return base64.urlsafe_b64decode(attachment["data"])
+
+            async def parse(data: bytes):
+                async with semaphore:
+                    return await pdf_extractor.parse(data)
+
+            errors = {}
+            downloads = await asyncio.gather(*(download(p) for p in pending), return_exceptions=True)
+            fetched = []
+            for part, data in zip(pending, downloads):
+                if isinstance(data, Exception):
+                    errors[part_key(part)] = str(data)
+                else:
+                    fetched.append((part, data, hashlib.sha256(data).hexdigest()))
+
+            # Identical bytes seen before (e.g. the same invoice forwarded) skip the parse
+            known = await pdf_extractor.lookup_hashes([h for _, _, h in fetched], db)
+            to_parse = [item for item in fetched if item[2] not in known]
+            parsed = await asyncio.gather(*(parse(data) for _, data, _ in to_parse), return_exceptions=True)
+            parsed_by_hash = dict(zip((h for _, _, h in to_parse), parsed))
+
+            for part, _, content_hash in fetched:
+                result = known.get(content_hash, parsed_by_hash.get(content_hash))
+                if isinstance(result, Exception):
+                    errors[part_key(part)] = str(result)
+                    continue
+                text, page_count, pages_extracted = (result, None, None) if isinstance(result, str) else result
+                known[content_hash] = text
+                texts[part_key(part)] = text
+                await pdf_extractor.store(
+                    db, user_id, message_id, part_key(part), content_hash, text,
+                    part.get("filename"), page_count, pages_extracted
+                )
+            if fetched:
+                await db.commit()
 
             attachments = []
-            if "parts" in msg_data["payload"]:
-                for part in msg_data["payload"]["parts"]:
-                    if part["mimeType"] == "application/pdf":
-                        attachment_id = part["body"]["attachmentId"]
-                        filename = part.get("filename", "attachment.pdf")
-                        text = await GmailService.get_attachment(user_id, message_id, attachment_id, db)
-                        attachments.append({
-                            "filename": filename,
-                            "text": text
-                        })
-
-            # Get body
-            body = ""
-            if "parts" in msg_data["payload"]:
-                for part in msg_data["payload"]["parts"]:
-                    if part["mimeType"] == "text/plain":
-                        if "data" in part["body"]:
-                            body = base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8")
-                        break
-            else:
-                if "body" in msg_data["payload"]:
-                    body = base64.urlsafe_b64decode(msg_data["payload"]["body"]["data"]).decode("utf-8")
+            for part in selected:
+                key = part_key(part)
+                attachment = {"filename": part.get("filename", "attachment.pdf"), "part_id": key, "text": texts.get(key, "")}
+                if key in errors:
+                    attachment["error"] = errors[key]
+                attachments.append(attachment)
 
             return {
                 "id": message_id,
+                "thread_id": msg_data.get("threadId"),
                 "subject": subject,
                 "from": sender,
                 "date": date,
                 "body": body,
-                "attachments": attachments
+                "attachments": attachments,
+                "skipped_attachments": skipped
             }
 
         except Exception as e:
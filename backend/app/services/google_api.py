@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httplib2
+import google_auth_httplib2
+from googleapiclient.discovery import build
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+from .quota_governor import QuotaGovernor, is_rate_limited
+
+GOOGLE_API_MAX_WORKERS = int(os.getenv("GOOGLE_API_MAX_WORKERS", "16"))
+GOOGLE_API_TIMEOUT = float(os.getenv("GOOGLE_API_TIMEOUT", "30"))
+GOOGLE_TOKEN_URI = os.getenv("GOOGLE_TOKEN_URI", "https://oauth2.googleapis.com/token")
+SERVICE_CACHE_SIZE = int(os.getenv("GOOGLE_API_SERVICE_CACHE_SIZE", "256"))
+CREDENTIALS_CACHE_SIZE = int(os.getenv("GOOGLE_API_CREDENTIALS_CACHE_SIZE", "1024"))
+
+
+def request_key(request) -> tuple:
+    """Identity of a request for coalescing: caller credentials, API method and normalized parameters"""
+    credentials = getattr(request.http, "credentials", None)
+    principal = getattr(credentials, "refresh_token", None) or id(credentials)
+    parts = urlsplit(request.uri)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return (
+        hashlib.sha256(str(principal).encode()).hexdigest()[:16],
+        getattr(request, "methodId", None),
+        request.method,
+        urlunsplit((parts.scheme, parts.netloc, parts.path, query, "")),
+        request.body,
+    )
+
+
+class GoogleApiExecutor:
+    """Runs blocking google-api-python-client requests on a bounded thread pool.
+
+    httplib2 connections are not thread-safe, so every worker thread keeps its own
+    keep-alive ``httplib2.Http`` and requests are executed through it instead of the
+    transport the service object was built with.
+
+    Identical read requests (same user, method and parameters) that are already in flight
+    are coalesced: later callers await the first call's result, or its error, instead of
+    issuing their own. Coalesced results are shared objects and must not be mutated.
+    """
+
+    def __init__(self, max_workers: int = GOOGLE_API_MAX_WORKERS, timeout: float = GOOGLE_API_TIMEOUT):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="google-api")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.governor = QuotaGovernor(max_workers)
+        self._in_flight: Dict[tuple, asyncio.Task] = {}
+        self._coalesced_by_method: Dict[str, int] = {}
+        self._stats = {
+            "coalesced": 0,
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "timed_out": 0,
+            "running": 0,
+            "total_latency_ms": 0.0,
+            "max_latency_ms": 0.0,
+        }
+
+    def _thread_http(self) -> httplib2.Http:
+        """Per-thread pooled HTTP transport"""
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = httplib2.Http(timeout=self.timeout)
+            self._local.http = http
+        return http
+
+    def _call(self, fn: Callable, *args, **kwargs):
+        with self._lock:
+            self._stats["running"] += 1
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._stats["running"] -= 1
+                self._stats["total_latency_ms"] += elapsed
+                self._stats["max_latency_ms"] = max(self._stats["max_latency_ms"], elapsed)
+
+    def _execute_request(self, request):
+        # Plain httplib2.Http also has a ``credentials`` attribute (basic auth), so check the type
+        if isinstance(request.http, google_auth_httplib2.AuthorizedHttp):
+            http = google_auth_httplib2.AuthorizedHttp(request.http.credentials, http=self._thread_http())
+        else:
+            http = self._thread_http()
+        return request.execute(http=http)
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run a blocking callable in the pool with a per-call timeout"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._stats["submitted"] += 1
+        future = loop.run_in_executor(self._pool, lambda: self._call(fn, *args, **kwargs))
+        try:
+            result = await asyncio.wait_for(future, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._stats["timed_out"] += 1
+            raise TimeoutError(f"Google API call timed out after {timeout or self.timeout}s")
+        except Exception:
+            with self._lock:
+                self._stats["failed"] += 1
+            raise
+        with self._lock:
+            self._stats["completed"] += 1
+        return result
+
+    async def _governed(self, request, timeout: Optional[float], key: Optional[tuple] = None) -> Any:
+        """Execute a request once the quota governor admits it"""
+        key = key or request_key(request)
+        principal, method_id = key[0], key[1]
+        await self.governor.acquire(principal, method_id)
+        started = time.perf_counter()
+        throttled = False
+        try:
+            return await self.run(self._execute_request, request, timeout=timeout)
+        except Exception as e:
+            throttled = is_rate_limited(e)
+            raise
+        finally:
+            self.governor.release(principal, time.perf_counter() - started, throttled)
+
+    def _finish(self, key: tuple, task: asyncio.Task):
+        self._in_flight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # Mark retrieved even if every waiter already gave up
+
+    async def execute(self, request, timeout: Optional[float] = None, coalesce: bool = True) -> Any:
+        """Await ``request.execute()`` without blocking the event loop.
+
+        GET requests join an identical in-flight call when there is one; pass ``coalesce=False``
+        to always issue a fresh call.
+        """
+        if not coalesce or request.method != "GET":
+            return await self._governed(request, timeout)
+
+        key = request_key(request)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._governed(request, timeout, key))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            method = key[1] or "unknown"
+            with self._lock:
+                self._stats["coalesced"] += 1
+                self._coalesced_by_method[method] = self._coalesced_by_method.get(method, 0) + 1
+
+        # Shielded so one caller giving up doesn't cancel the call for everyone else
+        return await asyncio.shield(task)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["coalesced_by_method"] = dict(self._coalesced_by_method)
+        stats["in_flight_keys"] = len(self._in_flight)
+        finished = stats["completed"] + stats["failed"]
+        stats["queued"] = max(stats["submitted"] - finished - stats["timed_out"] - stats["running"], 0)
+        stats["avg_latency_ms"] = round(stats["total_latency_ms"] / finished, 2) if finished else 0.0
+        stats["max_workers"] = self.max_workers
+        return stats
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+google_api = GoogleApiExecutor()
+
+_credentials_cache: "OrderedDict[str, Credentials]" = OrderedDict()
+_service_cache: "OrderedDict[tuple, Any]" = OrderedDict()
+
+
+async def get_credentials(refresh_token: str) -> Credentials:
+    """Get cached credentials for a refresh token, refreshing off the event loop when expired"""
+    credentials = _credentials_cache.get(refresh_token)
+    if credentials is None:
+        credentials = Credentials(
+            token=None,
+            refresh_token=refresh_token,
+            token_uri=GOOGLE_TOKEN_URI,
+            client_id=os.getenv("GOOGLE_CLIENT_ID"),
+            client_secret=os.getenv("GOOGLE_CLIENT_SECRET")
+        )
+        _credentials_cache[refresh_token] = credentials
+        if len(_credentials_cache) > CREDENTIALS_CACHE_SIZE:
+            _credentials_cache.popitem(last=False)
+    else:
+        _credentials_cache.move_to_end(refresh_token)
+
+    if not credentials.valid:
+        await google_api.run(credentials.refresh, Request())
+
+    return credentials
+
+
+async def build_service(api: str, version: str, refresh_token: str):
+    """Build (or reuse) a discovery client for the given API.
+
+    Set ``<API>_API_ENDPOINT`` (e.g. ``GMAIL_API_ENDPOINT``) to point a client at a local stub server.
+    """
+    credentials = await get_credentials(refresh_token)
+    key = (api, version, refresh_token)
+    service = _service_cache.get(key)
+    if service is not None:
+        _service_cache.move_to_end(key)
+        return service
+
+    client_options = None
+    endpoint = os.getenv(f"{api.upper()}_API_ENDPOINT")
+    if endpoint:
+        client_options = {"api_endpoint": endpoint}
+
+    service = await google_api.run(
+        build, api, version, credentials=credentials, client_options=client_options, cache_discovery=False
+    )
+    _service_cache[key] = service
+    if len(_service_cache) > SERVICE_CACHE_SIZE:
+        _service_cache.popitem(last=False)
+    return service
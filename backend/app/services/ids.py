@@ -0,0 +1,9 @@
+import uuid
+
+
+def to_uuid(user_id: str) -> uuid.UUID:
+    """User ids are UUIDs; anything else (e.g. an email used as an id) maps to a stable uuid5"""
+    try:
+        return uuid.UUID(str(user_id))
+    except ValueError:
+        return uuid.uuid5(uuid.NAMESPACE_DNS, user_id)
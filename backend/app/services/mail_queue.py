@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from googleapiclient.errors import HttpError
+from sqlalchemy import select, update, exists, or_, and_
+from sqlalchemy.orm import aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.database import AsyncSessionLocal
+from ..db.models import OutboundEmail
+from .gmail_service import GmailService, DeliveryUnknownError
+from .ids import to_uuid
+
+logger = logging.getLogger("cortex-api")
+
+MAIL_QUEUE_WORKERS = int(os.getenv("MAIL_QUEUE_WORKERS", "4"))
+MAIL_QUEUE_MAX_ATTEMPTS = int(os.getenv("MAIL_QUEUE_MAX_ATTEMPTS", "6"))
+MAIL_QUEUE_BASE_DELAY = float(os.getenv("MAIL_QUEUE_BASE_DELAY", "2"))  # seconds
+MAIL_QUEUE_MAX_DELAY = 300.0
+MAIL_QUEUE_POLL_INTERVAL = float(os.getenv("MAIL_QUEUE_POLL_INTERVAL", "5"))
+MAIL_QUEUE_STALE_AFTER = timedelta(minutes=10)  # 'sending' rows older than this were orphaned by a crash
+MAIL_QUEUE_RECOVER_INTERVAL = 60.0  # seconds between checks for orphaned rows
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Only errors that prove Gmail did not send: throttling/5xx responses, or transport errors
+    before ``messages.send`` was issued (those during the send raise ``DeliveryUnknownError``)"""
+    if isinstance(error, DeliveryUnknownError):
+        return False
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_STATUS
+    return isinstance(error, (TimeoutError, ConnectionError, OSError))
+
+
+def _backoff(attempts: int) -> timedelta:
+    """Exponential backoff with jitter"""
+    delay = min(MAIL_QUEUE_MAX_DELAY, MAIL_QUEUE_BASE_DELAY * (2 ** (attempts - 1)))
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+def to_status(row: OutboundEmail) -> dict:
+    return {
+        "id": str(row.id),
+        "status": row.status,
+        "to": row.recipient,
+        "subject": row.subject,
+        "thread_id": row.thread_id,
+        "attempts": row.attempts,
+        "message_id": row.gmail_message_id,
+        "error": row.last_error,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "updated_at": row.updated_at.isoformat() if row.updated_at else None
+    }
+
+
+class MailQueue:
+    """Postgres-backed outbound mail queue drained by a bounded pool of workers.
+
+    Messages from the same user are delivered strictly in the order they were queued.
+    """
+
+    def __init__(self, workers: int = MAIL_QUEUE_WORKERS):
+        self.workers = workers
+        self._wakeup = asyncio.Event()
+        self._stats = {"sent": 0, "retried": 0, "failed": 0, "unknown": 0, "orphaned": 0}
+
+    async def enqueue(
+        self, user_id: str, to: str, subject: str, body: str, db: AsyncSession, thread_id: str = None
+    ) -> OutboundEmail:
+        """Persist a message for delivery and return immediately"""
+        row = OutboundEmail(
+            user_id=to_uuid(user_id),
+            recipient=to,
+            subject=subject,
+            body=body,
+            thread_id=thread_id,
+            status="queued",
+            next_attempt_at=datetime.utcnow()
+        )
+        db.add(row)
+        await db.commit()
+        await db.refresh(row)
+        self._wakeup.set()
+        return row
+
+    async def get_status(self, outbound_id: str, db: AsyncSession) -> Optional[dict]:
+        stmt = select(OutboundEmail).where(OutboundEmail.id == uuid.UUID(outbound_id))
+        row = (await db.execute(stmt)).scalar_one_or_none()
+        return to_status(row) if row else None
+
+    async def _claim(self, db: AsyncSession) -> Optional[OutboundEmail]:
+        """Lock the next deliverable message: due, and at the head of its user's queue"""
+        earlier = aliased(OutboundEmail)
+        blocked = exists().where(
+            earlier.user_id == OutboundEmail.user_id,
+            earlier.id != OutboundEmail.id,
+            or_(
+                earlier.status == "sending",
+                and_(earlier.status == "queued", earlier.created_at < OutboundEmail.created_at)
+            )
+        )
+        stmt = select(OutboundEmail).where(
+            OutboundEmail.status == "queued",
+            OutboundEmail.next_attempt_at <= datetime.utcnow(),
+            ~blocked
+        ).order_by(OutboundEmail.created_at).limit(1).with_for_update(skip_locked=True)
+
+        row = (await db.execute(stmt)).scalar_one_or_none()
+        if row:
+            row.status = "sending"
+            row.attempts = (row.attempts or 0) + 1
+            await db.commit()
+        return row
+
+    async def _deliver(self, db: AsyncSession, row: OutboundEmail):
+        row_id, attempts = row.id, row.attempts
+        try:
+            gmail_id = await GmailService.deliver_email(
+                str(row.user_id), row.recipient, row.subject, row.body, db, thread_id=row.thread_id
+            )
+        except Exception as e:
+            await db.rollback()
+            if isinstance(e, DeliveryUnknownError):
+                # Never re-send: the message may already be in the recipient's inbox
+                self._stats["unknown"] += 1
+                values = {"status": "unknown"}
+            elif _is_retryable(e) and attempts < MAIL_QUEUE_MAX_ATTEMPTS:
+                self._stats["retried"] += 1
+                values = {"status": "queued", "next_attempt_at": datetime.utcnow() + _backoff(attempts)}
+            else:
+                self._stats["failed"] += 1
+                values = {"status": "failed"}
+            values["last_error"] = str(e)
+            logger.warning(f"Outbound email {row_id} attempt {attempts} failed: {e}")
+        else:
+            self._stats["sent"] += 1
+            values = {"status": "sent", "gmail_message_id": gmail_id, "last_error": None}
+
+        await db.execute(update(OutboundEmail).where(OutboundEmail.id == row_id).values(**values))
+        await db.commit()
+
+    async def _worker(self):
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    row = await self._claim(db)
+                    if row:
+                        await self._deliver(db, row)
+                        continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Mail queue worker error: {e}")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), MAIL_QUEUE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def recover(self) -> int:
+        """Resolve messages left in 'sending' by a crashed process.
+
+        The crash may have happened before or after Gmail accepted the send, so like a send
+        timeout they are marked 'unknown' rather than re-sent. This also unblocks the rest of
+        that user's queue.
+        """
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(update(OutboundEmail).where(
+                OutboundEmail.status == "sending",
+                OutboundEmail.updated_at < datetime.utcnow() - MAIL_QUEUE_STALE_AFTER
+            ).values(status="unknown", last_error="Delivery was interrupted; the email may or may not have been sent"))
+            await db.commit()
+        if result.rowcount:
+            self._stats["orphaned"] += result.rowcount
+            logger.warning(f"Marked {result.rowcount} interrupted outbound emails as unknown")
+        return result.rowcount
+
+    async def _recover_loop(self):
+        # Every tick, not just at startup: a restart within MAIL_QUEUE_STALE_AFTER must not leave rows stuck
+        while True:
+            try:
+                await self.recover()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Mail queue recovery error: {e}")
+            await asyncio.sleep(MAIL_QUEUE_RECOVER_INTERVAL)
+
+    async def run(self):
+        """Run the worker pool until cancelled"""
+        await asyncio.gather(self._recover_loop(), *(self._worker() for _ in range(self.workers)))
+
+    def metrics(self) -> dict:
+        return {**self._stats, "workers": self.workers}
+
+
+mail_queue = MailQueue()
@@ -0,0 +1,473 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.messages import HumanMessage
+from sqlalchemy import select, update, delete, func, literal, or_, String, DateTime
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.database import AsyncSessionLocal
+from ..db.models import MemoryFact, MemoryEmbedding, MemoryEdge, ArchivedMemoryFact, MemoryMaintenanceState
+from .memory_service import MemoryService, MEMORY_DEDUP_DISTANCE, invalidate_graph, llm, embedding_cache
+from .embeddings import embedding_provider
+from .ids import to_uuid
+
+logger = logging.getLogger("cortex-api")
+
+DEDUP_DELETE_BATCH = 500
+
+MEMORY_MAINTENANCE_INTERVAL = timedelta(hours=float(os.getenv("MEMORY_MAINTENANCE_INTERVAL_HOURS", "24")))  # Per user
+MEMORY_MAINTENANCE_LOOP_INTERVAL = int(os.getenv("MEMORY_MAINTENANCE_LOOP_INTERVAL", "3600"))  # seconds
+MEMORY_MAINTENANCE_USERS_PER_RUN = int(os.getenv("MEMORY_MAINTENANCE_USERS_PER_RUN", "50"))
+MEMORY_MAINTENANCE_USER_PAUSE = float(os.getenv("MEMORY_MAINTENANCE_USER_PAUSE", "2.0"))  # seconds between users
+
+MEMORY_CLUSTER_DISTANCE = float(os.getenv("MEMORY_CLUSTER_DISTANCE", "0.2"))  # Looser than dedup: related, not equal
+MEMORY_CLUSTER_MAX_SIZE = 8
+MEMORY_CONSOLIDATION_MAX_CLUSTERS = int(os.getenv("MEMORY_CONSOLIDATION_MAX_CLUSTERS", "10"))  # Per user run / LLM call
+
+MEMORY_STALE_AFTER = timedelta(days=int(os.getenv("MEMORY_STALE_DAYS", "30")))
+MEMORY_DECAY_HALF_LIFE_DAYS = float(os.getenv("MEMORY_DECAY_HALF_LIFE_DAYS", "60"))
+MEMORY_DECAY_MAX_IMPORTANCE = 0.6  # Only low-importance facts decay
+MEMORY_ARCHIVE_IMPORTANCE = float(os.getenv("MEMORY_ARCHIVE_IMPORTANCE", "0.15"))
+MEMORY_MAX_FACTS_PER_USER = int(os.getenv("MEMORY_MAX_FACTS_PER_USER", "500"))
+PROTECTED_CATEGORIES = ["personal", "preference"]  # Never decayed or archived, as in delete_all_user_data
+MEMORY_REEMBED_BATCH = int(os.getenv("MEMORY_REEMBED_BATCH", "200"))  # Facts re-embedded per user run
+
+
+class MemoryMaintenanceService:
+    """Offline clean-up jobs over stored memory facts"""
+
+    @staticmethod
+    async def dedupe_user(user_id: str, db: AsyncSession, threshold: float = MEMORY_DEDUP_DISTANCE) -> int:
+        """Merge a user's near-duplicate facts; returns how many facts were removed.
+
+        Facts are visited most important / most recent first, so each duplicate group keeps that
+        fact, with the group's highest importance and merged metadata. Profile facts keep only the
+        latest fact per ``profile_field`` and are never merged with plain facts by similarity.
+        """
+        user_uuid = to_uuid(user_id)
+        stmt = select(
+            MemoryFact.id, MemoryFact.importance, MemoryFact.metadata_json, MemoryEmbedding.embedding
+        ).join(
+            MemoryEmbedding, MemoryFact.id == MemoryEmbedding.memory_fact_id
+        ).where(
+            MemoryFact.user_id == user_uuid,
+            MemoryEmbedding.embedding_model == embedding_provider.model
+        ).order_by(MemoryFact.importance.desc(), MemoryFact.updated_at.desc(), MemoryFact.id)
+        rows = (await db.execute(stmt)).all()
+        if len(rows) < 2:
+            return 0
+
+        vectors = np.array([np.asarray(row.embedding, dtype=np.float32) for row in rows])
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        plain: List[int] = []  # Kept facts without a profile field, the only similarity-merge targets
+        survivors: Dict[int, dict] = {}
+        profile_fields: Dict[str, int] = {}
+        removed: List[uuid.UUID] = []
+
+        for index, row in enumerate(rows):
+            try:
+                metadata = json.loads(row.metadata_json or "{}")
+            except ValueError:
+                metadata = {}
+
+            target = None
+            field = metadata.get("profile_field")
+            if field and field in profile_fields:
+                target = profile_fields[field]
+            elif not field and plain:
+                similarities = vectors[plain] @ vectors[index]
+                best = int(np.argmax(similarities))
+                if 1.0 - float(similarities[best]) <= threshold:
+                    target = plain[best]
+
+            if target is None:
+                survivors[index] = {"importance": row.importance or 0.0, "metadata": metadata, "changed": False}
+                if field:
+                    profile_fields[field] = index
+                else:
+                    plain.append(index)
+                continue
+
+            survivor = survivors[target]
+            survivor["importance"] = max(survivor["importance"], row.importance or 0.0)
+            survivor["metadata"] = {**metadata, **survivor["metadata"]}
+            survivor["changed"] = True
+            removed.append(row.id)
+
+        for index, survivor in survivors.items():
+            if survivor["changed"]:
+                await db.execute(update(MemoryFact).where(MemoryFact.id == rows[index].id).values(
+                    importance=survivor["importance"],
+                    metadata_json=json.dumps(survivor["metadata"])
+                ))
+
+        for start in range(0, len(removed), DEDUP_DELETE_BATCH):
+            batch = removed[start:start + DEDUP_DELETE_BATCH]
+            await db.execute(delete(MemoryEmbedding).where(MemoryEmbedding.memory_fact_id.in_(batch)))
+            await db.execute(delete(MemoryFact).where(MemoryFact.id.in_(batch)))
+
+        await db.commit()
+        invalidate_graph(str(user_uuid))
+        return len(removed)
+
+    @staticmethod
+    async def archive_facts(user_uuid: uuid.UUID, fact_ids: List[uuid.UUID], reason: str, db: AsyncSession) -> int:
+        """Move facts to the cold archive table, dropping their embeddings and graph edges (no commit)"""
+        for start in range(0, len(fact_ids), DEDUP_DELETE_BATCH):
+            batch = fact_ids[start:start + DEDUP_DELETE_BATCH]
+            await db.execute(insert(ArchivedMemoryFact).from_select(
+                ["id", "user_id", "fact", "category", "importance", "metadata_json", "reason",
+                 "created_at", "updated_at", "archived_at"],
+                select(
+                    MemoryFact.id, MemoryFact.user_id, MemoryFact.fact, MemoryFact.category, MemoryFact.importance,
+                    MemoryFact.metadata_json, literal(reason, String), MemoryFact.created_at, MemoryFact.updated_at,
+                    literal(datetime.utcnow(), DateTime)
+                ).where(MemoryFact.user_id == user_uuid, MemoryFact.id.in_(batch))
+            ).on_conflict_do_nothing(index_elements=["id"]))
+            await db.execute(delete(MemoryEdge).where(MemoryEdge.memory_fact_id.in_(batch)))
+            await db.execute(delete(MemoryEmbedding).where(MemoryEmbedding.memory_fact_id.in_(batch)))
+            await db.execute(delete(MemoryFact).where(MemoryFact.id.in_(batch)))
+        return len(fact_ids)
+
+    @staticmethod
+    async def reembed_user(user_uuid: uuid.UUID, db: AsyncSession, limit: int = MEMORY_REEMBED_BATCH) -> int:
+        """Embed facts that have no vector from the current embedding model (e.g. after switching
+        provider); returns how many were re-embedded. Until then such facts are invisible to search."""
+        current = select(MemoryEmbedding.id).where(
+            MemoryEmbedding.memory_fact_id == MemoryFact.id,
+            MemoryEmbedding.embedding_model == embedding_provider.model
+        ).exists()
+        rows = (await db.execute(select(MemoryFact.id, MemoryFact.fact).where(
+            MemoryFact.user_id == user_uuid, ~current
+        ).order_by(MemoryFact.importance.desc(), MemoryFact.id).limit(limit))).all()
+        if not rows:
+            return 0
+
+        embeddings = await embedding_cache.aembed_documents([row.fact for row in rows])
+        fact_ids = [row.id for row in rows]
+        await db.execute(delete(MemoryEmbedding).where(MemoryEmbedding.memory_fact_id.in_(fact_ids)))
+        await db.execute(insert(MemoryEmbedding).values([{
+            "memory_fact_id": row.id,
+            "user_id": user_uuid,
+            "embedding": embedding,
+            "embedding_model": embedding_provider.model,
+            "embedding_dim": embedding_provider.dimensions
+        } for row, embedding in zip(rows, embeddings)]))
+        await db.commit()
+        return len(rows)
+
+    @staticmethod
+    async def decay_user(user_uuid: uuid.UUID, db: AsyncSession, elapsed: timedelta) -> int:
+        """Decay stale low-importance facts for ``elapsed`` time and archive what falls out of the working set.
+
+        Returns how many facts were archived. Facts below ``MEMORY_ARCHIVE_IMPORTANCE`` are archived,
+        and so are the least important ones beyond ``MEMORY_MAX_FACTS_PER_USER``.
+        """
+        now = datetime.utcnow()
+        decayable = [
+            MemoryFact.user_id == user_uuid,
+            MemoryFact.category.notin_(PROTECTED_CATEGORIES),
+            MemoryFact.updated_at < now - MEMORY_STALE_AFTER
+        ]
+
+        factor = 0.5 ** (elapsed.total_seconds() / 86400 / MEMORY_DECAY_HALF_LIFE_DAYS)
+        await db.execute(update(MemoryFact).where(
+            *decayable, MemoryFact.importance < MEMORY_DECAY_MAX_IMPORTANCE
+        ).values(
+            importance=MemoryFact.importance * factor,
+            updated_at=MemoryFact.updated_at  # Decay must not make a fact look fresh
+        ))
+
+        decayed = (await db.execute(select(MemoryFact.id).where(
+            *decayable, MemoryFact.importance < MEMORY_ARCHIVE_IMPORTANCE
+        ))).scalars().all()
+        archived = await MemoryMaintenanceService.archive_facts(user_uuid, list(decayed), "decayed", db)
+
+        total = (await db.execute(select(func.count()).select_from(MemoryFact).where(
+            MemoryFact.user_id == user_uuid
+        ))).scalar() or 0
+        if total > MEMORY_MAX_FACTS_PER_USER:
+            overflow = (await db.execute(select(MemoryFact.id).where(
+                MemoryFact.user_id == user_uuid,
+                MemoryFact.category.notin_(PROTECTED_CATEGORIES)
+            ).order_by(
+                MemoryFact.importance, MemoryFact.updated_at, MemoryFact.id
+            ).limit(total - MEMORY_MAX_FACTS_PER_USER))).scalars().all()
+            archived += await MemoryMaintenanceService.archive_facts(user_uuid, list(overflow), "overflow", db)
+
+        return archived
+
+    @staticmethod
+    def cluster_facts(rows: list, since: Optional[datetime]) -> List[List[int]]:
+        """Leader clustering of fact embeddings; returns clusters (row indexes) worth consolidating.
+
+        Rows are visited most important first and join the closest cluster leader within
+        ``MEMORY_CLUSTER_DISTANCE``. Only clusters with a fact updated since ``since`` are returned,
+        so each run only revisits what changed.
+        """
+        vectors = np.array([np.asarray(row.embedding, dtype=np.float32) for row in rows])
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        leaders: List[int] = []
+        clusters: List[List[int]] = []
+        for index in range(len(rows)):
+            target = None
+            if leaders:
+                similarities = vectors[leaders] @ vectors[index]
+                for best in np.argsort(-similarities):
+                    if 1.0 - float(similarities[best]) > MEMORY_CLUSTER_DISTANCE:
+                        break
+                    if len(clusters[best]) < MEMORY_CLUSTER_MAX_SIZE:
+                        target = int(best)
+                        break
+            if target is None:
+                leaders.append(index)
+                clusters.append([index])
+            else:
+                clusters[target].append(index)
+
+        return [
+            cluster for cluster in clusters
+            if len(cluster) > 1 and (since is None or any(rows[i].updated_at >= since for i in cluster))
+        ]
+
+    @staticmethod
+    async def merge_clusters(clusters: List[List[str]]) -> Dict[int, List[Dict]]:
+        """One LLM call that rewrites each cluster of related facts as a few consolidated facts"""
+        listing = "\n\n".join(
+            f"Cluster {i}:\n" + "\n".join(f"- {fact}" for fact in facts) for i, facts in enumerate(clusters)
+        )
+        prompt = f"""You are maintaining a personal assistant's long-term memory about a user.
+Each cluster below holds related facts. Rewrite every cluster as the smallest set of concise, specific facts
+that keeps all the information. When facts conflict, prefer the later one in the list.
+
+{listing}
+
+Return a JSON array with one object per cluster:
+{{"cluster": <cluster number>, "facts": [{{"fact": "...", "category": one of ["preference", "habit", "project", "relationship", "constraint", "event", "personal"]}}]}}
+
+Only return JSON, no other text."""
+
+        response = await llm.ainvoke([HumanMessage(content=prompt)])
+        content = getattr(response, 'content', str(response))
+        if "```json" in content:
+            content = content.split("```json")[1].split("```")[0].strip()
+        elif "```" in content:
+            content = content.split("```")[1].split("```")[0].strip()
+
+        merged = {}
+        data = json.loads(content)
+        for item in data if isinstance(data, list) else []:
+            if not isinstance(item, dict) or not isinstance(item.get("cluster"), int):
+                continue
+            facts = [f for f in item.get("facts") or [] if isinstance(f, dict) and f.get("fact")]
+            if 0 <= item["cluster"] < len(clusters) and facts:
+                merged[item["cluster"]] = facts
+        return merged
+
+    @staticmethod
+    async def consolidate_user(user_id: str, db: AsyncSession, since: Optional[datetime]) -> Tuple[int, bool]:
+        """Merge clusters of related facts; returns (facts replaced, whether every cluster was handled)"""
+        user_uuid = to_uuid(user_id)
+        if since is not None:
+            changed = (await db.execute(select(MemoryFact.id).where(
+                MemoryFact.user_id == user_uuid, MemoryFact.updated_at >= since
+            ).limit(1))).first()
+            if not changed:
+                return 0, True
+
+        rows = (await db.execute(select(
+            MemoryFact.id, MemoryFact.fact, MemoryFact.category, MemoryFact.importance,
+            MemoryFact.metadata_json, MemoryFact.updated_at, MemoryEmbedding.embedding
+        ).join(
+            MemoryEmbedding, MemoryFact.id == MemoryEmbedding.memory_fact_id
+        ).where(
+            MemoryFact.user_id == user_uuid,
+            MemoryEmbedding.embedding_model == embedding_provider.model
+        ).order_by(MemoryFact.importance.desc(), MemoryFact.updated_at.desc(), MemoryFact.id))).all()
+
+        metadata = {}
+        for row in rows:
+            try:
+                metadata[row.id] = json.loads(row.metadata_json or "{}")
+            except ValueError:
+                metadata[row.id] = {}
+        # Profile facts are kept one per field by store_facts; never fold them into others
+        rows = [row for row in rows if "profile_field" not in metadata[row.id]]
+        if len(rows) < 2:
+            return 0, True
+
+        clusters = MemoryMaintenanceService.cluster_facts(rows, since)
+        complete = len(clusters) <= MEMORY_CONSOLIDATION_MAX_CLUSTERS
+        clusters = clusters[:MEMORY_CONSOLIDATION_MAX_CLUSTERS]
+        if not clusters:
+            return 0, True
+
+        # Oldest first inside each cluster so the LLM prefers newer facts on conflicts
+        clusters = [sorted(cluster, key=lambda i: rows[i].updated_at) for cluster in clusters]
+        merged = await MemoryMaintenanceService.merge_clusters([[rows[i].fact for i in c] for c in clusters])
+
+        sources, new_facts = [], []
+        for index, facts in merged.items():
+            members = [rows[i] for i in clusters[index]]
+            combined = {}
+            for member in members:
+                combined.update(metadata[member.id])
+            combined["consolidated_from"] = len(members)
+            importance = max(member.importance or 0.0 for member in members)
+            categories = [member.category for member in members]
+            for fact in facts:
+                new_facts.append({
+                    "fact": str(fact["fact"]),
+                    "category": fact.get("category") or max(set(categories), key=categories.count),
+                    "importance": importance,
+                    "metadata": combined
+                })
+            sources.extend(member.id for member in members)
+
+        if not new_facts:
+            return 0, complete
+
+        # Archive first so store_facts cannot merge the new facts back into their sources; store_facts commits both
+        await MemoryMaintenanceService.archive_facts(user_uuid, sources, "consolidated", db)
+        await MemoryService.store_facts(user_id, new_facts, db)
+        return len(sources), complete
+
+    @staticmethod
+    async def maintain_user(user_id: str) -> Optional[Dict[str, int]]:
+        """Re-embed, decay, archive and consolidate one user's facts; None if the user is not due yet.
+
+        Users are claimed through ``memory_maintenance_state`` so each is processed at most once
+        per ``MEMORY_MAINTENANCE_INTERVAL`` even with several workers. Every phase commits on its
+        own and the consolidation watermark only moves once all clusters were merged, so an
+        interrupted run is picked up by the next one.
+        """
+        user_uuid = to_uuid(user_id)
+        started = datetime.utcnow()
+        due = or_(MemoryMaintenanceState.last_run_at.is_(None),
+                  MemoryMaintenanceState.last_run_at < started - MEMORY_MAINTENANCE_INTERVAL)
+
+        async with AsyncSessionLocal() as db:
+            state = (await db.execute(select(MemoryMaintenanceState).where(
+                MemoryMaintenanceState.user_id == user_uuid
+            ))).scalar_one_or_none()
+            previous_run = state.last_run_at if state else None
+            since = state.consolidated_until if state else None
+
+            claimed = (await db.execute(insert(MemoryMaintenanceState).values(
+                user_id=user_uuid, last_run_at=started, facts_consolidated=0, facts_archived=0
+            ).on_conflict_do_update(
+                index_elements=["user_id"], set_={"last_run_at": started}, where=due
+            ).returning(MemoryMaintenanceState.user_id))).first()
+            await db.commit()
+            if not claimed:
+                return None
+
+        try:
+            async with AsyncSessionLocal() as db:
+                await MemoryMaintenanceService.reembed_user(user_uuid, db)
+
+            async with AsyncSessionLocal() as db:
+                archived = await MemoryMaintenanceService.decay_user(
+                    user_uuid, db, started - (previous_run or started - MEMORY_MAINTENANCE_INTERVAL)
+                )
+                await db.commit()
+
+            async with AsyncSessionLocal() as db:
+                consolidated, complete = await MemoryMaintenanceService.consolidate_user(user_id, db, since)
+
+            async with AsyncSessionLocal() as db:
+                values = {
+                    "facts_consolidated": MemoryMaintenanceState.facts_consolidated + consolidated,
+                    "facts_archived": MemoryMaintenanceState.facts_archived + archived
+                }
+                if complete:
+                    values["consolidated_until"] = started
+                await db.execute(update(MemoryMaintenanceState).where(
+                    MemoryMaintenanceState.user_id == user_uuid
+                ).values(**values))
+                await db.commit()
+        finally:
+            invalidate_graph(str(user_uuid))
+
+        return {"archived": archived, "consolidated": consolidated}
+
+    @staticmethod
+    async def maintain_due_users(limit: int = MEMORY_MAINTENANCE_USERS_PER_RUN) -> Dict[str, Dict[str, int]]:
+        """Run ``maintain_user`` for up to ``limit`` due users, least recently maintained first"""
+        cutoff = datetime.utcnow() - MEMORY_MAINTENANCE_INTERVAL
+        async with AsyncSessionLocal() as db:
+            users = select(MemoryFact.user_id).distinct().subquery()
+            stmt = select(users.c.user_id).outerjoin(
+                MemoryMaintenanceState, MemoryMaintenanceState.user_id == users.c.user_id
+            ).where(or_(
+                MemoryMaintenanceState.last_run_at.is_(None), MemoryMaintenanceState.last_run_at < cutoff
+            )).order_by(MemoryMaintenanceState.last_run_at.asc().nullsfirst()).limit(limit)
+            user_ids = [str(uid) for uid in (await db.execute(stmt)).scalars().all()]
+
+        results = {}
+        for user_id in user_ids:
+            try:
+                result = await MemoryMaintenanceService.maintain_user(user_id)
+                if result is not None:
+                    results[user_id] = result
+            except Exception as e:
+                logger.error(f"Memory maintenance error for {user_id}: {e}")
+            # Spread LLM and embedding calls out instead of bursting through every user
+            await asyncio.sleep(MEMORY_MAINTENANCE_USER_PAUSE)
+        return results
+
+    @staticmethod
+    async def dedupe_all() -> Dict[str, int]:
+        """Run ``dedupe_user`` for every user with stored facts, one transaction per user"""
+        async with AsyncSessionLocal() as db:
+            user_ids = [str(uid) for uid in (await db.execute(select(MemoryFact.user_id).distinct())).scalars().all()]
+
+        results = {}
+        for user_id in user_ids:
+            try:
+                async with AsyncSessionLocal() as db:
+                    results[user_id] = await MemoryMaintenanceService.dedupe_user(user_id, db)
+            except Exception as e:
+                logger.error(f"Memory dedup error for {user_id}: {e}")
+        return results
+
+
+async def run_memory_maintenance_loop():
+    """Periodically consolidate and decay the memory of users who are due"""
+    while True:
+        await asyncio.sleep(MEMORY_MAINTENANCE_LOOP_INTERVAL)
+        try:
+            results = await MemoryMaintenanceService.maintain_due_users()
+            if results:
+                logger.info(
+                    f"Memory maintenance: {len(results)} users, "
+                    f"{sum(r['consolidated'] for r in results.values())} facts consolidated, "
+                    f"{sum(r['archived'] for r in results.values())} archived"
+                )
+        except Exception as e:
+            logger.error(f"Memory maintenance error: {e}")
+
+
+if __name__ == "__main__":
+    # One-off jobs over existing data:
+    #   python -m app.services.memory_maintenance             (dedupe)
+    #   python -m app.services.memory_maintenance consolidate (consolidate/decay due users)
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:] == ["consolidate"]:
+        results = asyncio.run(MemoryMaintenanceService.maintain_due_users(limit=sys.maxsize))
+        logger.info(f"Maintained {len(results)} users")
+    else:
+        removed = asyncio.run(MemoryMaintenanceService.dedupe_all())
+        logger.info(f"Removed {sum(removed.values())} duplicate facts across {len(removed)} users")
@@ -1,22 +1,132 @@
 import os
 from typing import List, Optional, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, text, update, delete, cast, event, func, literal, union_all, Float
+from sqlalchemy.dialects.postgresql import insert, JSONB
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage
-from ..db.models import MemoryFact, MemoryEmbedding
+from ..db.database import engine, AsyncSessionLocal
+from ..db.models import MemoryFact, MemoryEmbedding, MemoryEdge
+from .embedding_cache import EmbeddingCache
+from .embeddings import embedding_provider
+import bisect
 import json
+import math
+import re
+from collections import OrderedDict
 import uuid
+from datetime import datetime
+import logging
 
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+logger = logging.getLogger("cortex-api")
 
 llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key=os.getenv("GOOGLE_API_KEY"))
-embeddings_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+# Memory texts and search queries repeat a lot; bulk email/attachment indexing uses the provider directly
+embedding_cache = EmbeddingCache(embedding_provider)
+
+# HNSW candidate list size per query; higher is more accurate and slower
+MEMORY_EF_SEARCH = int(os.getenv("MEMORY_EF_SEARCH", "40"))
+# Facts closer than this (cosine distance) to an existing fact are merged into it
+MEMORY_DEDUP_DISTANCE = float(os.getenv("MEMORY_DEDUP_DISTANCE", "0.08"))
+# Reciprocal-rank fusion constant and per-signal weights for hybrid retrieval
+MEMORY_RRF_K = 60
+MEMORY_SEMANTIC_WEIGHT = float(os.getenv("MEMORY_SEMANTIC_WEIGHT", "1.0"))
+MEMORY_IMPORTANCE_WEIGHT = float(os.getenv("MEMORY_IMPORTANCE_WEIGHT", "1.0"))
+
+@event.listens_for(engine.sync_engine, "connect")
+def _vector_search_defaults(dbapi_connection, connection_record):
+    """Session-level HNSW defaults, set once per pooled connection so queries need no extra round trip"""
+    autocommit = dbapi_connection.autocommit
+    dbapi_connection.autocommit = True
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"SET hnsw.ef_search = {MEMORY_EF_SEARCH}")
+        # pgvector >= 0.8 can keep scanning the index until enough rows pass the user filter
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        row = cursor.fetchone()
+        version = tuple(int(part) for part in row[0].split(".")[:2]) if row else (0, 0)
+        if version >= (0, 8):
+            cursor.execute("SET hnsw.iterative_scan = relaxed_order")
+            connection_record.info["iterative_scan"] = True
+    except Exception as e:
+        logger.warning(f"Vector search defaults not applied: {e}")
+    finally:
+        cursor.close()
+        dbapi_connection.autocommit = autocommit
+
+def cosine_distance(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return 1.0 - dot / norm if norm else 1.0
+
+async def tune_vector_search(db: AsyncSession, ef_search: int):
+    """Override the HNSW candidate list size for the current transaction (no-op at the default)"""
+    if int(ef_search) != MEMORY_EF_SEARCH:
+        await db.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+
+async def nearest_rows(db: AsyncSession, stmt, limit: int) -> list:
+    """Rows of a per-user ``ORDER BY distance LIMIT`` query, exact when the index scan falls short.
+
+    The HNSW index is scanned across all users and the user filter applied afterwards, so without
+    pgvector's iterative scan (or when it stops early) fewer than ``limit`` rows can come back even
+    though the user has more. Such queries are re-run with index scans off, which turns them into
+    an exact scan of the user's own rows via the user_id index.
+    """
+    connection = await db.connection()
+    rows = (await db.execute(stmt)).all() if connection.info.get("iterative_scan") else []
+    if len(rows) < limit:
+        await db.execute(text("SET LOCAL enable_indexscan = off"))
+        rows = (await db.execute(stmt)).all()
+        await db.execute(text("SET LOCAL enable_indexscan = on"))
+    return rows
+
+ENTITY_METADATA_KEYS = {"person", "project", "company", "organization", "client", "team", "location", "product"}
+ENTITY_STOPWORDS = {
+    "user", "the", "my", "i", "a", "an", "he", "she", "they", "it", "this", "that", "updated", "profile",
+    # Clock and timezone tokens would link every fact with a time in it
+    "am", "pm", "utc", "gmt", "ist", "est", "edt", "cst", "cdt", "pst", "pdt", "cet", "bst",
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+}
+# Words capitalized only because they open a sentence ("Prefers ...", "Meeting with John")
+SENTENCE_STARTERS = {
+    "prefers", "prefer", "likes", "like", "loves", "hates", "dislikes", "wants", "needs", "works", "lives",
+    "is", "was", "has", "had", "uses", "plans", "enjoys", "attends", "meets", "meeting", "call", "calls",
+    "email", "emails", "avoid", "avoids", "usually", "always", "never", "often", "every", "each", "no", "not",
+    "on", "in", "at", "for", "from", "to", "with", "after", "before", "during", "their", "his", "her", "our",
+    "your", "we", "you", "will", "should", "must", "can", "currently", "recently", "wife", "husband",
+}
+# Capitalized phrases; dots only inside a word ("Node.js"), so a phrase never runs across sentences
+PROPER_NOUN = re.compile(r"\b[A-Z][\w&-]*(?:\.[\w&-]+)*(?:[ \t]+[A-Z][\w&-]*(?:\.[\w&-]+)*)*")
+KEYWORD = re.compile(r"[a-z0-9]+")
+MEMORY_GRAPH_CACHE_USERS = int(os.getenv("MEMORY_GRAPH_CACHE_USERS", "128"))
+
+def extract_entities(fact: str, metadata: Dict[str, Any] = None) -> set:
+    """Normalized entity names for a fact: entity-like metadata values plus capitalized phrases"""
+    entities = set()
+    for key, value in (metadata or {}).items():
+        if key in ENTITY_METADATA_KEYS and isinstance(value, str) and value.strip():
+            entities.add(value.strip().lower()[:255])
+    fact = fact or ""
+    for match in PROPER_NOUN.finditer(fact):
+        words = match.group(0).split()
+        if not fact[:match.start()].strip() or fact[:match.start()].rstrip()[-1] in ".!?:;":
+            # Sentence-initial: the first word is capitalized by position, not because it is a name
+            words = words[1:] if words[0].lower() in SENTENCE_STARTERS else words
+        words = [w for w in words if w.lower() not in ENTITY_STOPWORDS]
+        if words and len(" ".join(words)) > 1:
+            entities.add(" ".join(words).lower()[:255])
+    return entities
+
+def _keywords(text: str) -> set:
+    return {w for w in KEYWORD.findall((text or "").lower()) if len(w) > 2 and w not in ENTITY_STOPWORDS}
 
 class MemoryNode:
     """A node in the memory graph"""
-    def __init__(self, fact: str, category: str, importance: float, source: str, metadata: Dict[str, Any] = None):
-        self.id = str(uuid.uuid4())
+    __slots__ = ("id", "fact", "category", "importance", "source", "metadata", "created_at", "updated_at", "entities")
+
+    def __init__(self, fact: str, category: str, importance: float, source: str, metadata: Dict[str, Any] = None,
+                 id: str = None, entities: set = None):
+        self.id = id or str(uuid.uuid4())
         self.fact = fact
         self.category = category  # preference, habit, project, relationship, constraint, event
         self.importance = importance  # 0.0 to 1.0
@@ -24,42 +134,115 @@ class MemoryNode:
         self.metadata = metadata or {}
         self.created_at = None
         self.updated_at = None
-        self.connections = []  # connected memory node IDs
+        self.entities = entities if entities is not None else set()  # entity names this fact is linked to
 
 class MemoryGraph:
-    """Graph-based memory system for the agent"""
+    """Per-user knowledge graph: facts linked through shared entities, with lookup indexes.
+
+    Category, importance (kept sorted), keyword and entity indexes make filtering, keyword
+    search and entity expansion independent of the total number of facts.
+    """
     
     def __init__(self):
         self.nodes: Dict[str, MemoryNode] = {}
+        self.by_category: Dict[str, set] = {}
+        self.by_importance: List[tuple] = []  # sorted (-importance, node id)
+        self.by_keyword: Dict[str, set] = {}
+        self.by_entity: Dict[str, set] = {}
     
     def add_node(self, node: MemoryNode):
-        """Add a memory node"""
+        """Add (or replace) a memory node and index it"""
+        if node.id in self.nodes:
+            self.remove_node(node.id)
         self.nodes[node.id] = node
+        self.by_category.setdefault(node.category, set()).add(node.id)
+        bisect.insort(self.by_importance, (-(node.importance or 0.0), node.id))
+        for word in _keywords(node.fact):
+            self.by_keyword.setdefault(word, set()).add(node.id)
+        for entity in node.entities:
+            self.by_entity.setdefault(entity, set()).add(node.id)
         return node
+
+    def remove_node(self, node_id: str):
+        node = self.nodes.pop(node_id, None)
+        if node is None:
+            return
+        self.by_category.get(node.category, set()).discard(node_id)
+        index = bisect.bisect_left(self.by_importance, (-(node.importance or 0.0), node_id))
+        if index < len(self.by_importance) and self.by_importance[index][1] == node_id:
+            self.by_importance.pop(index)
+        for word in _keywords(node.fact):
+            self.by_keyword.get(word, set()).discard(node_id)
+        for entity in node.entities:
+            self.by_entity.get(entity, set()).discard(node_id)
     
-    def connect_nodes(self, node_id1: str, node_id2: str):
-        """Connect two memory nodes"""
-        if node_id1 in self.nodes and node_id2 in self.nodes:
-            self.nodes[node_id1].connections.append(node_id2)
-            self.nodes[node_id2].connections.append(node_id1)
+    def connect(self, entity: str, node_id: str):
+        """Link an entity to a fact"""
+        node = self.nodes.get(node_id)
+        if node is not None:
+            node.entities.add(entity)
+            self.by_entity.setdefault(entity, set()).add(node_id)
     
-    def get_related_memories(self, category: str = None, min_importance: float = 0.0) -> List[MemoryNode]:
-        """Get memories filtered by category and importance"""
+    def get_related_memories(self, category: str = None, min_importance: float = 0.0, limit: int = None) -> List[MemoryNode]:
+        """Get memories filtered by category and importance, most important first"""
+        end = bisect.bisect_right(self.by_importance, (-min_importance, "\uffff"))
         results = []
-        for node in self.nodes.values():
-            if node.importance >= min_importance:
-                if category is None or node.category == category:
-                    results.append(node)
-        return sorted(results, key=lambda x: x.importance, reverse=True)
+        allowed = self.by_category.get(category, set()) if category is not None else None
+        for _, node_id in self.by_importance[:end]:
+            if allowed is None or node_id in allowed:
+                results.append(self.nodes[node_id])
+                if limit and len(results) >= limit:
+                    break
+        return results
     
     def search_memories(self, query: str) -> List[MemoryNode]:
-        """Search memories by keyword"""
-        query_lower = query.lower()
-        results = []
-        for node in self.nodes.values():
-            if query_lower in node.fact.lower() or query_lower in node.category:
-                results.append(node)
-        return sorted(results, key=lambda x: x.importance, reverse=True)
+        """Facts containing every keyword of the query (or in the category named by it)"""
+        words = _keywords(query)
+        ids = set(self.by_category.get(query.lower().strip(), set()))
+        if words:
+            matches = set.intersection(*(self.by_keyword.get(w, set()) for w in words))
+            ids |= matches
+        return sorted((self.nodes[i] for i in ids), key=lambda n: (-(n.importance or 0.0), n.id))
+
+    def entities_in(self, text: str) -> set:
+        """Known entities mentioned in free text"""
+        lowered = (text or "").lower()
+        words = _keywords(text)
+        found = {e for e in extract_entities(text) if e in self.by_entity}
+        found |= {w for w in words if w in self.by_entity}
+        # Multi-word entities mentioned in lower case ("project x")
+        found |= {e for e in self.by_entity if " " in e and e in lowered}
+        return found
+
+    def expand(self, entities: set, depth: int = 2, limit: int = 10, exclude: set = None) -> List[MemoryNode]:
+        """Facts reachable from the entities through shared entities, nearest hop first, then by importance"""
+        seen_entities, frontier = set(entities), set(entities)
+        hops: Dict[str, int] = {}
+        for hop in range(depth):
+            reached = set()
+            for entity in frontier:
+                reached |= self.by_entity.get(entity, set())
+            for node_id in reached:
+                hops.setdefault(node_id, hop)
+            frontier = set()
+            for node_id in reached:
+                frontier |= self.nodes[node_id].entities - seen_entities
+            seen_entities |= frontier
+            if not frontier:
+                break
+        exclude = exclude or set()
+        ranked = sorted(
+            (self.nodes[i] for i in hops if i not in exclude),
+            key=lambda n: (hops[n.id], -(n.importance or 0.0), n.id)
+        )
+        return ranked[:limit]
+
+# Lazily loaded graphs of recently active users: user_id -> (watermark, MemoryGraph)
+_graph_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+def invalidate_graph(user_id: str):
+    """Drop a user's cached graph after their facts change; it is rebuilt on next use"""
+    _graph_cache.pop(str(user_id), None)
 
 class MemoryService:
     """Service for managing user memory with embeddings"""
@@ -109,10 +292,14 @@ Only return JSON, no other text. If no important facts, return []."""
                     source=source,
                     metadata=fact_data.get("metadata", {})
                 )
-                memory_nodes.append(node)
-                
-                # Store in database
-                await MemoryService.store_fact(user_id, node.fact, node.category, node.importance, node.metadata, db)
+                if node.fact:
+                    memory_nodes.append(node)
+
+            # Store in database: one embedding call and one transaction for all facts
+            await MemoryService.store_facts(user_id, [
+                {"fact": n.fact, "category": n.category, "importance": n.importance, "metadata": n.metadata}
+                for n in memory_nodes
+            ], db)
             
             return memory_nodes
         except (json.JSONDecodeError, AttributeError) as e:
@@ -122,85 +309,298 @@ Only return JSON, no other text. If no important facts, return []."""
     @staticmethod
     async def store_fact(user_id: str, fact: str, category: str, importance: float = 0.5, metadata: Dict = None, db: AsyncSession = None) -> MemoryFact:
         """Store a fact in the database with its embedding"""
+        stored = await MemoryService.store_facts(user_id, [{
+            "fact": fact, "category": category, "importance": importance, "metadata": metadata
+        }], db)
+        return stored[0]
+
+    @staticmethod
+    async def store_facts(user_id: str, facts: List[Dict[str, Any]], db: AsyncSession = None) -> List[MemoryFact]:
+        """Store several facts with one batched embedding call, multi-row inserts and a single commit.
+
+        Each item has ``fact`` and optionally ``category``, ``importance`` and ``metadata``. Facts that
+        duplicate an existing one (same ``profile_field`` in metadata, or within ``MEMORY_DEDUP_DISTANCE``)
+        are merged into it instead of inserted.
+        """
+        if not facts:
+            return []
+
         try:
             user_uuid = uuid.UUID(user_id)
         except ValueError:
             user_uuid = uuid.uuid5(uuid.NAMESPACE_DNS, user_id)
 
-        # Generate embedding
-        embedding = await embeddings_model.aembed_query(fact)
-
-        memory_fact = MemoryFact(
-            user_id=user_uuid,
-            fact=fact,
-            category=category,
-            importance=importance,
-            metadata_json=json.dumps(metadata or {})
-        )
-
-        if db:
-            db.add(memory_fact)
-            await db.flush() # Get the ID
-            
-            # Store embedding
-            memory_embedding = MemoryEmbedding(
-                memory_fact_id=memory_fact.id,
-                embedding=embedding
-            )
-            db.add(memory_embedding)
-            
-            await db.commit()
-            await db.refresh(memory_fact)
+        # Generate embeddings
+        embeddings = await embedding_cache.aembed_documents([f["fact"] for f in facts])
+
+        now = datetime.utcnow()
+        fact_rows = [{
+            "id": uuid.uuid4(),
+            "user_id": user_uuid,
+            "fact": f["fact"],
+            "category": f.get("category") or "personal",
+            "importance": f.get("importance", 0.5),
+            "metadata_json": json.dumps(f.get("metadata") or {}),
+            "created_at": now,
+            "updated_at": now
+        } for f in facts]
+
+        if not db:
+            return [MemoryFact(**row) for row in fact_rows]
+
+        new_rows, new_embeddings, stored = [], [], []
+        for row, embedding in zip(fact_rows, embeddings):
+            metadata = json.loads(row["metadata_json"])
+
+            # Near-copies within this batch collapse into the first one; profile facts only ever
+            # merge with the same profile field, and plain facts only with plain facts
+            field = metadata.get("profile_field")
+            twin = next((i for i, (other_row, other) in enumerate(zip(new_rows, new_embeddings))
+                         if json.loads(other_row["metadata_json"]).get("profile_field") == field
+                         and (field or cosine_distance(embedding, other) <= MEMORY_DEDUP_DISTANCE)), None)
+            if twin is not None:
+                kept = new_rows[twin]
+                kept["importance"] = max(kept["importance"], row["importance"])
+                if field:
+                    # The later value of a profile field wins
+                    kept.update(fact=row["fact"], category=row["category"],
+                                metadata_json=json.dumps({**json.loads(kept["metadata_json"]), **metadata}))
+                    new_embeddings[twin] = embedding
+                else:
+                    kept["metadata_json"] = json.dumps({**metadata, **json.loads(kept["metadata_json"])})
+                continue
+
+            match = await MemoryService.find_duplicate(user_uuid, embedding, metadata, db)
+            if match is None:
+                new_rows.append(row)
+                new_embeddings.append(embedding)
+                stored.append(row)
+                continue
+
+            # Merge into the existing fact instead of inserting a copy
+            values = {
+                "importance": max(match.importance or 0.0, row["importance"]),
+                "metadata_json": json.dumps({**json.loads(match.metadata_json or "{}"), **metadata}),
+                "updated_at": now
+            }
+            if "profile_field" in metadata:
+                # A profile field was edited: the new value replaces the old one
+                values.update(fact=row["fact"], category=row["category"])
+                await db.execute(delete(MemoryEdge).where(MemoryEdge.memory_fact_id == match.id))
+                await db.execute(update(MemoryEmbedding).where(
+                    MemoryEmbedding.memory_fact_id == match.id
+                ).values(
+                    embedding=embedding,
+                    embedding_model=embedding_provider.model,
+                    embedding_dim=embedding_provider.dimensions
+                ))
+            await db.execute(update(MemoryFact).where(MemoryFact.id == match.id).values(**values))
+            stored.append({**row, **values, "id": match.id})
+
+        if new_rows:
+            await db.execute(insert(MemoryFact).values(new_rows))
+            await db.execute(insert(MemoryEmbedding).values([{
+                "memory_fact_id": row["id"],
+                "user_id": user_uuid,
+                "embedding": embedding,
+                "embedding_model": embedding_provider.model,
+                "embedding_dim": embedding_provider.dimensions
+            } for row, embedding in zip(new_rows, new_embeddings)]))
+
+        # Entity -> fact edges for the knowledge graph
+        edges = {
+            (entity, row["id"])
+            for row in stored
+            for entity in extract_entities(row["fact"], json.loads(row["metadata_json"]))
+        }
+        if edges:
+            await db.execute(insert(MemoryEdge).values([
+                {"user_id": user_uuid, "entity": entity, "memory_fact_id": fact_id} for entity, fact_id in edges
+            ]).on_conflict_do_nothing(constraint="uq_memory_edges_edge"))
+        await db.commit()
+        invalidate_graph(str(user_uuid))
+
+        return [MemoryFact(**row) for row in stored]
 
-        return memory_fact
+    @staticmethod
+    async def find_duplicate(user_uuid: uuid.UUID, embedding: List[float], metadata: Dict[str, Any], db: AsyncSession):
+        """Existing fact a new one should merge into: same profile field, or for plain facts the nearest
+        plain fact within the threshold (profile and plain facts are never merged into each other)"""
+        if metadata.get("profile_field"):
+            stmt = select(MemoryFact.id, MemoryFact.importance, MemoryFact.metadata_json).where(
+                MemoryFact.user_id == user_uuid,
+                cast(MemoryFact.metadata_json, JSONB)["profile_field"].astext == metadata["profile_field"]
+            ).order_by(MemoryFact.updated_at.desc()).limit(1)
+            return (await db.execute(stmt)).first()
+
+        distance = MemoryEmbedding.embedding.cosine_distance(embedding)
+        await tune_vector_search(db, MEMORY_EF_SEARCH)
+        stmt = select(MemoryFact.id, MemoryFact.importance, MemoryFact.metadata_json, distance.label("distance")).join(
+            MemoryEmbedding, MemoryFact.id == MemoryEmbedding.memory_fact_id
+        ).where(
+            MemoryEmbedding.user_id == user_uuid,
+            MemoryEmbedding.embedding_model == embedding_provider.model,
+            cast(MemoryFact.metadata_json, JSONB)["profile_field"].astext.is_(None)
+        ).order_by(distance).limit(1)
+        rows = await nearest_rows(db, stmt, 1)
+        match = rows[0] if rows else None
+        return match if match is not None and match.distance <= MEMORY_DEDUP_DISTANCE else None
 
     @staticmethod
-    async def search_semantic_memories(user_id: str, query: str, db: AsyncSession, limit: int = 5) -> List[str]:
-        """Search memories using semantic similarity (pgvector)"""
+    async def search_semantic_memories(
+        user_id: str, query: str, db: AsyncSession, limit: int = 5, ef_search: int = MEMORY_EF_SEARCH
+    ) -> List[str]:
+        """Search memories using semantic similarity (pgvector HNSW, cosine distance)"""
         try:
             user_uuid = uuid.UUID(user_id)
         except ValueError:
             user_uuid = uuid.uuid5(uuid.NAMESPACE_DNS, user_id)
 
         # Generate query embedding
-        query_embedding = await embeddings_model.aembed_query(query)
+        query_embedding = await embedding_cache.aembed_query(query)
 
-        # Using pgvector's <-> operator for L2 distance (or <=> for cosine similarity if preferred)
-        # We need to join MemoryFact and MemoryEmbedding
-        stmt = select(MemoryFact).join(
+        # Filter on the embedding's own user_id and model so the ANN scan never touches other users'
+        # vectors or compares vectors from different embedding models
+        await tune_vector_search(db, max(ef_search, limit))
+        stmt = select(MemoryFact.fact).join(
             MemoryEmbedding, MemoryFact.id == MemoryEmbedding.memory_fact_id
         ).where(
-            MemoryFact.user_id == user_uuid
+            MemoryEmbedding.user_id == user_uuid,
+            MemoryEmbedding.embedding_model == embedding_provider.model
         ).order_by(
-            MemoryEmbedding.embedding.l2_distance(query_embedding)
+            MemoryEmbedding.embedding.cosine_distance(query_embedding)
         ).limit(limit)
-        
-        result = await db.execute(stmt)
-        facts = result.scalars().all()
 
-        return [f.fact for f in facts] if facts else []
+        return [row.fact for row in await nearest_rows(db, stmt, limit)]
 
     @staticmethod
-    async def retrieve_relevant_facts(user_id: str, query: str, db: AsyncSession, limit: int = 10) -> List[str]:
-        """Retrieve relevant facts for a query (hybrid of semantic and importance)"""
-        semantic_facts = await MemoryService.search_semantic_memories(user_id, query, db, limit=limit//2)
-        
-        # Also get high importance facts
+    async def retrieve_relevant_facts(
+        user_id: str, query: str, db: AsyncSession, limit: int = 10, ef_search: int = MEMORY_EF_SEARCH
+    ) -> List[str]:
+        """Retrieve relevant facts for a query: semantic and importance rankings fused (RRF) in SQL"""
         try:
             user_uuid = uuid.UUID(user_id)
         except ValueError:
             user_uuid = uuid.uuid5(uuid.NAMESPACE_DNS, user_id)
 
-        stmt = select(MemoryFact).where(
+        query_embedding = await embedding_cache.aembed_query(query)
+        await tune_vector_search(db, max(ef_search, limit))
+
+        distance = MemoryEmbedding.embedding.cosine_distance(query_embedding)
+        scan = select(MemoryEmbedding.memory_fact_id).where(
+            MemoryEmbedding.user_id == user_uuid,
+            MemoryEmbedding.embedding_model == embedding_provider.model
+        ).order_by(distance).limit(limit)
+        nearest_ids = [row.memory_fact_id for row in await nearest_rows(db, scan, limit)]
+
+        # Re-score just the neighbours found so the fusion below stays a single statement
+        nearest = select(
+            MemoryEmbedding.memory_fact_id.label("id"), distance.label("distance")
+        ).where(
+            MemoryEmbedding.user_id == user_uuid,
+            MemoryEmbedding.memory_fact_id.in_(nearest_ids),
+            MemoryEmbedding.embedding_model == embedding_provider.model
+        ).subquery("nearest")
+        semantic = select(
+            nearest.c.id,
+            func.row_number().over(order_by=(nearest.c.distance, nearest.c.id)).label("rank"),
+            literal(MEMORY_SEMANTIC_WEIGHT, Float).label("weight")
+        )
+
+        top = select(MemoryFact.id, MemoryFact.importance, MemoryFact.updated_at).where(
             MemoryFact.user_id == user_uuid
-        ).order_by(MemoryFact.importance.desc()).limit(limit//2)
-        
+        ).order_by(MemoryFact.importance.desc(), MemoryFact.updated_at.desc(), MemoryFact.id).limit(limit).subquery("top")
+        by_importance = select(
+            top.c.id,
+            func.row_number().over(order_by=(top.c.importance.desc(), top.c.updated_at.desc(), top.c.id)).label("rank"),
+            literal(MEMORY_IMPORTANCE_WEIGHT, Float).label("weight")
+        )
+
+        ranked = union_all(semantic, by_importance).subquery("ranked")
+        score = func.sum(ranked.c.weight / (MEMORY_RRF_K + ranked.c.rank)).label("score")
+        fused = select(ranked.c.id, score).group_by(ranked.c.id).subquery("fused")
+        stmt = select(MemoryFact.fact).join(
+            fused, MemoryFact.id == fused.c.id
+        ).order_by(fused.c.score.desc(), MemoryFact.id).limit(limit)
+
         result = await db.execute(stmt)
-        importance_facts = [f.fact for f in result.scalars().all()]
-        
-        # Combine and deduplicate
-        combined = list(set(semantic_facts + importance_facts))
-        return combined
+        return list(result.scalars().all())
+
+    @staticmethod
+    async def get_graph(user_id: str, db: AsyncSession) -> MemoryGraph:
+        """The user's knowledge graph, loaded on first use and kept in a bounded LRU.
+
+        Each cached graph carries the fact count and latest ``updated_at`` it was built from, and is
+        rebuilt when those no longer match, so writes made by other workers are picked up too.
+        """
+        try:
+            user_uuid = uuid.UUID(user_id)
+        except ValueError:
+            user_uuid = uuid.uuid5(uuid.NAMESPACE_DNS, user_id)
+        key = str(user_uuid)
+
+        watermark = tuple((await db.execute(select(
+            func.count(MemoryFact.id), func.max(MemoryFact.updated_at)
+        ).where(MemoryFact.user_id == user_uuid))).one())
+        cached = _graph_cache.get(key)
+        if cached is not None and cached[0] == watermark:
+            _graph_cache.move_to_end(key)
+            return cached[1]
+
+        facts = (await db.execute(select(
+            MemoryFact.id, MemoryFact.fact, MemoryFact.category, MemoryFact.importance, MemoryFact.metadata_json
+        ).where(MemoryFact.user_id == user_uuid))).all()
+        edges = (await db.execute(select(MemoryEdge.entity, MemoryEdge.memory_fact_id).where(
+            MemoryEdge.user_id == user_uuid
+        ))).all()
+
+        entities_by_fact: Dict[str, set] = {}
+        for edge in edges:
+            entities_by_fact.setdefault(str(edge.memory_fact_id), set()).add(edge.entity)
+
+        graph = MemoryGraph()
+        backfill = []
+        for f in facts:
+            try:
+                metadata = json.loads(f.metadata_json or "{}")
+            except ValueError:
+                metadata = {}
+            entities = entities_by_fact.get(str(f.id))
+            if entities is None:
+                # Facts stored before edges existed
+                entities = extract_entities(f.fact, metadata)
+                backfill.extend({"user_id": user_uuid, "entity": e, "memory_fact_id": f.id} for e in entities)
+            graph.add_node(MemoryNode(
+                fact=f.fact, category=f.category, importance=f.importance or 0.0, source="db",
+                metadata=metadata, id=str(f.id), entities=set(entities)
+            ))
+
+        if backfill:
+            try:
+                async with AsyncSessionLocal() as edge_db:
+                    await edge_db.execute(insert(MemoryEdge).values(backfill).on_conflict_do_nothing(
+                        constraint="uq_memory_edges_edge"
+                    ))
+                    await edge_db.commit()
+            except Exception as e:
+                logger.warning(f"Memory edge backfill error: {e}")
+
+        _graph_cache[key] = (watermark, graph)
+        _graph_cache.move_to_end(key)
+        if len(_graph_cache) > MEMORY_GRAPH_CACHE_USERS:
+            _graph_cache.popitem(last=False)
+        return graph
+
+    @staticmethod
+    async def get_related_facts(user_id: str, query: str, db: AsyncSession, limit: int = 5, exclude: List[str] = None) -> List[str]:
+        """Facts connected to the entities mentioned in the query (e.g. John -> Project X), without a vector search"""
+        graph = await MemoryService.get_graph(user_id, db)
+        entities = graph.entities_in(query)
+        if not entities:
+            return []
+        skip = set(exclude or [])
+        nodes = graph.expand(entities, limit=limit + len(skip))
+        return [n.fact for n in nodes if n.fact not in skip][:limit]
 
     @staticmethod
     async def get_memory_context(user_id: str, db: AsyncSession, min_importance: float = 0.5) -> str:
@@ -0,0 +1,236 @@
+import asyncio
+import hashlib
+import io
+import itertools
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+from weakref import WeakSet
+
+from pypdf import PdfReader
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.models import AttachmentText
+from .ids import to_uuid
+
+PDF_MAX_WORKERS = int(os.getenv("PDF_MAX_WORKERS", "2"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "50"))
+PDF_EXTRACT_TIMEOUT = float(os.getenv("PDF_EXTRACT_TIMEOUT", "30"))  # seconds
+PDF_CACHE_SIZE = int(os.getenv("PDF_CACHE_SIZE", "128"))
+
+
+def extract_pdf_text(data: bytes, max_pages: int = PDF_MAX_PAGES) -> Tuple[str, int, int]:
+    """Extract text from the first `max_pages` pages. Runs inside a worker process."""
+    reader = PdfReader(io.BytesIO(data))
+    page_count = len(reader.pages)
+    pages = [(page.extract_text() or "") for page in itertools.islice(reader.pages, max_pages)]
+    return "\n".join(pages), page_count, len(pages)
+
+
+class PdfExtractor:
+    """Bounded process pool for PDF parsing with an in-memory + Postgres text cache"""
+
+    def __init__(self, max_workers: int = PDF_MAX_WORKERS, cache_size: int = PDF_CACHE_SIZE,
+                 timeout: float = PDF_EXTRACT_TIMEOUT, worker: Callable = extract_pdf_text):
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self.worker = worker  # Module-level function run in the pool: (data, max_pages) -> (text, pages, extracted)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._killed: "WeakSet[ProcessPoolExecutor]" = WeakSet()  # Pools terminated after a timeout
+        self._cache: "OrderedDict[str, str]" = OrderedDict()  # content hash -> text
+        self._parts: "OrderedDict[tuple, str]" = OrderedDict()  # (user, message, part) -> content hash
+        self._stats = {"memory_hits": 0, "db_hits": 0, "extractions": 0, "timeouts": 0, "truncated": 0, "pools_retired": 0,
+                       "workers_killed": 0}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that owns event-loop and pool threads is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def _retire_pool(self, pool: ProcessPoolExecutor, kill: bool = False):
+        """Stop routing work to a pool with a stuck or broken worker; later calls get a fresh pool.
+
+        With ``kill`` the pool's worker processes are terminated, since a worker stuck in pypdf
+        never returns and would otherwise keep its CPU and memory after the pool is dropped.
+        Extractions that were running beside it fail with ``BrokenProcessPool`` and are retried.
+        """
+        if self._pool is pool:
+            self._pool = None
+            self._stats["pools_retired"] += 1
+        # ProcessPoolExecutor has no public way to stop a running worker
+        processes = list((getattr(pool, "_processes", None) or {}).values()) if kill else []
+        if kill:
+            self._killed.add(pool)
+        pool.shutdown(wait=False, cancel_futures=kill)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                self._stats["workers_killed"] += 1
+
+    def _remember(self, key: tuple, content_hash: str, text: str):
+        self._cache[content_hash] = text
+        self._cache.move_to_end(content_hash)
+        self._parts[key] = content_hash
+        self._parts.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        while len(self._parts) > self.cache_size * 4:
+            self._parts.popitem(last=False)
+
+    async def get_cached(self, user_id: str, message_id: str, part_id: str, db: AsyncSession) -> Optional[str]:
+        """Return already-extracted text for a message part without downloading it"""
+        key = (user_id, message_id, part_id)
+        content_hash = self._parts.get(key)
+        if content_hash and content_hash in self._cache:
+            self._stats["memory_hits"] += 1
+            self._cache.move_to_end(content_hash)
+            return self._cache[content_hash]
+
+        stmt = select(AttachmentText.content_hash, AttachmentText.text).where(
+            AttachmentText.user_id == to_uuid(user_id),
+            AttachmentText.message_id == message_id,
+            AttachmentText.part_id == part_id
+        )
+        row = (await db.execute(stmt)).first()
+        if row is None:
+            return None
+        self._stats["db_hits"] += 1
+        self._remember(key, row.content_hash, row.text)
+        return row.text
+
+    async def get_cached_parts(
+        self, user_id: str, message_id: str, part_ids: List[str], db: AsyncSession
+    ) -> Dict[str, str]:
+        """Batch form of `get_cached`: one query for every part of a message"""
+        found = {}
+        missing = []
+        for part_id in part_ids:
+            content_hash = self._parts.get((user_id, message_id, part_id))
+            if content_hash and content_hash in self._cache:
+                self._stats["memory_hits"] += 1
+                found[part_id] = self._cache[content_hash]
+            else:
+                missing.append(part_id)
+
+        if missing:
+            stmt = select(AttachmentText.part_id, AttachmentText.content_hash, AttachmentText.text).where(
+                AttachmentText.user_id == to_uuid(user_id),
+                AttachmentText.message_id == message_id,
+                AttachmentText.part_id.in_(missing)
+            )
+            for row in (await db.execute(stmt)).all():
+                self._stats["db_hits"] += 1
+                self._remember((user_id, message_id, row.part_id), row.content_hash, row.text)
+                found[row.part_id] = row.text
+        return found
+
+    async def lookup_hashes(self, content_hashes: List[str], db: AsyncSession) -> Dict[str, str]:
+        """Return previously extracted text for any of the given content hashes"""
+        found = {h: self._cache[h] for h in content_hashes if h in self._cache}
+        self._stats["memory_hits"] += len(found)
+        missing = [h for h in set(content_hashes) if h not in found]
+        if missing:
+            stmt = select(AttachmentText.content_hash, AttachmentText.text).where(
+                AttachmentText.content_hash.in_(missing)
+            ).distinct(AttachmentText.content_hash)
+            for row in (await db.execute(stmt)).all():
+                self._stats["db_hits"] += 1
+                found[row.content_hash] = row.text
+        return found
+
+    async def parse(self, data: bytes) -> Tuple[str, int, int]:
+        """Run pypdf in the process pool, bounded by the extraction timeout.
+
+        Text cut off at ``PDF_MAX_PAGES`` ends with a note saying how many pages were read.
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            pool = self._get_pool()
+            try:
+                text, page_count, pages_extracted = await asyncio.wait_for(
+                    loop.run_in_executor(pool, self.worker, data, PDF_MAX_PAGES),
+                    self.timeout
+                )
+                break
+            except asyncio.TimeoutError:
+                self._stats["timeouts"] += 1
+                self._retire_pool(pool, kill=True)
+                raise TimeoutError(f"PDF extraction timed out after {self.timeout}s")
+            except BrokenProcessPool:
+                # Collateral of another extraction's timeout: this PDF gets one more try
+                if pool in self._killed and attempt == 0:
+                    continue
+                self._retire_pool(pool)
+                raise
+        self._stats["extractions"] += 1
+        if pages_extracted < page_count:
+            self._stats["truncated"] += 1
+            text += f"\n\n[Truncated: only the first {pages_extracted} of {page_count} pages were extracted]"
+        return text, page_count, pages_extracted
+
+    async def store(
+        self,
+        db: AsyncSession,
+        user_id: str,
+        message_id: str,
+        part_id: str,
+        content_hash: str,
+        text: str,
+        filename: str = None,
+        page_count: int = None,
+        pages_extracted: int = None
+    ):
+        """Record extracted text for a message part (caller commits)"""
+        self._remember((user_id, message_id, part_id), content_hash, text)
+        stmt = insert(AttachmentText).values(
+            user_id=to_uuid(user_id),
+            message_id=message_id,
+            part_id=part_id,
+            filename=filename,
+            content_hash=content_hash,
+            text=text,
+            page_count=page_count,
+            pages_extracted=pages_extracted
+        ).on_conflict_do_nothing(constraint="uq_attachment_texts_part")
+        await db.execute(stmt)
+
+    async def extract(
+        self,
+        data: bytes,
+        db: AsyncSession,
+        user_id: str,
+        message_id: str,
+        part_id: str,
+        filename: str = None
+    ) -> str:
+        """Extract text from PDF bytes, reusing any previous extraction of the same content"""
+        content_hash = hashlib.sha256(data).hexdigest()
+        page_count = pages_extracted = None
+
+        text = (await self.lookup_hashes([content_hash], db)).get(content_hash)
+        if text is None:
+            text, page_count, pages_extracted = await self.parse(data)
+
+        await self.store(db, user_id, message_id, part_id, content_hash, text, filename, page_count, pages_extracted)
+        await db.commit()
+        return text
+
+    def metrics(self) -> dict:
+        return {**self._stats, "cached_texts": len(self._cache), "max_workers": self.max_workers}
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._retire_pool(self._pool, kill=True)
+
+
+pdf_extractor = PdfExtractor()
@@ -0,0 +1,219 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from googleapiclient.errors import HttpError
+
+# Quota units per API method (Gmail publishes per-method costs; Calendar charges one unit per request)
+METHOD_COSTS = {
+    "gmail.users.getProfile": 1,
+    "gmail.users.history.list": 2,
+    "gmail.users.labels.list": 1,
+    "gmail.users.messages.list": 5,
+    "gmail.users.messages.get": 5,
+    "gmail.users.messages.attachments.get": 5,
+    "gmail.users.messages.send": 100,
+    "gmail.users.threads.list": 10,
+    "gmail.users.threads.get": 10,
+    "gmail.users.drafts.create": 10,
+}
+DEFAULT_COST = 5
+CALENDAR_COST = 1
+
+QUOTA_USER_RATE = float(os.getenv("GOOGLE_QUOTA_USER_RATE", "250"))  # units/second per user
+QUOTA_PROJECT_RATE = float(os.getenv("GOOGLE_QUOTA_PROJECT_RATE", "20000"))  # units/second per project
+QUOTA_HEADROOM = float(os.getenv("GOOGLE_QUOTA_HEADROOM", "0.9"))  # Fraction of the published quota we spend
+QUOTA_LATENCY_TARGET = float(os.getenv("GOOGLE_QUOTA_LATENCY_TARGET", "2.0"))  # seconds
+QUOTA_MIN_CONCURRENCY = 1.0
+QUOTA_DECREASE_FACTOR = 0.5
+QUOTA_DECREASE_COOLDOWN = 1.0  # seconds between multiplicative decreases
+QUOTA_USER_BUCKETS = 10_000
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("google_api_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def background_priority():
+    """Mark Google API calls made in this context (and tasks it spawns) as background work"""
+    token = _priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def method_cost(method_id: Optional[str]) -> int:
+    if not method_id:
+        return DEFAULT_COST
+    if method_id.startswith("calendar."):
+        return CALENDAR_COST
+    return METHOD_COSTS.get(method_id, DEFAULT_COST)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status == 429:
+        return True
+    return error.resp.status == 403 and b"ateLimitExceeded" in (error.content or b"")
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float) -> float:
+        """Seconds until ``cost`` units are available"""
+        self._refill()
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+    def take(self, cost: float):
+        self._refill()
+        self.tokens -= cost
+
+    def drain(self):
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class QuotaGovernor:
+    """Keeps Google API traffic just under quota.
+
+    Calls are charged per-method quota units against a per-user and a per-project token
+    bucket, and admitted through an AIMD concurrency window that grows while calls succeed
+    quickly and halves on 429s or slow responses. Waiting calls are admitted in priority
+    order, so interactive requests overtake background syncs.
+    """
+
+    def __init__(self, max_concurrency: int, user_rate: float = QUOTA_USER_RATE,
+                 project_rate: float = QUOTA_PROJECT_RATE):
+        self.max_concurrency = float(max_concurrency)
+        self.limit = float(max_concurrency)
+        self.user_rate = user_rate * QUOTA_HEADROOM
+        self.project = TokenBucket(project_rate * QUOTA_HEADROOM)
+        self._users: Dict[str, TokenBucket] = {}
+        self._running = 0
+        self._waiters: List[tuple] = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._last_decrease = 0.0
+        self._stats = {"admitted": 0, "throttled": 0, "slow": 0, "quota_wait_ms": 0.0, "units": 0}
+
+    def _user_bucket(self, principal: str) -> TokenBucket:
+        bucket = self._users.get(principal)
+        if bucket is None:
+            if len(self._users) >= QUOTA_USER_BUCKETS:
+                self._users.pop(next(iter(self._users)))
+            bucket = self._users[principal] = TokenBucket(self.user_rate)
+        return bucket
+
+    def _wake(self):
+        while self._waiters and self._running < int(self.limit):
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._running += 1
+                future.set_result(None)
+
+    async def acquire(self, principal: str, method_id: Optional[str]) -> int:
+        """Wait for enough quota and a concurrency slot; returns the units charged.
+
+        The per-user quota is waited for before taking a slot, so one user's burst (sends cost
+        100 units each) never holds shared slots while it sleeps. Tokens are reserved up front,
+        which queues that user's later calls behind this one.
+        """
+        cost = method_cost(method_id)
+        user = self._user_bucket(principal)
+        started = time.monotonic()
+        delay = user.wait_time(cost)
+        user.take(cost)
+        try:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._acquire_slot()
+        except BaseException:
+            user.take(-cost)
+            raise
+
+        try:
+            while True:
+                delay = self.project.wait_time(cost)
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self.project.take(cost)
+        except BaseException:
+            user.take(-cost)
+            self._running -= 1
+            self._wake()
+            raise
+
+        self._stats["admitted"] += 1
+        self._stats["units"] += cost
+        self._stats["quota_wait_ms"] += (time.monotonic() - started) * 1000
+        return cost
+
+    async def _acquire_slot(self):
+        """Take a slot in the AIMD window, queueing by priority when it is full"""
+        if not self._waiters and self._running < int(self.limit):
+            self._running += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (_priority.get(), next(self._seq), future))
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was handed to us just as we were cancelled: pass it on
+                self._running -= 1
+                self._wake()
+            raise
+
+    def release(self, principal: str, latency: float, throttled: bool = False):
+        """Return the slot and adapt the window to how the call went"""
+        self._running -= 1
+        now = time.monotonic()
+        if throttled or latency > QUOTA_LATENCY_TARGET:
+            self._stats["throttled" if throttled else "slow"] += 1
+            if throttled:
+                self._user_bucket(principal).drain()
+            if now - self._last_decrease >= QUOTA_DECREASE_COOLDOWN:
+                self.limit = max(QUOTA_MIN_CONCURRENCY, self.limit * QUOTA_DECREASE_FACTOR)
+                self._last_decrease = now
+        else:
+            # Additive increase: roughly +1 slot per window's worth of successful calls
+            self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+        self._wake()
+
+    def metrics(self) -> dict:
+        waiting = [0, 0]
+        for priority, _, future in self._waiters:
+            if not future.done():
+                waiting[min(priority, PRIORITY_BACKGROUND)] += 1
+        return {
+            **self._stats,
+            "quota_wait_ms": round(self._stats["quota_wait_ms"], 2),
+            "concurrency_limit": round(self.limit, 2),
+            "running": self._running,
+            "waiting_interactive": waiting[PRIORITY_INTERACTIVE],
+            "waiting_background": waiting[PRIORITY_BACKGROUND],
+            "project_tokens": round(self.project.tokens, 1),
+            "tracked_users": len(self._users),
+        }
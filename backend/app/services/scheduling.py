@@ -0,0 +1,210 @@
+import bisect
+import os
+import re
+from datetime import datetime, time, timedelta, timezone
+from typing import List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.models import User
+from .calendar_service import CalendarService
+from .google_api import google_api
+
+USER_TIMEZONE = os.getenv("USER_TIMEZONE", "Asia/Kolkata")
+SLOT_STEP = timedelta(minutes=int(os.getenv("SCHEDULING_SLOT_STEP_MINUTES", "30")))
+SLOT_BUFFER = timedelta(minutes=15)  # Gap we like to leave next to existing meetings
+DEFAULT_WORK_HOURS = (time(9, 0), time(17, 0), {0, 1, 2, 3, 4})
+DEFAULT_WINDOW_DAYS = 7
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+TIME_PATTERN = re.compile(r"(\d{1,2})(?:[:.](\d{2}))?\s*(am|pm)?", re.IGNORECASE)
+DAY_RANGE_PATTERN = re.compile(r"\b(mon|tue|wed|thu|fri|sat|sun)[a-z]*\s*(?:-|to|–)\s*(mon|tue|wed|thu|fri|sat|sun)[a-z]*", re.IGNORECASE)
+
+Interval = Tuple[datetime, datetime]
+
+
+def parse_work_hours(text: Optional[str]) -> Tuple[time, time, Set[int]]:
+    """Parse free-text work hours like '9 AM - 5 PM' or 'Mon-Sat 10:00-18:30'.
+
+    Falls back to weekdays 9-5 for anything it cannot read.
+    """
+    if not text:
+        return DEFAULT_WORK_HOURS
+
+    days = DEFAULT_WORK_HOURS[2]
+    day_range = DAY_RANGE_PATTERN.search(text)
+    if day_range:
+        first, last = (WEEKDAYS.index(d.lower()[:3]) for d in day_range.groups())
+        days = {d % 7 for d in range(first, last + 1 if last >= first else last + 8)}
+        text = text[:day_range.start()] + text[day_range.end():]
+
+    times = []
+    for match in TIME_PATTERN.finditer(text):
+        hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), (match.group(3) or "").lower()
+        if meridiem == "pm" and hour < 12:
+            hour += 12
+        elif meridiem == "am" and hour == 12:
+            hour = 0
+        if hour < 24 and minute < 60:
+            times.append([hour, minute, meridiem])
+    if len(times) < 2:
+        return DEFAULT_WORK_HOURS
+
+    (start_hour, start_minute, _), (end_hour, end_minute, end_meridiem) = times[0], times[1]
+    # "9 - 5" means 9 AM to 5 PM
+    if not end_meridiem and end_hour <= start_hour and end_hour + 12 < 24:
+        end_hour += 12
+    start, end = time(start_hour, start_minute), time(end_hour, end_minute)
+    if end <= start:
+        return DEFAULT_WORK_HOURS
+    return start, end, days
+
+
+def merge_intervals(intervals: List[Interval]) -> List[Interval]:
+    """Sort and coalesce overlapping or touching intervals"""
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_gaps(window: Interval, busy: List[Interval]) -> List[Interval]:
+    """Free sub-intervals of ``window`` given merged, sorted busy intervals"""
+    start, end = window
+    # First busy interval that could overlap the window
+    index = max(bisect.bisect_left(busy, (start, start)) - 1, 0)
+    gaps, cursor = [], start
+    for busy_start, busy_end in busy[index:]:
+        if busy_start >= end:
+            break
+        if busy_end <= cursor:
+            continue
+        if busy_start > cursor:
+            gaps.append((cursor, busy_start))
+        cursor = max(cursor, busy_end)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def _ceil_to_step(value: datetime) -> datetime:
+    step = int(SLOT_STEP.total_seconds())
+    seconds = int(value.timestamp())
+    remainder = seconds % step
+    return value if remainder == 0 and value.microsecond == 0 else value.replace(microsecond=0) + timedelta(seconds=step - remainder)
+
+
+def find_free_slots(
+    window: Interval,
+    busy: List[Interval],
+    duration: timedelta,
+    work_hours: Tuple[time, time, Set[int]],
+    tz: ZoneInfo,
+    limit: int = 5
+) -> List[Interval]:
+    """Rank free slots of ``duration`` inside work hours.
+
+    Earlier slots win, with a penalty for slots that sit right against another meeting and a
+    small one for the first/last hour of the day. Candidates are aligned to ``SLOT_STEP``.
+    """
+    busy = merge_intervals(busy)
+    work_start, work_end, work_days = work_hours
+    window_start, window_end = window
+
+    candidates = []
+    day = window_start.astimezone(tz).date()
+    while datetime.combine(day, work_start, tz) < window_end:
+        if day.weekday() in work_days:
+            day_start = max(datetime.combine(day, work_start, tz), window_start)
+            day_end = min(datetime.combine(day, work_end, tz), window_end)
+            for gap_start, gap_end in free_gaps((day_start, day_end), busy):
+                slot_start = _ceil_to_step(gap_start)
+                while slot_start + duration <= gap_end:
+                    slot_end = slot_start + duration
+                    score = (slot_start - window_start).total_seconds() / 86400
+                    if slot_start - gap_start < SLOT_BUFFER and gap_start > day_start:
+                        score += 0.5
+                    if gap_end - slot_end < SLOT_BUFFER and gap_end < day_end:
+                        score += 0.5
+                    if (slot_start - datetime.combine(day, work_start, tz) < timedelta(hours=1)
+                            or datetime.combine(day, work_end, tz) - slot_end < timedelta(hours=1)):
+                        score += 0.25
+                    candidates.append((score, slot_start, slot_end))
+                    slot_start += SLOT_STEP
+        day += timedelta(days=1)
+
+    candidates.sort()
+    return [(start, end) for _, start, end in candidates[:limit]]
+
+
+def _parse_window_bound(value: Optional[str], tz: ZoneInfo, end_of_day: bool) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if len(value) <= 10 and end_of_day:
+        parsed += timedelta(days=1)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=tz)
+
+
+class SchedulingService:
+    """Finds meeting slots from one freeBusy query instead of reasoning over raw events"""
+
+    @staticmethod
+    async def find_slots(
+        user_id: str,
+        db: AsyncSession,
+        duration_minutes: int = 30,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        attendees: Optional[List[str]] = None,
+        limit: int = 5
+    ) -> dict:
+        """Ranked free slots in [start, end) (ISO dates/times, default the next week) for the user and attendees"""
+        try:
+            tz = ZoneInfo(USER_TIMEZONE)
+            now = datetime.now(tz)
+            window_start = max(_parse_window_bound(start, tz, False) or now, now)
+            window_end = _parse_window_bound(end, tz, True) or window_start + timedelta(days=DEFAULT_WINDOW_DAYS)
+            if window_end <= window_start:
+                raise ValueError("The scheduling window is empty")
+
+            user = (await db.execute(select(User).where(User.id == user_id))).scalar_one_or_none()
+            work_hours = parse_work_hours(user.work_hours if user else None)
+
+            service = await CalendarService.get_service(user_id, db)
+            calendars = ["primary"] + [a.strip() for a in attendees or [] if a.strip()]
+            result = await google_api.execute(service.freebusy().query(body={
+                "timeMin": window_start.astimezone(timezone.utc).isoformat(),
+                "timeMax": window_end.astimezone(timezone.utc).isoformat(),
+                "timeZone": USER_TIMEZONE,
+                "items": [{"id": calendar_id} for calendar_id in calendars]
+            }))
+
+            busy, unavailable = [], []
+            for calendar_id, info in result.get("calendars", {}).items():
+                if info.get("errors"):
+                    unavailable.append(calendar_id)
+                    continue
+                for period in info.get("busy", []):
+                    busy.append((
+                        datetime.fromisoformat(period["start"].replace("Z", "+00:00")),
+                        datetime.fromisoformat(period["end"].replace("Z", "+00:00"))
+                    ))
+
+            slots = find_free_slots(
+                (window_start, window_end), busy, timedelta(minutes=duration_minutes), work_hours, tz, limit
+            )
+            return {
+                "slots": [{"start": s.astimezone(tz).isoformat(), "end": e.astimezone(tz).isoformat()} for s, e in slots],
+                "unavailable": unavailable,
+                "work_hours": f"{work_hours[0].strftime('%H:%M')}-{work_hours[1].strftime('%H:%M')}"
+            }
+
+        except Exception as e:
+            raise ValueError(f"Error finding free slots: {str(e)}")
@@ -0,0 +1,142 @@
+from datetime import datetime
+from typing import List, Tuple
+
+from langchain_core.messages import HumanMessage
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.models import ThreadSummary
+from .analysis_service import AnalysisService, ANALYSIS_DIRECT_LIMIT, ANALYSIS_CHUNK_CHARS, ANALYSIS_CHUNK_OVERLAP, llm
+from .chunking import chunk_text
+from .gmail_service import GmailService, get_header, extract_body
+from .google_api import google_api
+from .ids import to_uuid
+
+THREAD_SUMMARY_PROMPT = """Summarize this email thread for a busy executive.
+Cover: what it is about, the current status, decisions made, open questions, and who owes what to whom (with dates).
+Be concise and factual.
+
+{content}"""
+
+
+def pack_sections(sections: List[Tuple[str, str]], size: int = ANALYSIS_CHUNK_CHARS) -> List[Tuple[str, str]]:
+    """(label, text) map chunks for a thread: short messages packed together up to ``size`` chars,
+    long ones split on their own"""
+    chunks: List[Tuple[str, str]] = []
+    pack: List[str] = []
+
+    def flush():
+        if pack:
+            chunks.append(("Messages", "\n\n".join(pack)))
+            pack.clear()
+
+    for label, text in sections:
+        block = f"--- {label} ---\n{text}"
+        if len(block) > size:
+            flush()
+            chunks.extend((label, part) for part in chunk_text(text, size, ANALYSIS_CHUNK_OVERLAP))
+            continue
+        if pack and sum(len(b) + 2 for b in pack) + len(block) > size:
+            flush()
+        pack.append(block)
+    flush()
+    return chunks
+
+
+def _to_dict(row: ThreadSummary, cached: bool) -> dict:
+    return {
+        "thread_id": row.thread_id,
+        "subject": row.subject,
+        "message_count": row.message_count,
+        "last_date": row.last_date,
+        "summary": row.summary,
+        "history_id": row.history_id,
+        "cached": cached
+    }
+
+
+class ThreadSummaryService:
+    """Per-thread summaries that are only recomputed when the thread changes"""
+
+    @staticmethod
+    async def get_summary(user_id: str, thread_id: str, db: AsyncSession) -> dict:
+        """Cached summary of a thread, regenerated only when its historyId moved"""
+        service = await GmailService.get_service(user_id, db)
+
+        # One cheap call tells us whether anything in the thread changed
+        thread_state = await google_api.execute(service.users().threads().get(
+            userId="me",
+            id=thread_id,
+            format="minimal",
+            fields="historyId"
+        ))
+        history_id = int(thread_state["historyId"])
+
+        user_uuid = to_uuid(user_id)
+        stmt = select(ThreadSummary).where(
+            ThreadSummary.user_id == user_uuid,
+            ThreadSummary.thread_id == thread_id
+        )
+        existing = (await db.execute(stmt)).scalar_one_or_none()
+        if existing and existing.history_id == history_id:
+            return _to_dict(existing, cached=True)
+
+        thread = await google_api.execute(service.users().threads().get(
+            userId="me",
+            id=thread_id,
+            format="full"
+        ))
+        messages = thread.get("messages", [])
+
+        sections = []
+        for msg in messages:
+            headers = msg.get("payload", {}).get("headers", [])
+            label = f"{get_header(headers, 'From', 'Unknown')} on {get_header(headers, 'Date')}"
+            sections.append((msg["id"], label, extract_body(msg.get("payload", {})) or msg.get("snippet", "")))
+
+        first_headers = messages[0].get("payload", {}).get("headers", []) if messages else []
+        last_headers = messages[-1].get("payload", {}).get("headers", []) if messages else []
+        subject = get_header(first_headers, "Subject", "No Subject")
+
+        if sum(len(text) for _, _, text in sections) <= ANALYSIS_DIRECT_LIMIT:
+            content = "\n".join(f"\n--- {label} ---\n{text}" for _, label, text in sections)
+        else:
+            # One map step for the whole thread, run concurrently; summaries are cached per chunk under
+            # the thread id, and packing is stable from the first message, so a new reply only maps the tail
+            chunks = pack_sections([(label, text) for _, label, text in sections])
+            summaries = await AnalysisService.summarize_chunks(user_id, thread_id, chunks, db)
+            content = "".join(f"\n--- {label} ---\n{summary}\n" for (label, _), summary in zip(chunks, summaries))
+
+        response = await llm.ainvoke([HumanMessage(content=THREAD_SUMMARY_PROMPT.format(
+            content=f"Subject: {subject}\n{content}"
+        ))])
+
+        values = {
+            "user_id": user_uuid,
+            "thread_id": thread_id,
+            "history_id": int(thread.get("historyId", history_id)),
+            "subject": subject,
+            "message_count": len(messages),
+            "last_date": get_header(last_headers, "Date"),
+            "summary": response.content,
+            "updated_at": datetime.utcnow()
+        }
+        stmt = insert(ThreadSummary).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_thread_summaries_thread",
+            set_={k: stmt.excluded[k] for k in values if k not in ("user_id", "thread_id")}
+        )
+        await db.execute(stmt)
+        await db.commit()
+        return _to_dict(ThreadSummary(**values), cached=False)
+
+    @staticmethod
+    async def answer(summary: dict, question: str) -> str:
+        """Answer a question from a thread summary instead of the raw messages"""
+        content = (
+            f"Subject: {summary['subject']}\nMessages in thread: {summary['message_count']}\n"
+            f"Latest message: {summary['last_date']}\n\nThread summary:\n{summary['summary']}\n\nQuestion: {question}"
+        )
+        response = await llm.ainvoke([HumanMessage(content=content)])
+        return response.content
@@ -0,0 +1,5 @@
+import os
+
+# Offline defaults: a local embedding backend and a dummy key so Gemini clients can be constructed
+os.environ.setdefault("EMBEDDING_PROVIDER", "hashing")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
@@ -0,0 +1,34 @@
+from app.services.chunking import chunk_text
+
+
+def test_short_and_empty_text():
+    assert chunk_text("") == []
+    assert chunk_text("   ") == []
+    assert chunk_text(" hello ") == ["hello"]
+
+
+def test_chunks_cover_the_text_within_size():
+    text = " ".join(f"word{i}" for i in range(2000))
+    chunks = chunk_text(text, chunk_size=500, overlap=50)
+
+    assert len(chunks) > 1
+    assert all(len(c) <= 500 for c in chunks)
+    assert chunks[0].startswith("word0 ")
+    assert chunks[-1].endswith("word1999")
+    # Consecutive chunks overlap
+    assert all(a[-20:].split()[-1] in b for a, b in zip(chunks, chunks[1:]))
+
+
+def test_chunks_prefer_paragraph_breaks():
+    paragraph = "Sentence one is here. " * 10
+    text = f"{paragraph.strip()}\n\n{paragraph.strip()}\n\n{paragraph.strip()}"
+    chunks = chunk_text(text, chunk_size=300, overlap=0)
+
+    assert chunks[0] == paragraph.strip()
+
+
+def test_text_without_breaks_still_progresses():
+    chunks = chunk_text("x" * 1000, chunk_size=300, overlap=299)
+
+    assert len(chunks) > 1
+    assert "".join(chunks).count("x") >= 1000
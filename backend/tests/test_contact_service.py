@@ -0,0 +1,91 @@
+import asyncio
+import uuid
+
+from app.services.contact_service import ContactDirectory, ContactTrie
+
+
+def trie() -> ContactTrie:
+    contacts = ContactTrie()
+    contacts.add("alice.smith@example.com", "Alice Smith", 5)
+    contacts.add("alan@example.com", "Alan Turing", 2)
+    contacts.add("bob@builder.io", None, 9)
+    return contacts
+
+
+def test_prefix_matches_names_local_parts_and_addresses():
+    contacts = trie()
+
+    assert contacts.prefix("al") == {"alice.smith@example.com", "alan@example.com"}
+    assert contacts.prefix("smi") == {"alice.smith@example.com"}
+    assert contacts.prefix("bob@b") == {"bob@builder.io"}
+    assert contacts.prefix("zed") == set()
+
+
+def test_search_ranks_by_frequency_and_requires_every_token():
+    contacts = trie()
+
+    assert [c["email"] for c in contacts.search("al")] == ["alice.smith@example.com", "alan@example.com"]
+    assert [c["email"] for c in contacts.search("alan tur")] == ["alan@example.com"]
+    assert contacts.search("al")[0]["fuzzy"] is False
+
+
+def test_search_falls_back_to_fuzzy_matching():
+    results = trie().search("alise")
+
+    assert results and results[0]["email"] == "alice.smith@example.com"
+    assert results[0]["fuzzy"] is True
+
+
+def test_add_accumulates_frequency_and_fills_in_a_missing_name():
+    contacts = trie()
+    contacts.add("bob@builder.io", "Bob Builder", 1)
+
+    assert contacts.search("bob")[0] == {"email": "bob@builder.io", "name": "Bob Builder", "frequency": 10, "fuzzy": False}
+    assert contacts.prefix("build") == {"bob@builder.io"}
+
+
+def test_empty_query():
+    assert trie().search("  ") == []
+
+
+def test_prefixes_longer_than_the_indexed_depth_are_filtered():
+    contacts = ContactTrie(depth=3)
+    contacts.add("alexander@example.com", "Alexander Hamilton")
+    contacts.add("alexis@example.com", "Alexis Carrington")
+
+    assert contacts.prefix("ale") == {"alexander@example.com", "alexis@example.com"}
+    assert contacts.prefix("alexa") == {"alexander@example.com"}
+    assert contacts.prefix("alexander@example.com") == {"alexander@example.com"}
+    assert contacts.prefix("alexz") == set()
+
+
+class ReadOnlySession:
+    """Answers the two trie-loading queries and fails on anything that would write"""
+
+    def __init__(self, owner, rows):
+        self.results = [owner, rows]
+
+    async def execute(self, stmt):
+        value = self.results.pop(0)
+        return type("Result", (), {"scalar_one_or_none": lambda _: value, "all": lambda _: value})()
+
+    async def commit(self):
+        raise AssertionError("lookup must not commit the caller's session")
+
+    async def rollback(self):
+        raise AssertionError("lookup must not roll back the caller's session")
+
+
+def test_cold_lookup_reads_only_and_includes_unflushed_observations():
+    user_id = str(uuid.uuid4())
+    directory = ContactDirectory()
+    directory.record(user_id, "m1", [
+        {"name": "FROM", "value": "Carol Danvers <carol@example.com>"},
+        {"name": "To", "value": "me@example.com"},
+    ])
+    stored = [type("Row", (), {"email": "carol@example.com", "name": None, "frequency": 4})()]
+
+    results = asyncio.run(directory.lookup(user_id, "carol", ReadOnlySession("Me@example.com", stored)))
+
+    assert results == [{"email": "carol@example.com", "name": "Carol Danvers", "frequency": 5, "fuzzy": False}]
+    assert asyncio.run(directory.lookup(user_id, "me", None)) == []
@@ -0,0 +1,106 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embeddings import (
+    EmbeddingProvider, HashingEmbeddingProvider, MicroBatcher, hash_features
+)
+
+
+def test_hash_features_is_deterministic_and_normalized():
+    first = hash_features("Quarterly review with the finance team")
+    second = hash_features("Quarterly review with the finance team")
+
+    assert np.array_equal(first, second)
+    assert first.shape == (768,)
+    assert np.linalg.norm(first) == pytest.approx(1.0, abs=1e-5)
+
+
+def test_hash_features_of_empty_text_is_zero():
+    assert not hash_features("").any()
+    assert not hash_features("  ...  ").any()
+
+
+def test_hash_features_ranks_related_text_closer():
+    query = hash_features("invoice from acme")
+    related = hash_features("Acme sent the invoice for March")
+    unrelated = hash_features("dinner plans on saturday")
+
+    assert float(query @ related) > float(query @ unrelated)
+
+
+def test_micro_batcher_coalesces_concurrent_calls():
+    calls = []
+
+    async def run(texts):
+        calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    async def main():
+        batcher = MicroBatcher(run, max_batch=100, window=0.01)
+        results = await asyncio.gather(*(batcher.submit([t]) for t in ("a", "bb", "ccc")))
+        return batcher, results
+
+    batcher, results = asyncio.run(main())
+
+    assert calls == [["a", "bb", "ccc"]]
+    assert results == [[[1.0]], [[2.0]], [[3.0]]]
+    assert batcher.metrics() == {"batches": 1, "texts": 3, "avg_batch": 3.0}
+
+
+def test_micro_batcher_flushes_at_max_batch():
+    calls = []
+
+    async def run(texts):
+        calls.append(len(texts))
+        return [[0.0] for _ in texts]
+
+    async def main():
+        batcher = MicroBatcher(run, max_batch=2, window=10)
+        await asyncio.wait_for(asyncio.gather(batcher.submit(["a"]), batcher.submit(["b"])), timeout=1)
+
+    asyncio.run(main())
+    assert calls == [2]
+
+
+def test_micro_batcher_fans_errors_out_to_every_caller():
+    async def run(texts):
+        raise RuntimeError("backend down")
+
+    async def main():
+        batcher = MicroBatcher(run, max_batch=100, window=0.01)
+        return await asyncio.gather(batcher.submit(["a"]), batcher.submit(["b"]), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert len(results) == 2
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_embedding_provider_is_abstract():
+    with pytest.raises(TypeError):
+        EmbeddingProvider()
+
+
+def test_embedding_cache_keeps_local_providers_in_process():
+    provider = HashingEmbeddingProvider()
+    cache = EmbeddingCache(provider, persist=True)
+
+    async def main():
+        first = await cache.aembed_documents(["hello  world", "other"])
+        again = await cache.aembed_query("hello world")
+        return first, again
+
+    try:
+        first, again = asyncio.run(main())
+    finally:
+        provider.shutdown()
+
+    # No database is reachable here: any attempt at the Postgres tier would count an error
+    metrics = cache.metrics()
+    assert cache.local
+    assert metrics["db_errors"] == 0
+    assert metrics["misses"] == 3
+    assert first[0] == pytest.approx(hash_features("hello world").tolist())
+    assert again == pytest.approx(first[0])
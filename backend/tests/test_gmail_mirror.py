@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+from app.db.models import GmailMessage
+from app.services.gmail_mirror import _to_email, parse_query
+from app.services.gmail_service import to_listing
+
+
+def test_parse_query_collects_operators_and_text():
+    parsed = parse_query('from:alice@example.com subject:"q3 budget" is:unread in:inbox report')
+
+    assert parsed["from"] == ["alice@example.com"]
+    assert parsed["subject"] == ["q3 budget"]
+    assert parsed["labels"] == ["UNREAD", "INBOX"]
+    assert parsed["text"] == ["report"]
+    assert parsed["exclude_labels"] == ["SPAM", "TRASH"]
+
+
+def test_parse_query_only_excludes_spam_when_not_requested():
+    assert parse_query("in:spam")["exclude_labels"] == ["TRASH"]
+    assert parse_query("is:read")["exclude_labels"] == ["UNREAD", "SPAM", "TRASH"]
+
+
+def test_parse_query_date_bounds():
+    assert parse_query("after:2024/01/31")["after"] == datetime(2024, 1, 31)
+    assert parse_query("after:2024-01-31")["after"] == datetime(2024, 1, 31)
+    # The tighter of two bounds wins
+    assert parse_query("after:2024/01/31 after:2024/03/01")["after"] == datetime(2024, 3, 1)
+
+    after = parse_query("newer_than:7d")["after"]
+    assert abs(after - (datetime.utcnow() - timedelta(days=7))) < timedelta(minutes=1)
+
+
+def test_parse_query_rejects_what_the_mirror_cannot_evaluate():
+    for query in ("from:a OR from:b", "-from:alice", "(budget)", "has:attachment", "after:yesterday", "newer_than:2w"):
+        assert parse_query(query) is None, query
+
+
+def test_mirror_preview_matches_the_live_listing():
+    row = GmailMessage(
+        message_id="m1", thread_id="t1", subject="Hi", sender="a@example.com", recipients="b@example.com",
+        date="Mon, 2 Mar 2026 10:00:00 +0000", label_ids=["INBOX"], snippet="Tom &amp; Jerry say hi",
+        body_text="Tom & Jerry say hi\n\nA much longer body that the listing never shows"
+    )
+    live = to_listing({
+        "id": "m1", "threadId": "t1", "labelIds": ["INBOX"], "snippet": "Tom &amp; Jerry say hi",
+        "payload": {"headers": [
+            {"name": "Subject", "value": "Hi"}, {"name": "From", "value": "a@example.com"},
+            {"name": "To", "value": "b@example.com"}, {"name": "Date", "value": "Mon, 2 Mar 2026 10:00:00 +0000"},
+        ]},
+    })
+
+    assert _to_email(row) == live
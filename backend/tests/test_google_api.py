@@ -0,0 +1,97 @@
+import asyncio
+
+import httplib2
+import pytest
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+from app.services.google_api import GoogleApiExecutor
+from tests.google_stub import GoogleApiStub
+
+
+def gmail(stub: GoogleApiStub):
+    # Static discovery document, so no network access is needed to build the client
+    return build(
+        "gmail", "v1", http=httplib2.Http(), client_options={"api_endpoint": stub.url},
+        cache_discovery=False, static_discovery=True
+    )
+
+
+def test_concurrency_is_bounded_by_max_workers():
+    with GoogleApiStub(delay=0.1) as stub:
+        service = gmail(stub)
+        executor = GoogleApiExecutor(max_workers=2, timeout=5)
+
+        async def main():
+            requests = [service.users().messages().list(userId="me", q=f"n:{i}") for i in range(6)]
+            return await asyncio.gather(*(executor.execute(r) for r in requests))
+
+        results = asyncio.run(main())
+        executor.shutdown()
+
+    assert len(results) == 6
+    assert len(stub.hits) == 6
+    assert stub.max_active <= 2
+    assert executor.metrics()["completed"] == 6
+
+
+def test_timeout_raises_and_is_counted():
+    with GoogleApiStub(delay=1.0) as stub:
+        service = gmail(stub)
+        executor = GoogleApiExecutor(max_workers=2, timeout=5)
+
+        async def main():
+            await executor.execute(service.users().getProfile(userId="me"), timeout=0.2)
+
+        with pytest.raises(TimeoutError):
+            asyncio.run(main())
+        executor.shutdown()
+
+    assert executor.metrics()["timed_out"] == 1
+
+
+def test_identical_reads_are_coalesced():
+    with GoogleApiStub(delay=0.2) as stub:
+        service = gmail(stub)
+        executor = GoogleApiExecutor(max_workers=4, timeout=5)
+
+        async def main():
+            requests = [service.users().messages().get(userId="me", id="abc") for _ in range(4)]
+            return await asyncio.gather(*(executor.execute(r) for r in requests))
+
+        results = asyncio.run(main())
+        executor.shutdown()
+
+    assert len(stub.hits) == 1
+    assert all(r == results[0] for r in results)
+    assert executor.metrics()["coalesced"] == 3
+
+
+def test_writes_are_never_coalesced():
+    with GoogleApiStub(delay=0.1) as stub:
+        service = gmail(stub)
+        executor = GoogleApiExecutor(max_workers=4, timeout=5)
+
+        async def main():
+            requests = [service.users().messages().send(userId="me", body={"raw": "eA"}) for _ in range(2)]
+            return await asyncio.gather(*(executor.execute(r) for r in requests))
+
+        asyncio.run(main())
+        executor.shutdown()
+
+    assert len(stub.hits) == 2
+
+
+def test_http_errors_propagate():
+    with GoogleApiStub(status=404) as stub:
+        service = gmail(stub)
+        executor = GoogleApiExecutor(max_workers=2, timeout=5)
+
+        async def main():
+            await executor.execute(service.users().messages().get(userId="me", id="gone"))
+
+        with pytest.raises(HttpError):
+            asyncio.run(main())
+        executor.shutdown()
+
+    assert executor.metrics()["failed"] == 1
@@ -0,0 +1,66 @@
+import asyncio
+import multiprocessing
+import time
+
+import pytest
+
+from app.services.pdf_extractor import PdfExtractor
+
+
+def spin(data: bytes, max_pages: int):
+    """Stands in for pypdf stuck on a malformed file"""
+    while True:
+        pass
+
+
+def echo(data: bytes, max_pages: int):
+    return data.decode(), 3, 2
+
+
+def live_workers() -> int:
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        children = multiprocessing.active_children()
+        if len(children) <= 2:
+            break
+        time.sleep(0.05)
+    return len(children)
+
+
+def test_timed_out_workers_are_terminated():
+    extractor = PdfExtractor(max_workers=2, timeout=1.0, worker=spin)
+
+    async def main():
+        for _ in range(3):
+            with pytest.raises(TimeoutError):
+                await extractor.parse(b"%PDF")
+            assert live_workers() <= extractor.max_workers
+
+    try:
+        asyncio.run(main())
+    finally:
+        extractor.shutdown()
+
+    metrics = extractor.metrics()
+    assert metrics["timeouts"] == 3
+    assert metrics["workers_killed"] >= 3
+
+
+def test_parse_reports_truncation_and_recovers_after_a_timeout():
+    extractor = PdfExtractor(max_workers=1, timeout=1.0, worker=spin)
+
+    async def main():
+        with pytest.raises(TimeoutError):
+            await extractor.parse(b"%PDF")
+        extractor.worker = echo
+        extractor.timeout = 30
+        return await extractor.parse(b"page text")
+
+    try:
+        text, page_count, pages_extracted = asyncio.run(main())
+    finally:
+        extractor.shutdown()
+
+    assert (page_count, pages_extracted) == (3, 2)
+    assert text.startswith("page text")
+    assert text.endswith("[Truncated: only the first 2 of 3 pages were extracted]")
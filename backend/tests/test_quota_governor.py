@@ -0,0 +1,154 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services import quota_governor
+from app.services.quota_governor import (
+    QUOTA_DECREASE_COOLDOWN, QUOTA_HEADROOM, QUOTA_LATENCY_TARGET, QUOTA_MIN_CONCURRENCY,
+    QuotaGovernor, TokenBucket, background_priority
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(quota_governor.time, "monotonic", clock)
+    return clock
+
+
+def test_bucket_starts_full_and_refills_at_rate(clock):
+    bucket = TokenBucket(rate=10)
+
+    assert bucket.wait_time(10) == 0.0
+    bucket.take(10)
+    assert bucket.wait_time(5) == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert bucket.wait_time(5) == pytest.approx(0.0)
+
+
+def test_bucket_never_exceeds_capacity(clock):
+    bucket = TokenBucket(rate=10, capacity=20)
+    clock.now += 60
+
+    assert bucket.wait_time(20) == 0.0
+    assert bucket.wait_time(25) == pytest.approx(0.5)
+
+
+def test_bucket_can_go_into_debt(clock):
+    bucket = TokenBucket(rate=10)
+    bucket.take(30)
+
+    assert bucket.wait_time(10) == pytest.approx(3.0)
+
+
+def test_drain_empties_but_keeps_debt(clock):
+    bucket = TokenBucket(rate=10)
+    bucket.drain()
+    assert bucket.wait_time(1) == pytest.approx(0.1)
+
+    bucket.take(5)
+    bucket.drain()
+    assert bucket.wait_time(0) == pytest.approx(0.5)
+
+
+def unlimited(max_concurrency: int) -> QuotaGovernor:
+    return QuotaGovernor(max_concurrency, user_rate=1e9, project_rate=1e9)
+
+
+def test_window_halves_on_throttling_and_recovers_additively(clock):
+    governor = unlimited(8)
+
+    async def call(latency: float = 0.1, throttled: bool = False):
+        await governor.acquire("user", "gmail.users.messages.get")
+        governor.release("user", latency, throttled=throttled)
+
+    asyncio.run(call(throttled=True))
+    assert governor.limit == 4
+
+    # A second 429 inside the cooldown doesn't compound the cut
+    asyncio.run(call(throttled=True))
+    assert governor.limit == 4
+
+    clock.now += QUOTA_DECREASE_COOLDOWN
+    asyncio.run(call(latency=QUOTA_LATENCY_TARGET + 1))
+    assert governor.limit == 2
+    assert governor.metrics()["throttled"] == 2 and governor.metrics()["slow"] == 1
+
+    for _ in range(3):
+        asyncio.run(call())
+    assert 2 < governor.limit < 4
+
+    for _ in range(100):
+        asyncio.run(call())
+    assert governor.limit == 8
+
+
+def test_throttling_never_closes_the_window(clock):
+    governor = unlimited(2)
+
+    async def throttled():
+        await governor.acquire("user", None)
+        governor.release("user", 0.1, throttled=True)
+
+    for _ in range(5):
+        clock.now += QUOTA_DECREASE_COOLDOWN
+        asyncio.run(throttled())
+    assert governor.limit == QUOTA_MIN_CONCURRENCY
+
+
+def test_interactive_calls_overtake_queued_background_work():
+    governor = unlimited(1)
+    order = []
+
+    async def call(name: str):
+        await governor.acquire("user", None)
+        order.append(name)
+        governor.release("user", 0.1)
+
+    async def main():
+        await governor.acquire("user", None)
+        with background_priority():
+            background = asyncio.create_task(call("background"))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(call("interactive"))
+        await asyncio.sleep(0)
+        assert governor.metrics()["waiting_background"] == 1
+        assert governor.metrics()["waiting_interactive"] == 1
+
+        governor.release("user", 0.1)
+        await asyncio.gather(background, interactive)
+
+    asyncio.run(main())
+    assert order == ["interactive", "background"]
+
+
+def test_one_users_quota_wait_does_not_hold_a_shared_slot():
+    # About 100 units per second per user: a second send must wait about a second for quota
+    governor = QuotaGovernor(1, user_rate=100 / QUOTA_HEADROOM, project_rate=1e9)
+
+    async def call(principal: str, method_id: str) -> float:
+        started = time.monotonic()
+        await governor.acquire(principal, method_id)
+        governor.release(principal, 0.1)
+        return time.monotonic() - started
+
+    async def main():
+        await call("sender", "gmail.users.messages.send")
+        second_send = asyncio.create_task(call("sender", "gmail.users.messages.send"))
+        await asyncio.sleep(0.05)
+        other_user = await call("reader", "gmail.users.messages.get")
+        return other_user, await second_send
+
+    other_user, second_send = asyncio.run(main())
+    assert other_user < 0.2
+    assert second_send >= 0.8
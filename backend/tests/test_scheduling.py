@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from app.services.scheduling import free_gaps, merge_intervals
+
+
+def at(hour: int, minute: int = 0) -> datetime:
+    return datetime(2026, 3, 2, hour, minute)
+
+
+def test_merge_intervals_coalesces_overlapping_and_touching():
+    busy = [(at(13), at(14)), (at(9), at(10)), (at(9, 30), at(11)), (at(11), at(12)), (at(9, 45), at(10))]
+
+    assert merge_intervals(busy) == [(at(9), at(12)), (at(13), at(14))]
+
+
+def test_merge_intervals_empty():
+    assert merge_intervals([]) == []
+
+
+def test_free_gaps_between_busy_intervals():
+    busy = merge_intervals([(at(10), at(11)), (at(13), at(14))])
+
+    assert free_gaps((at(9), at(17)), busy) == [(at(9), at(10)), (at(11), at(13)), (at(14), at(17))]
+
+
+def test_free_gaps_clips_busy_time_outside_the_window():
+    busy = merge_intervals([(at(7), at(9, 30)), (at(16), at(19))])
+
+    assert free_gaps((at(9), at(17)), busy) == [(at(9, 30), at(16))]
+
+
+def test_free_gaps_fully_busy_or_free():
+    assert free_gaps((at(9), at(17)), [(at(8), at(18))]) == []
+    assert free_gaps((at(9), at(17)), []) == [(at(9), at(17))]
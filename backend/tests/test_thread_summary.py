@@ -0,0 +1,27 @@
+from app.services.thread_summary import pack_sections
+
+
+def test_short_messages_are_packed_together():
+    sections = [(f"m{i}", "short reply " * 5) for i in range(40)]
+    chunks = pack_sections(sections, size=1000)
+
+    assert len(chunks) < 10
+    assert all(len(text) <= 1000 for _, text in chunks)
+    assert "--- m0 ---" in chunks[0][1] and "--- m39 ---" in chunks[-1][1]
+
+
+def test_long_messages_are_split_on_their_own():
+    sections = [("a", "hi"), ("b", "word " * 600), ("c", "bye")]
+    chunks = pack_sections(sections, size=1000)
+
+    assert chunks[0] == ("Messages", "--- a ---\nhi")
+    assert [label for label, _ in chunks[1:-1]] == ["b"] * (len(chunks) - 2)
+    assert chunks[-1] == ("Messages", "--- c ---\nbye")
+
+
+def test_packing_is_stable_when_a_reply_is_added():
+    sections = [(f"m{i}", "x" * 300) for i in range(10)]
+    before = pack_sections(sections, size=1000)
+    after = pack_sections(sections + [("m10", "new reply")], size=1000)
+
+    assert after[:len(before) - 1] == before[:-1]
@@ -301,7 +301,7 @@ export default function Home() {
 
       setShowDraft(false)
       setDraftEmail('')
-      setMessages(prev => [...prev, { role: 'assistant', content: `Success! I've sent the email to ${recipient}.` }])
+      setMessages(prev => [...prev, { role: 'assistant', content: `Done! Your email to ${recipient} is queued and will be sent in a few seconds.` }])
     } catch (err: any) {
       setError(err.response?.data?.detail || 'Failed to send email. Check your connection.')
     } finally {